@@ -9,32 +9,87 @@ other supporting functions. It is separated into a few main sections:
     This includes retrieving uploaded images associated with an event, and getting
     major images like the header images.
 
-    3. Admin routing for the Flask web-app, and all related functions
+    3. Background jobs, for admin operations that take too long to run
+    while the admin waits for a page (like importing users).
+
+    4. Admin routing for the Flask web-app, and all related functions
     (like editing/adding events and users and changing the candidates'
     weekend number).
 
-    4. Client routing for the Flask web-app, and all related functions (like
+    5. Client routing for the Flask web-app, and all related functions (like
     retrieving candidate information and displaying the Candidates' Weekend
     schedule).
 '''
 
+import json
+import logging
 import os
-from flask import Flask, render_template, redirect, url_for, request
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from tempfile import SpooledTemporaryFile
+from urllib.parse import quote
+from flask import (Flask, Request, render_template, redirect, url_for, request,
+                   jsonify, send_from_directory, g, abort)
 import firebase_admin
 from firebase_admin import credentials, firestore, auth, storage
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
 import pandas as pd
-from sortbytime import sort_events, convert_conventional
+from timeutil import display_time
 from users import *
 from events import *
+from caching import LRUCache
+from catalog import EventCatalog
+from settings import Settings
+from schedule import ScheduleIndex, DAYS
+from timeline import TimelineEngine
+from pagecache import PageCache, GUEST
+from userimport import import_users
+from eventimport import (read_sheet, read_event_records, plan_changes,
+                         describe_change, encode_changes, decode_changes,
+                         find_stale, commit_changes, plan_clone, DELETE)
+from jobs import JobQueue
+from imaging import get_image_entry, get_image_src, get_image_fallback, \
+    remove_metadata, add_variants
+from media import MediaIndex, get_blob_names, get_content_name
+from userdir import UserDirectory
+from offline import (BundleWriter, get_event_page, relink, encode_schedule,
+                     SCHEDULE_JSON, SCHEDULE_PAGE, WELCOME_PAGE,
+                     SERVICE_WORKER, BUNDLE_MANIFEST)
+from sessions import (SessionStore, SESSION_COOKIE, load_secret_key,
+                      make_session_backend)
+from passwords import hash_password, check_password, needs_rehash
+from repositories import (firestore_repositories, sqlite_repositories,
+                          LocalAuth)
+from localstorage import LocalBucket
+from instrumentation import Instrumentation, InstrumentedProxy, timed, bind
+
+class UploadRequest(Request):
+    '''
+    Request that keeps uploaded files in memory (up to UPLOAD_MEMORY_LIMIT
+    bytes each), so that they can be streamed to Firebase Storage without
+    being written to disk.
+    '''
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=UPLOAD_MEMORY_LIMIT, mode='wb+')
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+
+# Records the backend calls and rendering time of every request, and sends
+# them back in the Server-Timing header
+INSTRUMENTATION = Instrumentation(app)
+render_template = timed('render')(render_template)
+hash_password = timed('hash')(hash_password)
+check_password = timed('hash')(check_password)
 
 OLIN_LOGO = "oval.png"
 OLIN_HEADER = "olinheader.jpg"
 
 EVENTS_COLLECTION = 'events'
+SETTINGS_COLLECTION = 'settings'
 GENERAL_INFO_EVENT = "General Event Info"
 CW_NUMBER = 'cw_number'
 ALL_WEEKENDS = "All"
@@ -52,6 +107,14 @@ DELETE_EVENT = 'Delete Event'
 DUPLICATE_EVENT = 'Duplicate Event'
 COPY = '-copy'
 SUBMIT = 'Submit'
+PREVIEW_CHANGES = 'Preview Changes'
+COMMIT_CHANGES = 'Commit Changes'
+SHEET_TEXT = 'sheet'
+DELETE_MISSING = 'delete_missing'
+PLAN = 'plan'
+SOURCE_CW = 'source_cw'
+TARGET_CW = 'target_cw'
+OVERWRITE = 'overwrite'
 CHECKED_FILES = 'check'
 FRIDAY = 'Friday'
 SATURDAY = 'Saturday'
@@ -64,6 +127,7 @@ USERNAME = 'username'
 PASSWORD = 'password'
 SELECTED_USER = 'users'
 DELETE_USER = "Delete User"
+REVOKE_SESSIONS = "Revoke Sessions"
 EMAIL = 'email'
 GROUP_LETTER = 'group_letter'
 INTERVIEW_TIME = 'interview_time'
@@ -76,7 +140,133 @@ MODEL_CLASS_LOCATION = 'model_class_location'
 INTERVIEWERS = 'interviewers'
 VERIFY_PASSWORD = 'password2'
 
+# Media links are cached for the whole process, so that rendering a page does
+# not need any Firebase Storage round trips once the links are known
+MEDIA_LINK_TTL = int(os.environ.get('MEDIA_LINK_TTL', 6 * 60 * 60))
+MEDIA_LINK_CACHE_SIZE = 256
+MEDIA_LINKS = LRUCache(maxsize=MEDIA_LINK_CACHE_SIZE, ttl=MEDIA_LINK_TTL)
+
+# Names of the blobs that have already been made public by this process
+PUBLIC_BLOBS = set()
+
+# Uploaded images are streamed to Firebase Storage from memory, several
+# at a time
+UPLOAD_MEMORY_LIMIT = 16 * 1024 * 1024
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 4))
+UPLOADS = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+
+# In-memory copy of the general information (like the current Candidates'
+# Weekend number), kept in sync with the database
+SETTINGS = Settings()
+
+# In-memory copy of the events collection, kept in sync with the database.
+# The catalog skips the document that held the general information before
+# it moved to the settings collection.
+CATALOG = EventCatalog(GENERAL_INFO_EVENT)
+
+# Sorted schedules for each Candidates' Weekend, updated from the catalog
+SCHEDULES = ScheduleIndex()
+CATALOG.subscribe(SCHEDULES.on_change)
+
+# Candidates' personal timelines (their schedule with their interview and
+# locations added), and the conflicts in them
+TIMELINES = TimelineEngine(SCHEDULES)
+
+# Rendered schedule, event and welcome pages. Pages are also keyed by the
+# catalog version, and any change to the catalog (including the admin
+# write routes) clears them, once per change even when a bulk edit changes
+# many events. They expire with the media links they contain.
+PAGES = PageCache(ttl=MEDIA_LINK_TTL)
+CATALOG.subscribe_version(PAGES.clear)
+
+# Background jobs, and the folder where files are kept until their job runs
+JOBS_DATABASE = os.environ.get('JOBS_DATABASE', 'jobs.sqlite3')
+JOB_FILES_FOLDER = os.environ.get('JOB_FILES_FOLDER', 'job_files')
+# Seconds that a previewed bulk edit can still be committed for
+PLAN_TTL = float(os.environ.get('PLAN_TTL', 24 * 60 * 60))
+JOBS = JobQueue(JOBS_DATABASE)
+
+# Candidates' login sessions. The browser keeps a cookie signed with
+# SECRET_KEY (or with a key kept in SECRET_KEY_FILE, shared by the workers)
+# that points to a session holding the candidate's weekend and profile.
+# SESSION_BACKEND is where the workers share sessions: 'sqlite:///<path>',
+# 'redis://<host>' or '' (each worker keeps its own sessions).
+SECRET_KEY = os.environ.get('SECRET_KEY') or load_secret_key(
+    os.environ.get('SECRET_KEY_FILE', 'secret_key'))
+app.secret_key = SECRET_KEY
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND',
+                                 'sqlite:///sessions.sqlite3')
+SESSIONS = SessionStore(SECRET_KEY, make_session_backend(SESSION_BACKEND))
+
+# Images that the site itself shows, which are never deleted
+SITE_MEDIA = (OLIN_HEADER, OLIN_LOGO, 'campusmap.jpg', 'welcomepage.jpg')
+
+# Counts of the events that use each stored event image. Files that stop
+# being used are deleted after MEDIA_COLLECT_DELAY seconds, which gives other
+# workers time to see any new event that uses the same file.
+MEDIA = MediaIndex(protected=SITE_MEDIA)
+CATALOG.subscribe(MEDIA.on_change)
+MEDIA_COLLECT_DELAY = int(os.environ.get('MEDIA_COLLECT_DELAY', 60))
+
+# Where the app's data is kept: 'firestore' for Firebase, or 'local' for a
+# SQLite database and a media folder on this machine (for example for load
+# testing without network access)
+DATA_BACKEND = os.environ.get('DATA_BACKEND', 'firestore')
+LOCAL_DATABASE = os.environ.get('LOCAL_DATABASE', 'local.sqlite3')
+LOCAL_MEDIA_FOLDER = os.environ.get('LOCAL_MEDIA_FOLDER', 'local_media')
+LOCAL_MEDIA_URL = '/local-media/'
+
+# Offline bundles of each weekend's schedule (see the offline module), one
+# per audience, served from BUNDLE_FOLDER. Their files may be cached for
+# BUNDLE_MAX_AGE seconds; the service worker is always checked for updates.
+BUNDLE_FOLDER = os.environ.get('BUNDLE_FOLDER', 'offline_bundles')
+BUNDLE_MAX_AGE = int(os.environ.get('BUNDLE_MAX_AGE', 24 * 60 * 60))
+BUNDLE_URL = '/offline/'
+BUNDLE_AUDIENCES = {'candidates': Access.CANDIDATES,
+                    'parents': Access.PARENTS}
+BUNDLE_MEDIA = ('campusmap.jpg', 'welcomepage.jpg')
+
 # ------- GENERAL DATABASE FUNCTIONS ---------
+def init_backend():
+    '''
+    Connects to the database, file storage and authentication backends
+    chosen by DATA_BACKEND, and sets the EVENTS_DB, USERS_DB, SETTINGS_DB,
+    BUCKET and AUTH globals.
+    '''
+    global EVENTS_DB, USERS_DB, SETTINGS_DB, BUCKET, AUTH
+
+    if DATA_BACKEND == 'local':
+        repositories = sqlite_repositories(LOCAL_DATABASE, EVENTS_COLLECTION,
+                                           USERS_COLLECTION,
+                                           SETTINGS_COLLECTION,
+                                           GENERAL_INFO_EVENT)
+        BUCKET = LocalBucket(LOCAL_MEDIA_FOLDER, LOCAL_MEDIA_URL)
+        AUTH = LocalAuth()
+    else:
+        # Configures database and gets access to the database
+        project_id = "klgsglksgjs"
+        cred = credentials.Certificate('serviceAccountKey.json')
+        firebase_admin.initialize_app(cred, {
+            'projectId': project_id,
+            'storageBucket': project_id + ".appspot.com"})
+
+        # Initialize the client for interfacing with the database
+        repositories = firestore_repositories(firestore.client(),
+                                              EVENTS_COLLECTION,
+                                              USERS_COLLECTION,
+                                              SETTINGS_COLLECTION,
+                                              GENERAL_INFO_EVENT)
+
+        # Initializes Firebase Storage bucket for file uploads/retrieval
+        BUCKET = storage.bucket()
+        AUTH = auth
+
+    # Records every call to the backends in the current request's profile
+    EVENTS_DB, USERS_DB, SETTINGS_DB = [
+        InstrumentedProxy(repository, 'database') for repository in repositories]
+    BUCKET = InstrumentedProxy(BUCKET, 'storage')
+    AUTH = InstrumentedProxy(AUTH, 'auth')
+
 def get_users():
     '''
     Gets list of users from the database, and
@@ -85,22 +275,39 @@ def get_users():
 
     Returns:
     user_names - list of names of users (user ids/document ids)
-    user_infos - list of dictionaries, where each dictionary
-                 contains more information about the corresponding user
+    user_infos - list of User objects, one for each user
     '''
-    user_names = []
-    user_infos = []
-
-    # Get reference to all users
-    users_ref = DB.collection(USERS_COLLECTION).get()
+    # Get all users
+    users = USERS_DB.get_all()
 
     # Get each user's name/id and information
-    for user in users_ref:
-        user_names.append(user.id)
-        user_infos.append(user.to_dict())
+    user_names = list(users)
+    user_infos = [User.from_dict(user_name, users[user_name])
+                  for user_name in user_names]
 
     return user_names, user_infos
 
+def load_user(user_id):
+    '''
+    Reads a user's information from the database.
+
+    Returns: the User, or None if there is no such user
+    '''
+    user_dict = USERS_DB.get(user_id)
+    return User.from_dict(user_id, user_dict) if user_dict is not None else None
+
+def find_user_id(email):
+    '''
+    Looks up the id of the user with the given email address in the
+    database.
+
+    Returns: the user id, or None if there is no such user
+    '''
+    return USERS_DB.find_by_email(email)
+
+# Users' information, cached by user id and indexed by email address
+USERS = UserDirectory(load_user, find_user_id)
+
 def valid_admin_login(username, password):
     '''
     Checks for valid admin login.
@@ -113,134 +320,159 @@ def valid_admin_login(username, password):
 
 def get_curr_cw():
     '''
-    Gets the current Candidates' Weekend number from the database.
+    Gets the current Candidates' Weekend number from the in-memory settings.
 
     Returns: the current weekend number as a string
     '''
-    return DB.collection(EVENTS_COLLECTION).document(
-        GENERAL_INFO_EVENT).get().to_dict()[CW_NUMBER]
+    return SETTINGS.cw_number()
 
 def get_all_events():
     '''
-    Retrieves all events from the database for all Candidates' Weekends
+    Retrieves all events for all Candidates' Weekends from the event catalog.
+    The catalog does not include the document that contains general
+    information, like the candidates' weekend number.
 
     Returns:
     - event_names - a list of all the events' names, represented as strings
-    - event_infos - a corresponding list of event information, represented
-    as dictionaries
+    - event_infos - a corresponding list of Event objects
     '''
+    return CATALOG.all()
 
-    # Access the events collection
-    events_ref = DB.collection(EVENTS_COLLECTION).get()
+def get_schedule_cw(user_id=None):
+    '''
+    Gets the Candidates' Weekend number whose schedule should be shown.
+    If there is a user id supplied, this is the user's Candidates' Weekend;
+    otherwise it is the current Candidates' Weekend.
 
-    # Gets names of all events and dictionaries of information for all events
-    event_names = []
-    event_infos = []
-    for event in events_ref:
-        # Makes sure to avoid the event document that
-        # contains general information, like the candidates' weekend number
-        if event.id != GENERAL_INFO_EVENT:
-            event_names.append(event.id)
-            event_infos.append(event.to_dict())
+    Returns: the weekend number as a string
+    '''
+    if user_id is not None:
+        return USERS.get(user_id).cw_number
+    return get_curr_cw()
 
-    return event_names, event_infos
+def get_audience(user_id=None):
+    '''
+    Gets the audience whose events a user sees: guests (and visitors who
+    have not logged in) see the events for parents, and candidates see the
+    events for candidates. Both see the events for everyone.
+
+    Returns: Access.PARENTS or Access.CANDIDATES
+    '''
+    if user_id is None or user_id == GUEST:
+        return Access.PARENTS
+    return Access.CANDIDATES
 
-def get_events(user_id=None):
+def get_events(user_id=None, day=None):
     '''
-    Retrieves the events from the database to be displayed in the schedule.
-    If there is a user id supplied, then this function retrieves the events
-    for the user's Candidates' Weekend. Otherwise, it retrieves the events
-    for the current Candidates' Weekend.
+    Retrieves the events to be displayed in the schedule, sorted by time,
+    from the prebuilt schedules. If there is a user id supplied, then this
+    function retrieves the events for the user's Candidates' Weekend that
+    the user's audience sees. Otherwise, it retrieves the guests' events for
+    the current Candidates' Weekend. If a day is supplied, only the events
+    on that day are retrieved.
 
     Returns:
     - event_names: a list of the event names
-    - event_infos: a parallel list of event information dictionaries
+    - event_infos: a parallel list of Event objects
     '''
+    # Gets the events in that Candidates' Weekend, and the events
+    # present in all Candidates' Weekends
+    cw_number = get_schedule_cw(user_id)
+    audience = get_audience(user_id)
+    days = DAYS if day is None else (day,)
+    names = [entry.full_name for schedule_day in days
+             for entry in SCHEDULES.day(cw_number, schedule_day, audience)]
+    return names, [CATALOG.get(name) for name in names]
 
-    # Gets reference to the collection of events
-    events_ref = DB.collection(EVENTS_COLLECTION).get()
+# ------- SESSION FUNCTIONS -------
+def get_session():
+    '''
+    Gets the session of the user making the request from their session
+    cookie, once per request.
 
-    # Gets the current Candidates' Weekend Number
-    curr_cw_number = get_curr_cw()
+    Returns: the Session, or None if the request has no valid session
+    '''
+    if 'cw_session' not in g:
+        g.cw_session = SESSIONS.from_cookie(request.cookies.get(SESSION_COOKIE))
+    return g.cw_session
 
-    # If a user id is supplied, retrieves the user's
-    # Candidates' Weekend number, or sets the user's Candidats'
-    # Weekend number to None
-    if user_id is not None:
-        user_cw_number = DB.collection(USERS_COLLECTION).document(
-            user_id).get().to_dict()[CW_NUMBER]
-    else:
-        user_cw_number = None
-
-    # Gets all events and adds each event's document ID to one list
-    # and the event info dictionary to one list
-    event_names = []
-    event_infos = []
-
-    for event in events_ref:
-        # Makes sure the event is not the document intended to store the
-        # general information, like the current Candidates' Weekend number
-        if event.id != GENERAL_INFO_EVENT:
-            # Gets the event's Candidates' Weekend number
-            event_cw_number = event.to_dict()[CW_NUMBER]
-
-            # If there is a user id supplied, then adds all events that
-            # are in that user's Candidates' Weekend (or present in all
-            # Candidates' Weekends)
-            if user_cw_number is None:
-                if event_cw_number in (curr_cw_number, ALL_WEEKENDS):
-                    event_names.append(event.id)
-                    event_infos.append(event.to_dict())
-            # Otherwise, only gets events in the
-            # current Candidates Weekend
-            else:
-                if event_cw_number in (user_cw_number, ALL_WEEKENDS):
-                    event_names.append(event.id)
-                    event_infos.append(event.to_dict())
+def get_user_session(user_id):
+    '''
+    Gets the request's session if it belongs to the given user.
 
-    return event_names, event_infos
+    Returns: the Session, or None
+    '''
+    session = get_session()
+    if session is not None and session.user_id == user_id:
+        return session
+    return None
 
-def separate_and_sort_events(event_names, event_infos):
+def login_user(user_id, user):
     '''
-    Separates events based on day and sorts events based on time.
+    Starts a session for a user who just logged in, and sends them to their
+    schedule with the session cookie.
     '''
-    friday_events = []
-    saturday_events = []
-
-    for i in range(0, len(event_names)):
-        # Adds display name to event info dictionaries, to make rendering easier
-        event_infos[i][NAME] = get_display_name(event_names[i])
-
-        # Separates events into separate days
-        if event_infos[i][DAY] == FRIDAY:
-            friday_events.append(event_infos[i])
-        elif event_infos[i][DAY] == SATURDAY:
-            saturday_events.append(event_infos[i])
+    session = SESSIONS.create(user_id, user)
+    response = redirect(url_for('client_schedule', user_id=user_id))
+    response.set_cookie(SESSION_COOKIE, SESSIONS.cookie_value(session),
+                        max_age=SESSIONS.ttl, httponly=True, samesite='Lax',
+                        secure=request.is_secure)
+    return response
 
-    # Sorts events
-    friday_events = sort_events(friday_events)
-    saturday_events = sort_events(saturday_events)
+def login_required(view):
+    '''
+    Decorator for the pages of a user (routes with a user_id), which sends
+    visitors without a session for that user to the login page. Guests
+    (without a user id, or with the GUEST user id) are let through, and see
+    the guests' version of the page.
+    '''
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = kwargs.get('user_id')
+        if user_id not in (None, GUEST) and get_user_session(user_id) is None:
+            return redirect(url_for('client_login'))
+        return view(*args, **kwargs)
 
-    return friday_events, saturday_events
+    return wrapper
 
 # ------- IMAGE RETRIEVAL FUNCTIONS -------
+@timed('media')
 def get_media_link(img_filename):
     '''
     Gets the link for an image stored in Firebase Storage
-    so that it can be displayed.
+    so that it can be displayed. Links are cached in MEDIA_LINKS, so Firebase
+    Storage is only contacted the first time a link is needed (and again
+    once the cached link expires).
 
     Params: img_filename - the name of the file as a string,
     file extension included.
     Returns: image_url - the URL of the image so that it can be displayed
     '''
+    return MEDIA_LINKS.get(img_filename, resolve_media_link)
+
+def resolve_media_link(img_filename):
+    '''
+    Retrieves the media link for an image from Firebase Storage, making the
+    image public the first time it is used.
+    '''
     # Gets blob from Firebase Storage so that image can be accessed
     image_blob = BUCKET.get_blob(img_filename)
 
-    # Retrieves the media link for the image so that it can be displayed
-    image_blob.make_public()
+    # Makes the image public so that it can be displayed
+    if img_filename not in PUBLIC_BLOBS:
+        image_blob.make_public()
+        PUBLIC_BLOBS.add(img_filename)
 
     return image_blob.media_link
 
+def invalidate_media_link(img_filename):
+    '''
+    Removes the cached link for an image, for example after a new file has
+    been uploaded with the same name.
+    '''
+    MEDIA_LINKS.invalidate(img_filename)
+    PUBLIC_BLOBS.discard(img_filename)
+
 def get_logo():
     '''
     Gets the link for the Olin logo to be displayed in the tab header.
@@ -261,56 +493,353 @@ def get_header():
 def get_uploaded_images(images):
 
     '''
-    Retrieves the uploaded images for a specific event.
+    Uploads the images for a specific event to Firebase Storage, several at
+    a time, and retrieves their img_files entries.
 
     Inputs:
-    images - an array of files downloaded from
-    the database (references to the uploaded files)
+    images - an array of files uploaded with the request
+    (references to the uploaded files)
 
     Returns:
     uploaded_images - either an empty list if there
     are no files associated with the event, or the
-    list of the URLs for files associated with each event
+    list of the img_files entries (with the link and the name in Firebase
+    Storage) for files associated with each event
     '''
-    uploaded_images = []
-
-    # Checks if there were any uploaded images
-    for image in images:
+    # Uploads every image at the same time (up to UPLOAD_WORKERS at once),
+    # keeping the entries in the same order as the images
+    entries = UPLOADS.map(bind(get_image), images)
 
-        # Adds link to file to the list of uploaded images
-        uploaded_images.append(get_image(image))
-
-    return uploaded_images
+    # Leaves out the files that were not valid images
+    return [entry for entry in entries if entry is not None]
 
 def get_image(image):
     '''
-    Retrieves the link for an image associated with the event,
-        if there is an image.
+    Uploads an image associated with the event to Firebase Storage,
+        if there is an image, streaming it from the request.
 
-    Returns "None" if there is no image associated with the event,
-        or returns the image filename.
+    Returns None if there is no image associated with the event,
+        or returns the img_files entry for the uploaded image.
     '''
 
     # Check if there is an image associated with the event
     if image:
         # Checks to make sure the image is a valid image
         if image.filename != "" and allowed_file(image.filename):
-            # Saves the image to the uploads folder
-            image_filepath = os.path.join(app.config['UPLOAD_FOLDER'],
-                                          image.filename)
-            image.save(image_filepath)
+            # Removes the image's EXIF data (like the location a photo was
+            # taken at), since the stored image is public
+            stream = remove_metadata(image.stream)
+
+            # Names the image after its contents, so that each file is only
+            # stored once
+            img_filename = get_content_name(stream, image.filename)
+
+            # Reuses the entry (and resized variants) of another event
+            # that has the same image
+            entry = MEDIA.find_entry(img_filename)
+            if entry is not None:
+                return entry
+
+            # Reuses the stored file if no event uses it at the moment
+            blob = BUCKET.get_blob(img_filename)
+            if blob is None:
+                # Streams the image to Firebase Storage
+                blob = BUCKET.blob(img_filename)
+                blob.upload_from_file(stream, rewind=True,
+                                      content_type=image.mimetype)
+
+            if img_filename not in PUBLIC_BLOBS:
+                blob.make_public()
+                PUBLIC_BLOBS.add(img_filename)
+
+            # The blob (from the upload response, if it was just uploaded)
+            # includes the media link
+            MEDIA_LINKS.put(img_filename, blob.media_link)
+
+            return get_image_entry(img_filename, blob.media_link,
+                                   secure_filename(image.filename))
 
-            # Saves image to Firebase Storage
-            img_filename = secure_filename(image.filename)
-            blob = BUCKET.blob(img_filename)
-            blob.upload_from_filename(image_filepath)
+    return None
 
-            # Deletes image from local directory after it was uploaded
-            os.remove(image_filepath)
+# ------ BACKGROUND JOBS --------
+def save_job_file(file):
+    '''
+    Saves an uploaded file so that a background job can use it after the
+    request has finished.
 
-            return get_media_link(img_filename)
+    Returns: the path of the saved file
+    '''
+    os.makedirs(JOB_FILES_FOLDER, exist_ok=True)
+    path = os.path.join(JOB_FILES_FOLDER, uuid.uuid4().hex + "-" +
+                        secure_filename(file.filename))
+    file.save(path)
+    return path
 
-    return None
+@JOBS.task('import_users')
+def import_users_job(job, path):
+    '''
+    Imports the users in a saved spreadsheet.
+
+    Returns: the import report
+    '''
+    try:
+        with job.step('load spreadsheet'):
+            file_df = pd.read_excel(path)
+
+        report = import_users(USERS_DB, file_df, job, AUTH)
+    finally:
+        # Deletes the spreadsheet once it has been imported (or has failed)
+        os.remove(path)
+
+    # Makes sure the imported users are read again from the database, and
+    # updates the profiles in their sessions
+    for entry in report:
+        if entry['success']:
+            USERS.invalidate(entry['uid'])
+            SESSIONS.refresh_user(entry['uid'], partial(load_user, entry['uid']))
+
+    return report
+
+PLAN_SUFFIX = "-event-changes.json"
+
+def get_plan_path(plan_id):
+    '''
+    Returns the path of the file that holds a bulk edit's changes until the
+    admin commits them, or None if the id is not a valid plan id.
+    '''
+    if not plan_id or any(c not in '0123456789abcdef' for c in plan_id):
+        return None
+    return os.path.join(JOB_FILES_FOLDER, plan_id + PLAN_SUFFIX)
+
+def remove_old_plans():
+    '''
+    Deletes the saved changes of bulk edits that were previewed more than
+    PLAN_TTL seconds ago and never committed.
+    '''
+    oldest = time.time() - PLAN_TTL
+    for filename in os.listdir(JOB_FILES_FOLDER):
+        path = os.path.join(JOB_FILES_FOLDER, filename)
+        try:
+            if filename.endswith(PLAN_SUFFIX) and \
+               os.path.getmtime(path) < oldest:
+                os.remove(path)
+        except OSError:  # Committed (and removed) meanwhile
+            continue
+
+def save_plan(changes):
+    '''
+    Saves the changes of a bulk edit, so that they can be committed by a
+    background job after the admin has checked them. Removes the changes of
+    previews that were abandoned.
+
+    Returns: the id of the saved changes
+    '''
+    os.makedirs(JOB_FILES_FOLDER, exist_ok=True)
+    remove_old_plans()
+    plan_id = uuid.uuid4().hex
+    with open(get_plan_path(plan_id), 'w') as plan_file:
+        json.dump(encode_changes(changes), plan_file)
+    return plan_id
+
+@JOBS.task('bulk_events')
+def bulk_events_job(job, path):
+    '''
+    Commits the changes of a bulk edit of the events, if none of the events
+    changed since the admin previewed them.
+
+    Returns: the number of events added, updated and deleted, and the number
+    of documents and time of each batch
+    '''
+    with job.step('load changes'):
+        with open(path) as plan_file:
+            changes = decode_changes(json.load(plan_file))
+        os.remove(path)
+
+    stale = find_stale(changes, {change.name: CATALOG.get(change.name)
+                                 for change in changes})
+    if stale:
+        raise ValueError('Events changed since the preview, please preview '
+                         'the changes again: ' + ', '.join(stale))
+
+    committed = []
+    try:
+        with job.step('write batches'):
+            report = commit_changes(EVENTS_DB, changes, job, committed)
+    finally:
+        with job.step('update caches'):
+            apply_changes(committed)
+
+    # Deletes the images of deleted events if no other event uses them
+    collect_unused_media()
+    return report
+
+@JOBS.task('clone_weekend')
+def clone_weekend_job(job, source_cw, target_cw, overwrite=False):
+    '''
+    Copies every event of one Candidates' Weekend into another. Events that
+    were already copied are skipped, so running the job again finishes a
+    clone that failed part of the way.
+
+    Returns: the number of events copied, the number of documents and time
+    of each batch, and the target weekend's events that were kept because
+    they differ from the source's
+    '''
+    with job.step('find events to copy'):
+        names, events = CATALOG.all()
+        changes, skipped = plan_clone(source_cw, target_cw,
+                                      dict(zip(names, events)), overwrite)
+
+    committed = []
+    try:
+        with job.step('write batches'):
+            report = commit_changes(EVENTS_DB, changes, job, committed)
+    finally:
+        with job.step('update caches'):
+            apply_changes(committed)
+
+    report['skipped'] = skipped
+    return report
+
+def apply_changes(changes):
+    '''
+    Applies the committed changes of a bulk edit to the catalog as one
+    change, so that the caches are cleared once.
+    '''
+    CATALOG.apply({change.name: change.new for change in changes
+                   if change.kind != DELETE},
+                  removed=[change.name for change in changes
+                           if change.kind == DELETE])
+
+@JOBS.task('change_cw')
+def change_cw_job(job, cw_number):
+    '''
+    Changes the current Candidates' Weekend number, then prebuilds the new
+    weekend's offline schedules in a job of their own.
+
+    Returns: the new settings, and the id of the job exporting the offline
+    schedules
+    '''
+    # Loads the new weekend into this process's caches first, so that the
+    # first candidates after the switch do not wait for its pages
+    with job.step('warm caches'):
+        warm_weekend(cw_number)
+
+    # Switches weekends and increases the settings' version at once. The
+    # other processes see the change and warm their caches for the new
+    # weekend in on_settings_change.
+    with job.step('update general information'):
+        settings = SETTINGS.rollover(cw_number)
+
+    # Prebuilds the new weekend's offline schedules. This is a job of its own,
+    # so that an export that fails is reported on its page without undoing
+    # the switch.
+    with job.step('queue offline schedules'):
+        export_job_id = JOBS.enqueue('export_bundles', cw_number=cw_number)
+
+    return {'settings': settings, 'export_job': export_job_id}
+
+@JOBS.task('export_bundles')
+def export_bundles_job(job, cw_number):
+    '''
+    Writes (or updates) the offline bundles of a Candidates' Weekend.
+
+    Returns: the report of each audience's bundle
+    '''
+    return export_bundles(job, cw_number)
+
+def export_bundles(job, cw_number):
+    '''
+    Writes the offline bundle of a Candidates' Weekend for every audience,
+    as steps of a job.
+
+    Returns: the report of each audience's bundle
+    '''
+    reports = {}
+    for audience_name in BUNDLE_AUDIENCES:
+        with job.step('export offline schedule for ' + audience_name):
+            reports[audience_name] = export_bundle(cw_number, audience_name)
+    return reports
+
+@JOBS.task('image_variants')
+def image_variants_job(job, event_name):
+    '''
+    Creates the resized variants of an event's images (the ones that do not
+    have variants yet) and records them in the event's img_files.
+    '''
+    event = CATALOG.get(event_name)
+    if event is None:
+        return None
+
+    made = {}
+    for i, img_file in enumerate(event.img_files):
+        if isinstance(img_file, dict) and 'variants' not in img_file:
+            with job.step('variants for ' + img_file['name']):
+                made[img_file['name']] = add_variants(BUCKET, img_file)
+        job.progress((i + 1) / len(event.img_files))
+    if not made:
+        return len(event.img_files)
+
+    def add_made_variants(document):
+        # Adds the variants to the images the event still has, in case it
+        # was edited (or deleted) while they were being made
+        if document is None:
+            raise LookupError(event_name)
+        img_files = [dict(made[img_file['name']], **img_file)
+                     if isinstance(img_file, dict) and
+                     img_file['name'] in made and 'variants' not in img_file
+                     else img_file
+                     for img_file in document.get(IMG_FILES, [])]
+        return dict(document, **{IMG_FILES: img_files})
+
+    with job.step('update event'):
+        try:
+            document = EVENTS_DB.update(event_name, add_made_variants)
+        except LookupError:
+            return None
+        CATALOG.put_document(event_name, document)
+
+    # Deletes the variants of the images that were removed meanwhile
+    kept = {img_file['name'] for img_file in document[IMG_FILES]
+            if isinstance(img_file, dict)}
+    unused = [name for img_name, img_file in made.items()
+              if img_name not in kept
+              for name in get_blob_names(img_file)[1:]]
+    if unused:
+        JOBS.enqueue('collect_media', delay=MEDIA_COLLECT_DELAY, names=unused)
+
+    return len(document[IMG_FILES])
+
+@JOBS.task('collect_media')
+def collect_media_job(job, names):
+    '''
+    Deletes stored event images that are no longer used by any event. The
+    job is queued to run MEDIA_COLLECT_DELAY seconds later.
+
+    Returns: the names of the deleted files
+    '''
+    with job.step('delete unused files'):
+        deleted = MEDIA.collect(BUCKET, names)
+    for name in deleted:
+        invalidate_media_link(name)
+
+    return deleted
+
+def collect_unused_media():
+    '''
+    Queues the deletion of the stored event images that stopped being used,
+    after a delay that gives other workers time to see any new event that
+    uses the same files.
+    '''
+    names = MEDIA.take_unused()
+    if names:
+        JOBS.enqueue('collect_media', delay=MEDIA_COLLECT_DELAY, names=names)
+
+def needs_variants(event):
+    '''
+    Checks whether any of an event's images are missing their variants.
+    '''
+    return any(isinstance(img_file, dict) and 'variants' not in img_file
+               for img_file in event.img_files)
 
 # ------ ADMIN ROUTING --------
 @app.route('/login/admin', methods=['POST', 'GET'])
@@ -355,8 +884,7 @@ def change_gen_info():
     if request.method == 'POST':
 
         # Updates current candidates' weekend number in the database
-        DB.collection(EVENTS_COLLECTION).document(GENERAL_INFO_EVENT).set({
-            "cw_number": request.form[CW_NUMBER]})
+        JOBS.enqueue('change_cw', cw_number=request.form[CW_NUMBER])
 
         # Redirects user to the admin manager page
         return redirect(url_for('admin_manager'))
@@ -364,6 +892,35 @@ def change_gen_info():
     # Show page to allow admin to change general information
     return show_gen_info()
 
+@app.route('/admin/cache-stats')
+def cache_stats():
+    '''
+    Shows the hit and miss counters of the in-process caches.
+    '''
+    return jsonify({'media_links': MEDIA_LINKS.stats(),
+                    'pages': PAGES.stats(),
+                    'users': USERS.stats()})
+
+@app.route('/admin/slow-routes')
+def slow_routes():
+    '''
+    Shows the slowest routes, with the backend calls they make, and the
+    pages that make the same call many times (N+1 patterns).
+    '''
+    return jsonify(INSTRUMENTATION.report(int(request.args.get('limit', 20))))
+
+@app.route('/admin/conflicts')
+def schedule_conflicts():
+    '''
+    Shows the candidates whose individual interview overlaps an event they
+    are expected to attend, for one Candidates' Weekend (the current one,
+    unless the cw argument is given, or every weekend if it is 'All').
+    '''
+    cw_number = request.args.get('cw', get_curr_cw())
+    if cw_number == ALL_WEEKENDS:
+        cw_number = None
+    return jsonify(TIMELINES.report(*get_users(), cw_number=cw_number))
+
 @app.route('/admin/add-event', methods=['POST', 'GET'])
 def create_event():
     '''
@@ -381,7 +938,12 @@ def create_event():
                       get_uploaded_images(request.files.getlist(FILES)),
                       get_links_dict(request.form[LINKS]))
 
-        DB.collection(EVENTS_COLLECTION).document(event.name).set(event.to_dict())
+        EVENTS_DB.set(event.name, event.to_dict())
+        CATALOG.put(event.name, event)
+
+        # Creates smaller versions of the event's images in the background
+        if needs_variants(event):
+            JOBS.enqueue('image_variants', event_name=event.name)
 
         # Redirect to admin manager page
         return redirect(url_for('admin_manager'))
@@ -414,9 +976,12 @@ def edit_event(event_name=None):
         if request.form['button'] == DELETE_EVENT:
 
             # Deletes document
-            DB.collection(EVENTS_COLLECTION).document(event_name + "-" +
-                                                      request.form[
-                                                          CW_NUMBER]).delete()
+            full_name = event_name + "-" + request.form[CW_NUMBER]
+            EVENTS_DB.delete(full_name)
+            CATALOG.remove(full_name)
+
+            # Deletes the event's images if no other event uses them
+            collect_unused_media()
 
             # Redirects user to the admin manager page
             return redirect(url_for('admin_manager'))
@@ -427,12 +992,22 @@ def edit_event(event_name=None):
 
             # Gets the event's information
             full_name = event_name + "-" + request.form[CW_NUMBER]
-            event_info = DB.collection(EVENTS_COLLECTION).document(
-                full_name).get().to_dict()
-
-            # Creates new document with the same information, with the name
-            # as the event's name + "copy"
-            DB.collection(EVENTS_COLLECTION).document(full_name).set(event_info)
+            event = CATALOG.get(full_name)
+
+            # The event may have been deleted meanwhile
+            if event is None:
+                return show_admin_manager(
+                    error="The event {} was not found".format(full_name))
+
+            # Creates new document with the same information (and images),
+            # with the name as the event's name + "copy", adding another
+            # "copy" if the event was already duplicated
+            copy_name = event_name + COPY
+            while CATALOG.get(copy_name + "-" + event.cw_number) is not None:
+                copy_name += COPY
+            copy = event.replace(name=copy_name + "-" + event.cw_number)
+            EVENTS_DB.set(copy.name, copy.to_dict())
+            CATALOG.put(copy.name, copy)
 
             # Redirects user to the admin manager page
             return redirect(url_for('admin_manager'))
@@ -444,11 +1019,15 @@ def edit_event(event_name=None):
             # number included
             name = request.form[NAME] + "-" + request.form[CW_NUMBER]
 
-            # Gets links to all files for this event, including the
+            # Gets all files for this event, including the
             # selected files from the already uploaded files
             # and newly uploaded files
-            img_files = get_uploaded_images(request.files.getlist(
-                FILES)) + request.files.getlist(CHECKED_FILES)
+            old_event = CATALOG.get(event_name + "-" + request.form[CW_NUMBER])
+            old_files = old_event.img_files if old_event else ()
+            checked_files = request.form.getlist(CHECKED_FILES)
+            img_files = get_uploaded_images(request.files.getlist(FILES)) + [
+                img_file for img_file in old_files
+                if get_image_src(img_file) in checked_files]
 
             # Gets links from the form and composes a dictionary with the links
             links = get_links_dict(request.form[LINKS])
@@ -462,12 +1041,100 @@ def edit_event(event_name=None):
                                   request.form[CW_NUMBER],
                                   request.form[ACCESS],
                                   img_files, links)
-            DB.collection(EVENTS_COLLECTION).document(name).set(updated_event.to_dict())
+            EVENTS_DB.set(name, updated_event.to_dict())
+            CATALOG.put(name, updated_event)
+
+            # Creates smaller versions of any new images in the background
+            if needs_variants(updated_event):
+                JOBS.enqueue('image_variants', event_name=name)
+
+            # Deletes the images that were removed, if no other event uses them
+            collect_unused_media()
 
             return redirect(url_for('admin_manager'))
 
     return show_edit_event(event_name)
 
+@app.route('/admin/bulk-events', methods=['POST', 'GET'])
+def bulk_events():
+    '''
+    Allows admin to add, update and delete many events at once by uploading
+    a spreadsheet (or pasting CSV text), after previewing the changes.
+    '''
+    if request.method == 'POST':
+
+        # Commits previewed changes in the background
+        if request.form['button'] == COMMIT_CHANGES:
+            path = get_plan_path(request.form[PLAN])
+            if path is None or not os.path.exists(path):
+                return show_bulk_events(errors=[
+                    {'row': '', 'name': '', 'cw_number': '',
+                     'error': 'Please preview the changes again'}])
+            job_id = JOBS.enqueue('bulk_events', path=path)
+
+            # Shows the progress of the commit
+            return redirect(url_for('admin_job', job_id=job_id))
+
+        # Compares the spreadsheet's events with the current events
+        file = request.files.get('file')
+        try:
+            if file and file.filename:
+                file_df = read_sheet(file, file.filename)
+            else:
+                file_df = read_sheet(request.form[SHEET_TEXT])
+        except Exception as error:  # The spreadsheet could not be read
+            return show_bulk_events(errors=[
+                {'row': '', 'name': '', 'cw_number': '', 'error': str(error)}])
+
+        names, events = CATALOG.all()
+        changes, errors = plan_changes(read_event_records(file_df),
+                                       dict(zip(names, events)),
+                                       DELETE_MISSING in request.form)
+        plan_id = save_plan(changes) if changes else None
+        return show_bulk_events(changes, errors, plan_id)
+
+    return show_bulk_events()
+
+@app.route('/admin/clone-weekend', methods=['POST', 'GET'])
+def clone_weekend():
+    '''
+    Allows admin to copy every event of one Candidates' Weekend into
+    another.
+    '''
+    if request.method == 'POST':
+        source_cw = request.form[SOURCE_CW].strip()
+        target_cw = request.form[TARGET_CW].strip()
+        if not source_cw or not target_cw or source_cw == target_cw or \
+           ALL_WEEKENDS in (source_cw, target_cw):
+            return show_clone_weekend(
+                error="Please choose two different Candidates' Weekends")
+
+        # Copies the events in the background
+        job_id = JOBS.enqueue('clone_weekend', source_cw=source_cw,
+                              target_cw=target_cw,
+                              overwrite=OVERWRITE in request.form)
+
+        # Shows the progress of the copy
+        return redirect(url_for('admin_job', job_id=job_id))
+
+    return show_clone_weekend()
+
+@app.route('/admin/offline-bundles', methods=['POST', 'GET'])
+def offline_bundles():
+    '''
+    Allows admin to export the offline schedules of a Candidates' Weekend,
+    and lists the ones that have been exported.
+    '''
+    if request.method == 'POST':
+        # Exports the bundles in the background
+        job_id = JOBS.enqueue('export_bundles',
+                              cw_number=request.form[CW_NUMBER].strip())
+
+        # Shows the progress of the export
+        return redirect(url_for('admin_job', job_id=job_id))
+
+    return show_offline_bundles()
+
 @app.route('/admin/add-users', methods=['POST', 'GET'])
 def add_users():
     '''
@@ -475,44 +1142,37 @@ def add_users():
     '''
     # Add users from uploaded file
     if request.method == 'POST':
-        # Retrieve uploaded Excel file
-        file = request.files['file']
-        file_df = pd.read_excel(file)
-
-        users_ref = DB.collection(USERS_COLLECTION)
-        for index, row in file_df.iterrows():
-            # Create user in Firebase Authentication
-            user = auth.create_user(uid=row['User ID'],
-                                    email=row['Email Address'],
-                                    display_name=row['Name'])
-
-            # Add user to the database + user information
-            users_ref.document(user.uid).set({"email": user.email,
-                                              "dinner_group": row[
-                                                  'Dinner Group'],
-                                              "group_letter": row[
-                                                  'Group Letter'],
-                                              "interview_location": row[
-                                                  'Interview Location'],
-                                              "interview_time": row[
-                                                  'Individual Interview Time'],
-                                              "group_interview_location": row[
-                                                  'Group Interview Location'],
-                                              "password": "",
-                                              "cw_number": row[
-                                                  "Candidates' Weekend Number"],
-                                              'name': row['Name'],
-                                              'model_class': row['Model Class'],
-                                              'model_class_location': row[
-                                                  'Model Class Location'],
-                                              'interviewers': row[
-                                                  'Interviewers']})
-
-        # Redirects to admin manager page
-        return redirect(url_for('admin_manager'))
+        # Saves uploaded Excel file
+        path = save_job_file(request.files['file'])
+
+        # Creates the users in Firebase Authentication and adds them and
+        # their information to the database in the background
+        job_id = JOBS.enqueue('import_users', path=path)
+
+        # Shows the progress of the import
+        return redirect(url_for('admin_job', job_id=job_id))
 
     return show_add_users()
 
+@app.route('/admin/jobs/<job_id>')
+def admin_job(job_id):
+    '''
+    Shows the status and progress of a background job, as JSON if the
+    request asks for JSON, and as a page otherwise.
+    '''
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'No such job'}), 404
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job)
+
+    # Shows the import report once an import has finished
+    if job['kind'] == 'import_users' and job['status'] == 'succeeded':
+        return show_add_users_report(job['result'])
+
+    return show_job(job)
+
 @app.route('/admin/select-user', methods=['POST', 'GET'])
 def view_users():
     '''
@@ -540,15 +1200,19 @@ def edit_user(user_name=None):
 
         # User deleted
         if request.form['button'] == DELETE_USER:
-            DB.collection(USERS_COLLECTION).document(user_name).delete()
+            USERS_DB.delete(user_name)
+            USERS.invalidate(user_name)
+            SESSIONS.revoke_user(user_name)
+            return redirect(url_for('admin_manager'))
+        # User logged out everywhere
+        elif request.form['button'] == REVOKE_SESSIONS:
+            SESSIONS.revoke_user(user_name)
             return redirect(url_for('admin_manager'))
         # User changed
         elif request.form['button'] == SUBMIT:
-            user_ref = DB.collection(USERS_COLLECTION).document(user_name)
-
             # Gets new information for user
             # Updates email address in authentication and database
-            auth.update_user(user_name, email=request.form[EMAIL])
+            AUTH.update_user(user_name, email=request.form[EMAIL])
 
             # Creates updated user object to use to update the database
             updated_user = User(user_name, request.form[EMAIL],
@@ -562,7 +1226,9 @@ def edit_user(user_name=None):
                                 request.form[MODEL_CLASS_LOCATION],
                                 request.form[INTERVIEWERS])
 
-            user_ref.set(updated_user.to_dict(), merge=True)
+            USERS_DB.set(user_name, updated_user.to_dict(), merge=True)
+            USERS.invalidate(user_name)
+            SESSIONS.refresh_user(user_name, lambda: updated_user)
 
             # Redirects to the admin manager page
             return redirect(url_for('admin_manager'))
@@ -584,22 +1250,18 @@ def admin_schedule():
     '''
     Shows the schedule for the current Candidates' Weekend for the admin.
     '''
-    # Gets all event names and information for the events for the current
-    # Candidates' Weekend
-    event_names, event_infos = get_events()
-
-    # Separates and sorts events based on day and time
-    friday_events, saturday_events = separate_and_sort_events(event_names, event_infos)
-
-    return show_admin_schedule(friday_events, saturday_events)
+    # Shows the events for the current Candidates' Weekend
+    return show_admin_schedule(get_curr_cw())
 
 @app.route('/event-info/<name>/admin')
 def admin_event_info(name):
     '''
     Shows the specific information for a selected event.
     '''
-    # Gets information for the event, represented as a dictionary
-    event = DB.collection(EVENTS_COLLECTION).document(name).get().to_dict()
+    # Gets the event
+    event = CATALOG.get(name)
+    if event is None:
+        abort(404)
 
     # Show page with more event information
     return show_admin_event_info(name, event)
@@ -612,12 +1274,13 @@ def show_admin_login():
     return render_template('adminlogin.html', img_url=get_header(),
                            img_url1=get_logo())
 
-def show_admin_manager():
+def show_admin_manager(error=None):
     '''
-    Shows the admin manager page.
+    Shows the admin manager page, with an error message if an action
+    failed.
     '''
     return render_template('admin_manager.html', img_url=get_header(),
-                           img_url1=get_logo())
+                           img_url1=get_logo(), error=error)
 
 def show_admin_login_error():
     '''
@@ -660,23 +1323,20 @@ def show_edit_event(event_name):
     '''
 
     # Retrieves current information for an event and fills form
-    event_ref = DB.collection(EVENTS_COLLECTION).document(event_name).get()
-
-    # Gets event information as a dictionary
-    event_dict = event_ref.to_dict()
+    event = CATALOG.get(event_name)
+    if event is None:
+        abort(404)
 
     # Recomposes the links as a string of text that can be displayed
     links_text = ""
-    links_dict = event_dict[LINKS]
-    for key in links_dict.keys():
-        links_text += key + ", " + links_dict[key] + "\n"
-
-    event_dict['links_text'] = links_text
+    for key, text in event.links.items():
+        links_text += key + ", " + text + "\n"
 
     # Shows edit event form with current information filled in
     return render_template("edit_event.html",
-                           old_name=get_raw_name(event_ref.id),
-                           event=event_dict,
+                           old_name=get_raw_name(event_name),
+                           event=event,
+                           links_text=links_text,
                            img_url=get_header(),
                            img_url1=get_logo())
 
@@ -687,6 +1347,60 @@ def show_add_users():
     return render_template('add_users.html', img_url=get_header(),
                            img_url1=get_logo())
 
+def show_bulk_events(changes=(), errors=(), plan_id=None):
+    '''
+    Shows the bulk event editing form, with the preview of the changes (and
+    the rows that could not be read) once a spreadsheet has been uploaded.
+    '''
+    return render_template('bulk_events.html', img_url=get_header(),
+                           img_url1=get_logo(),
+                           changes=[describe_change(change)
+                                    for change in changes],
+                           errors=errors, plan_id=plan_id)
+
+def show_clone_weekend(error=None):
+    '''
+    Shows the form to copy the events of one Candidates' Weekend into
+    another.
+    '''
+    return render_template('clone_weekend.html', img_url=get_header(),
+                           img_url1=get_logo(), error=error,
+                           current_cw_number=get_curr_cw())
+
+def show_offline_bundles():
+    '''
+    Shows the form to export offline schedules, with links to the exported
+    ones.
+    '''
+    bundles = []
+    if os.path.isdir(BUNDLE_FOLDER):
+        for cw_number in sorted(os.listdir(BUNDLE_FOLDER)):
+            for audience_name in BUNDLE_AUDIENCES:
+                if os.path.exists(os.path.join(
+                        get_bundle_folder(cw_number, audience_name),
+                        BUNDLE_MANIFEST)):
+                    bundles.append((cw_number, audience_name))
+    return render_template('offline_bundles.html', img_url=get_header(),
+                           img_url1=get_logo(), bundles=bundles,
+                           current_cw_number=get_curr_cw())
+
+def show_add_users_report(report):
+    '''
+    Shows the outcome of importing users for each row of the uploaded file.
+    '''
+    imported = len([entry for entry in report if entry['success']])
+    return render_template('add_users_report.html', img_url=get_header(),
+                           img_url1=get_logo(), report=report,
+                           imported=imported)
+
+def show_job(job):
+    '''
+    Shows the status of a background job. The page reloads itself until
+    the job has finished.
+    '''
+    return render_template('job_status.html', img_url=get_header(),
+                           img_url1=get_logo(), job=job)
+
 def show_users():
     '''
     Retrieves list of users from the database and renders page so that
@@ -694,7 +1408,7 @@ def show_users():
     '''
 
     # Shows page with list of users to allow admin to select a user
-    user_names = get_users()
+    user_names, user_infos = get_users()
     return render_template('view_users.html',
                            img_url=get_header(),
                            users_list=user_names,
@@ -706,13 +1420,13 @@ def show_edit_user(user_name):
     shows the edit user form to the admin.
     '''
     # Get current user information
-    user_ref = DB.collection(USERS_COLLECTION).document(user_name).get()
+    user_info = USERS.get(user_name)
 
     # Show edit user form with current information filled in
     return render_template('edit_user.html',
                            img_url=get_header(),
-                           old_username=user_ref.id,
-                           user_info=user_ref.to_dict(),
+                           old_username=user_name,
+                           user_info=user_info,
                            img_url1=get_logo())
 
 def show_admin_welcome():
@@ -725,28 +1439,64 @@ def show_admin_welcome():
                            img_url2=get_logo(),
                            img_url3=get_media_link('welcomepage.jpg'))
 
-def show_admin_schedule(friday_events, saturday_events):
+def show_admin_schedule(cw_number):
     '''
-    Shows the admin schedule for Friday and Saturday.
+    Shows the admin schedule for Friday and Saturday of a Candidates'
+    Weekend.
     '''
+    def render(user_id):
+        # Gets the events separated by day and sorted by time
+        friday_events, saturday_events = SCHEDULES.weekend(cw_number)
+        return render_template('adminschedule.html',
+                               friday_events=friday_events,
+                               saturday_events=saturday_events,
+                               img_url=get_header(),
+                               img_url1=get_logo())
 
     # Displays schedule
-    return render_template('adminschedule.html', friday_events=friday_events,
-                           saturday_events=saturday_events,
-                           img_url=get_header(),
-                           img_url1=get_logo())
+    return PAGES.response(('adminschedule.html', cw_number, CATALOG.version),
+                          render)
 
 def show_admin_event_info(name, event):
     '''
     Renders a page with the information for the given event.
     '''
     return render_template('adminevents.html', name=get_display_name(name),
-                           description=split_description_lines(event[DESCRIPTION]),
-                           img_files=event[IMG_FILES],
-                           links=event[LINKS],
+                           description=split_description_lines(event.description),
+                           img_files=event.img_files,
+                           links=event.links,
                            img_url=get_header(),
                            img_url1=get_logo())
 
+@app.route(LOCAL_MEDIA_URL + '<path:filename>')
+def local_media(filename):
+    '''
+    Serves the files stored in the local media folder, when the app runs
+    with the local backend.
+    '''
+    return send_from_directory(os.path.abspath(LOCAL_MEDIA_FOLDER), filename)
+
+@app.route(BUNDLE_URL + '<cw_number>/<audience_name>/',
+           defaults={'filename': SCHEDULE_PAGE})
+@app.route(BUNDLE_URL + '<cw_number>/<audience_name>/<filename>')
+def offline_bundle(cw_number, audience_name, filename):
+    '''
+    Serves the files of an offline bundle from disk, with long cache
+    headers (except for the service worker, which phones check for
+    updates).
+    '''
+    if audience_name not in BUNDLE_AUDIENCES:
+        return jsonify({'error': 'No such bundle'}), 404
+
+    response = send_from_directory(
+        os.path.abspath(get_bundle_folder(cw_number, audience_name)),
+        filename)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = 0 if filename == SERVICE_WORKER else \
+                                     BUNDLE_MAX_AGE
+    return response
+
 # ------- CLIENT SIDE ROUTING ---------
 @app.route('/')
 def homepage():
@@ -755,6 +1505,19 @@ def homepage():
     '''
     return redirect(url_for("welcome"))
 
+@app.route('/logout')
+def client_logout():
+    '''
+    Ends the user's session and sends them to the welcome page.
+    '''
+    session = get_session()
+    if session is not None:
+        SESSIONS.revoke(session)
+
+    response = redirect(url_for('homepage'))
+    response.delete_cookie(SESSION_COOKIE)
+    return response
+
 @app.route('/welcome')
 def welcome():
     '''
@@ -763,6 +1526,7 @@ def welcome():
     return show_welcome()
 
 @app.route('/welcome/<user_id>')
+@login_required
 def client_welcome(user_id):
     '''
     Launches home page.
@@ -779,22 +1543,20 @@ def client_login():
     if request.method == 'POST':
         email = request.form[EMAIL].lower()
 
-        users = DB.collection('users').where(EMAIL, '==', email).get()
-        user = None
-        for u in users:
-            user = u
+        user_id = USERS.find_by_email(email)
+        user = USERS.get(user_id) if user_id is not None else None
 
         # return error page is user isn't in database
         if user is None:
             return show_client_email_error()
 
         # If user exists, check to see if password matches
-        if user.to_dict()[PASSWORD] != '':
+        if user.password != '':
             # If password exists, redirect to password input
-            return redirect(url_for('client_password', user_id=user.id))
+            return redirect(url_for('client_password', user_id=user_id))
 
         # If password doesn't exist, redirect student to create password
-        return redirect(url_for('client_register', user_id=user.id))
+        return redirect(url_for('client_register', user_id=user_id))
 
     # Show client login page
     return show_client_login()
@@ -811,11 +1573,22 @@ def client_password(user_id=None):
     # in database.
     if request.method == 'POST':
         password_attempt = request.form[PASSWORD]
-        user_password = DB.collection(USERS_COLLECTION).document(user_id).get().to_dict()[PASSWORD]
+        user = USERS.get(user_id)
+        if user is None:
+            return redirect(url_for('client_login'))
+        user_password = user.password
 
         # If they match, log user in.
-        if check_password_hash(user_password, password_attempt):
-            return redirect(url_for('client_schedule', user_id=user_id))
+        if check_password(user_password, password_attempt):
+            # Hashes the password again if the hashing settings changed,
+            # keeping authentication and the database in step
+            if needs_rehash(user_password):
+                hashed_password = hash_password(password_attempt)
+                AUTH.update_user(user_id, password=hashed_password)
+                USERS_DB.set(user_id, {"password": hashed_password}, merge=True)
+                USERS.invalidate(user_id)
+
+            return login_user(user_id, user)
 
         # Otherwise, show error message
         return show_client_login_error(user_id)
@@ -830,23 +1603,29 @@ def client_register(user_id=None):
     '''
     # Makes sure passwords are matching and are more than eight characters long
     if request.method == 'POST':
+        # Reads the user from the database rather than the cache, so that a
+        # password set meanwhile (maybe by another worker) is never replaced
+        user = load_user(user_id)
+        if user is None:
+            return redirect(url_for('client_login'))
+        if user.password != '':
+            return redirect(url_for('client_password', user_id=user_id))
 
         if request.form[PASSWORD] != '' and request.form[VERIFY_PASSWORD] != '':
             if request.form[PASSWORD] == request.form[VERIFY_PASSWORD]:
                 if len(request.form[PASSWORD]) >= 8:
                     # Get hashed password
-                    hashed_password = generate_password_hash(request.form[PASSWORD])
+                    hashed_password = hash_password(request.form[PASSWORD])
 
                     # Update user's hashed password in authentication
-                    auth.update_user(user_id, password=hashed_password)
+                    AUTH.update_user(user_id, password=hashed_password)
 
                     # Update user's hashed password in the database
-                    user_ref = DB.collection(USERS_COLLECTION).document(user_id)
-                    user_ref.set({"password": hashed_password}, merge=True)
+                    USERS_DB.set(user_id, {"password": hashed_password}, merge=True)
+                    USERS.invalidate(user_id)
 
-                    # Redirect user to the schedule
-                    return redirect(url_for('client_schedule',
-                                    user_id=user_id))
+                    # Logs the user in and redirects them to the schedule
+                    return login_user(user_id, USERS.get(user_id))
 
                 # Invalid password, show error in registration page
                 return show_client_register_error(user_id)
@@ -859,40 +1638,51 @@ def client_register(user_id=None):
 
 @app.route('/schedule', defaults={'user_id': None})
 @app.route('/schedule/<user_id>')
+@login_required
 def client_schedule(user_id=None):
     '''
     Shows the current schedule.
     '''
+    if user_id is None:
+        # Sends users who are logged in to their own schedule
+        session = get_session()
+        if session is not None:
+            return redirect(url_for('client_schedule',
+                                    user_id=session.user_id))
 
-    # Get event names and information
-    event_names, event_infos = get_events(user_id)
-    # Add name to event information dictionary
-    for i in range(0, len(event_names)):
-        event_name = event_names[i]
-        event_infos[i][NAME] = get_display_name(event_name)
+        # Shows the guests' events for the current Candidates' Weekend
+        return show_client_schedule(None, get_curr_cw())
 
-    # Separates events between occurring on Friday
-    # and on Saturday and sorts by time
-    friday_events, saturday_events = separate_and_sort_events(event_names, event_infos)
+    if user_id == GUEST:
+        return show_client_schedule(GUEST, get_curr_cw())
 
-    return show_client_schedule(user_id, friday_events, saturday_events)
+    # Shows the events for the user's Candidates' Weekend, from their session
+    session = get_user_session(user_id)
+    return show_client_schedule(user_id, session.cw_number, session.user)
 
 @app.route('/candidate-info/<user_id>')
+@login_required
 def candidate_info(user_id=None):
     '''
     Show the candidate info card for a given candidate.
     '''
-    # Gets the user's information as a dictionary
-    user_dict = DB.collection('users').document(user_id).get().to_dict()
+    # Guests have no candidate information
+    if user_id == GUEST:
+        return redirect(url_for('client_login'))
 
-    # Converts the interview time to conventional time)
-    user_dict[INTERVIEW_TIME] = convert_conventional(user_dict[INTERVIEW_TIME])
+    # Gets the user's information from their session
+    user = get_user_session(user_id).user
+
+    # Converts the interview time to conventional time
+    interview_time = (display_time(user.interview_min)
+                      if user.interview_min is not None else '')
 
     # Renders candidate info page with the user's information
-    return show_candidate_info(user_id, user_dict)
+    return show_candidate_info(user_id, user, interview_time)
 
 @app.route('/event-info/<name>/', defaults={'user_id': None})
 @app.route('/event-info/<name>/<user_id>')
+@login_required
 def event_info(name, user_id=None):
     '''
     Shows additional information for a given event.
@@ -901,8 +1691,14 @@ def event_info(name, user_id=None):
     name - the name of the event to show more information for
     '''
 
-    # Show page with more event information
-    return show_event_info(name, user_id, DB.collection(EVENTS_COLLECTION).document(name).get().to_dict())
+    event = CATALOG.get(name)
+    if event is None:
+        abort(404)
+
+    # Show page with more event information, with the guests' navigation
+    # links for visitors without a user id
+    return show_event_info(name, user_id if user_id is not None else GUEST,
+                           event)
 
 # ----- CLIENT RENDERING -------
 def show_welcome():
@@ -910,6 +1706,15 @@ def show_welcome():
     Shows the generic welcome page for non-logged in users.
     '''
 
+    def render(user_id):
+        return render_welcome()
+
+    return PAGES.response(('welcome.html',), render)
+
+def render_welcome():
+    '''
+    Renders the generic welcome page.
+    '''
     return render_template('welcome.html', img_url=get_header(),
                            img_url1=get_media_link('campusmap.jpg'),
                            img_url2=get_logo(),
@@ -978,24 +1783,56 @@ def show_client_register(user_id):
                            img_url1=get_logo(),
                            user_id=user_id)
 
-def show_client_schedule(user_id, friday_events, saturday_events):
+def show_client_schedule(user_id, cw_number, user=None):
     '''
     Shows the schedule for a specific user. Shows only the events for that
-    user's Candidates' Weekend.
-    '''
-
-    return render_template('clientschedule.html', friday_events=friday_events,
+    user's Candidates' Weekend that the user's audience (candidates or
+    guests) sees. For candidates, user is their User (from their session),
+    whose personal timeline is shown.
+    '''
+    # Candidates see their own timeline, which is shared with the
+    # candidates who have the same interview and locations
+    audience = get_audience(user_id)
+    if audience != Access.CANDIDATES:
+        user = None
+    personal_key = TIMELINES.personal_key(user) if user is not None else None
+
+    def render(user_id):
+        # Gets the events that the user sees, separated by day and sorted
+        # by time
+        if user is not None:
+            friday_events, saturday_events = TIMELINES.timeline(user)
+        else:
+            friday_events, saturday_events = SCHEDULES.weekend(cw_number,
+                                                               audience)
+        return render_client_schedule(user_id, audience, friday_events,
+                                      saturday_events)
+
+    # Visitors who have not logged in get the guests' navigation links
+    return PAGES.response(('clientschedule.html', cw_number, audience,
+                           CATALOG.version, personal_key), render,
+                          user_id if user_id is not None else GUEST)
+
+def render_client_schedule(user_id, audience, friday_events,
+                           saturday_events):
+    '''
+    Renders a schedule page from the entries of each day.
+    '''
+    return render_template('clientschedule.html',
+                           friday_events=friday_events,
                            saturday_events=saturday_events,
+                           audience=audience,
                            img_url=get_header(),
                            img_url1=get_logo(), user_id=user_id)
 
-def show_candidate_info(user_id, user_dict):
+def show_candidate_info(user_id, user, interview_time):
     '''
     Shows the information for the given candidate.
     '''
 
     return render_template('clientinfo.html', user_id=user_id,
-                           user=user_dict, img_url1=get_logo(),
+                           user=user, interview_time=interview_time,
+                           img_url1=get_logo(),
                            img_url=get_header())
 
 def show_event_info(name, user_id, event):
@@ -1004,32 +1841,214 @@ def show_event_info(name, user_id, event):
     the navigation bar.
     '''
 
+    def render(user_id):
+        return render_event_info(name, user_id, event)
+
+    return PAGES.response(('events.html', name, CATALOG.version), render,
+                          user_id)
+
+def render_event_info(name, user_id, event):
+    '''
+    Renders the page of an event.
+    '''
     return render_template('events.html', name=get_raw_name(name),
-                           description=split_description_lines(event[DESCRIPTION]),
-                           img_files=event[IMG_FILES],
-                           links=event[LINKS],
+                           description=split_description_lines(
+                               event.description),
+                           img_files=event.img_files,
+                           links=event.links,
                            img_url=get_header(),
                            img_url1=get_logo(),
                            user_id=user_id)
 
+# ----- OFFLINE BUNDLES -----
+def get_bundle_folder(cw_number, audience_name):
+    '''
+    Returns the folder of the offline bundle of a Candidates' Weekend for
+    an audience ('candidates' or 'parents').
+    '''
+    return os.path.join(BUNDLE_FOLDER, secure_filename(cw_number),
+                        audience_name)
+
+def get_template_source(template_name):
+    '''
+    Returns the source of a template, so that bundle pages are rendered
+    again when their template changes.
+    '''
+    return app.jinja_env.loader.get_source(app.jinja_env, template_name)[0]
+
+def export_bundle(cw_number, audience_name):
+    '''
+    Writes (or updates) the offline bundle of a Candidates' Weekend for an
+    audience: the welcome page, the schedule, the page of every event with a
+    description, the schedule as JSON, and the service worker. Only the
+    pages whose events (or templates or image links) changed since the last
+    export are rendered and written again.
+
+    Returns: the bundle's report (see offline.BundleWriter.finish)
+    '''
+    audience = BUNDLE_AUDIENCES[audience_name]
+    writer = BundleWriter(get_bundle_folder(cw_number, audience_name),
+                          cw_number + '-' + audience_name)
+
+    # Gets the weekend's schedule, and the events that have pages
+    days = list(zip(DAYS, SCHEDULES.weekend(cw_number, audience)))
+    linked = [entry for day, entries in days for entry in entries
+              if entry.description]
+    pages = {entry.full_name: get_event_page(entry.full_name)
+             for entry in linked}
+    schedule = encode_schedule(cw_number, audience, days, pages)
+    media_links = {name: get_media_link(name)
+                   for name in (OLIN_HEADER, OLIN_LOGO) + BUNDLE_MEDIA}
+    media = set(media_links.values())
+
+    with app.test_request_context('/'):
+        # Points the links between the pages to the bundle's files
+        links = {url_for('homepage'): WELCOME_PAGE,
+                 url_for('client_welcome', user_id=GUEST): WELCOME_PAGE,
+                 url_for('client_schedule', user_id=GUEST): SCHEDULE_PAGE}
+        links.update({url_for('event_info', name=entry.full_name,
+                              user_id=GUEST): pages[entry.full_name]
+                      for entry in linked})
+
+        inputs = [get_template_source('welcome.html'), media_links]
+        if not writer.unchanged(WELCOME_PAGE, inputs):
+            writer.write(WELCOME_PAGE, relink(render_welcome(), links),
+                         inputs)
+
+        inputs = [get_template_source('clientschedule.html'), schedule,
+                  media_links]
+        if not writer.unchanged(SCHEDULE_PAGE, inputs):
+            writer.write(SCHEDULE_PAGE, relink(render_client_schedule(
+                GUEST, audience, *(entries for day, entries in days)),
+                links), inputs)
+
+        for name, page in pages.items():
+            event = CATALOG.get(name)
+            media.update(get_image_fallback(img_file)
+                         for img_file in event.img_files)
+            inputs = [get_template_source('events.html'), event.to_dict(),
+                      media_links]
+            if not writer.unchanged(page, inputs):
+                writer.write(page, relink(render_event_info(name, GUEST,
+                                                            event), links),
+                             inputs)
+
+    writer.write(SCHEDULE_JSON, json.dumps(schedule, separators=(',', ':')))
+    return writer.finish(media)
+
+def start_services():
+    '''
+    Connects to the backends and starts the caches and background jobs that
+    the routes rely on. Called once before the app serves requests.
+    '''
+    # Connects to the database, file storage and authentication
+    init_backend()
+
+    # Loads the general information and the events into memory and keeps
+    # them in sync with the database
+    SETTINGS.start(SETTINGS_DB)
+    CATALOG.start(EVENTS_DB)
+
+    # Caches every user, so that logging in does not need to read the
+    # database, and keeps them in sync with the changes made by other workers
+    USERS.start(USERS_DB)
+
+    # Starts running background jobs, including any left unfinished
+    JOBS.start()
+
+# Media links and pages that are loaded into the caches when the app starts
+# (the pages are also loaded for each new Candidates' Weekend), so that the
+# first candidates do not wait for them
+WARM_MEDIA = SITE_MEDIA
+WARM_PAGES = ('/welcome',)
+
+# The version of the event catalog that each weekend's pages were last
+# loaded into this process's caches with
+WARMED_WEEKENDS = {}
+
+def warm_weekend(cw_number):
+    '''
+    Loads the schedules and pages of a Candidates' Weekend into the caches:
+    the schedule of every audience, the candidates' timelines, and the
+    pages of the weekend's candidates and events.
+    '''
+    # Builds the schedules, and the trees used to find conflicts
+    for audience in (None, Access.CANDIDATES, Access.PARENTS):
+        SCHEDULES.weekend(cw_number, audience)
+    for day in DAYS:
+        TIMELINES.tree(cw_number, day)
+
+    # Renders the admins' and the guests' schedules of the weekend, which
+    # need not be the current one yet
+    with app.test_request_context('/schedule/admin'):
+        show_admin_schedule(cw_number)
+    with app.test_request_context('/schedule'):
+        show_client_schedule(None, cw_number)
+
+    # Renders each candidate's schedule (candidates with the same slots
+    # share a page) and, for candidates, the pages of the weekend's events.
+    # These pages need a session, so they are rendered directly.
+    candidates = [(user_id, user) for user_id, user in zip(*get_users())
+                  if user.cw_number == cw_number]
+    for user_id, user in candidates:
+        with app.test_request_context('/schedule/' + quote(user_id, safe='')):
+            show_client_schedule(user_id, cw_number, user)
+    if candidates:
+        user_id = candidates[0][0]
+        for name in get_events(user_id)[0]:
+            with app.test_request_context('/event-info/' + quote(name, safe='')):
+                show_event_info(name, user_id, CATALOG.get(name))
+
+    WARMED_WEEKENDS[cw_number] = CATALOG.version
+
+def on_settings_change(old, new):
+    '''
+    Warms the caches for a new Candidates' Weekend when another process
+    changes the current weekend. The process that changes it warms its
+    caches before the switch (see change_cw_job), so they are not warmed
+    again here.
+    '''
+    cw_number = new.get(CW_NUMBER)
+    if old.get(CW_NUMBER) is not None and old.get(CW_NUMBER) != cw_number \
+       and WARMED_WEEKENDS.get(cw_number) != CATALOG.version:
+        warm_weekend(cw_number)
+
+SETTINGS.subscribe(on_settings_change)
+
+def warm_caches():
+    '''
+    Loads the media links, and the current weekend's schedules and pages,
+    into the caches.
+    '''
+    for img_filename in WARM_MEDIA:
+        get_media_link(img_filename)
+
+    client = app.test_client()
+    for page in WARM_PAGES:
+        client.get(page)
+
+    warm_weekend(get_curr_cw())
+
+_started_pid = None
+
+def create_app():
+    '''
+    Starts the app's services and warms its caches, once per process.
+
+    Returns: the Flask app
+    '''
+    global _started_pid
+    if _started_pid != os.getpid():
+        start_services()
+        warm_caches()
+        _started_pid = os.getpid()
+    return app
+
 if __name__ == '__main__':
-    # Configures app and uploads folder for the app
-    UPLOAD_FOLDER = os.getcwd()
-    # Defines allowed extensions to limit acceptable files to upload
-    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-    # Configures database and gets access to the database
-    PROJECT_ID = "klgsglksgjs"
-    CRED = credentials.Certificate('serviceAccountKey.json')
-    firebase_admin.initialize_app(CRED, {
-        'projectId': PROJECT_ID,
-        'storageBucket': PROJECT_ID + ".appspot.com"})
-
-    # Initialize the client for interfacing with the database
-    DB = firestore.client()
-
-    # Initializes Firebase Storage bucket for file uploads/retrieval
-    BUCKET = storage.bucket()
+    # Logs one line for each request, with its backend calls
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+
+    create_app()
 
     HOST = '0.0.0.0' if 'PORT' in os.environ else '127.0.01'
     PORT = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,155 @@
+'''
+This module serves the web app over ASGI, for example with uvicorn:
+
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT
+
+The Flask routes in Web.py are served unchanged (with the same templates)
+through ASGIAdapter, a WSGI-to-ASGI adapter that runs the Flask app in a
+pool of ASGI_THREADS threads. Reading a request's body and sending its
+response happen on the event loop, but each request holds one of the pool's
+threads while its route runs, backend calls included. The pages' backend
+data (the event catalog, the users and the media links) is kept in memory
+by the app itself, so routes rarely wait on a backend.
+'''
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+import Web
+
+# Number of threads that run routes
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+# ----- WSGI TO ASGI -----
+def build_environ(scope, body):
+    '''
+    Returns the WSGI environment for an ASGI HTTP request.
+
+    >>> environ = build_environ({'method': 'GET', 'path': '/schedule/kaoki',
+    ...                          'query_string': b'a=1', 'headers': [
+    ...                              (b'accept', b'text/html')]}, None)
+    >>> environ['PATH_INFO'], environ['QUERY_STRING'], environ['HTTP_ACCEPT']
+    ('/schedule/kaoki', 'a=1', 'text/html')
+    '''
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+def run_wsgi(wsgi_app, environ):
+    '''
+    Calls a WSGI app.
+
+    Returns: the status code, the headers and the body of the response
+    '''
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+class ASGIAdapter():
+    '''
+    ASGI app that serves a Flask app, running its routes in a thread pool.
+    '''
+    def __init__(self, flask_app, startup=None, threads=ASGI_THREADS):
+        '''
+        Attributes:
+        flask_app - the Flask app to serve
+        startup - function to call once before serving requests
+        threads - number of threads that run routes
+        '''
+        self.flask_app = flask_app
+        self.startup = startup
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    def run(self, function, *args):
+        '''
+        Runs a blocking function in the thread pool.
+        '''
+        return asyncio.get_running_loop().run_in_executor(self.executor,
+                                                          function, *args)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.startup is not None:
+                    await self.run(self.startup)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        '''
+        Reads the request body, keeping it in memory unless it is large (like
+        an upload with many images).
+        '''
+        body = SpooledTemporaryFile(max_size=Web.UPLOAD_MEMORY_LIMIT, mode='w+b')
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+        return body
+
+    async def http(self, scope, receive, send):
+        body = await self.read_body(receive)
+        try:
+            environ = build_environ(scope, body)
+            status, headers, content = await self.run(
+                run_wsgi, self.flask_app, environ)
+        finally:
+            body.close()
+
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+application = ASGIAdapter(Web.app, Web.create_app)
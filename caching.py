@@ -0,0 +1,145 @@
+'''
+This module contains the in-process caches used by the web app.
+
+This includes:
+    - the LRUCache class - a thread-safe, size-bounded cache whose entries
+      also expire after a time-to-live (TTL), and which keeps hit and miss
+      counters so that the effect of the cache can be checked
+'''
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache():
+    '''
+    A least-recently-used cache with a time-to-live for each entry.
+
+    >>> cache = LRUCache(maxsize=2, ttl=60)
+    >>> cache.get('a', lambda key: key.upper())
+    'A'
+    >>> cache.get('a', lambda key: 'never called')
+    'A'
+    >>> cache.put('b', 'B'); cache.put('c', 'C')
+    >>> 'a' in cache
+    False
+    >>> cache.stats()['hits'], cache.stats()['misses']
+    (1, 1)
+    '''
+    def __init__(self, maxsize=128, ttl=None, clock=time.monotonic):
+        '''
+        Creates a cache.
+
+        Attributes:
+        maxsize: the largest number of entries kept before the least
+                 recently used entry is evicted
+        ttl: the number of seconds an entry stays valid, or None if entries
+             never expire
+        clock: the function used to read the current time (in seconds)
+        '''
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _expired(self, expires_at):
+        '''
+        Checks whether an entry with the given expiry time is stale.
+        '''
+        return expires_at is not None and self.clock() >= expires_at
+
+    def lookup(self, key):
+        '''
+        Returns a (found, value) pair for the key, without loading anything.
+        Counts a hit or a miss.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[1]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+
+            # Drops the stale entry, if there is one
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def get(self, key, loader=None):
+        '''
+        Gets the value cached for the key. If there is no valid value and a
+        loader function is given, calls loader(key), caches the result and
+        returns it. Otherwise returns None.
+        '''
+        found, value = self.lookup(key)
+        if found or loader is None:
+            return value
+
+        # Loads outside the lock so that a slow loader does not block
+        # readers of other keys
+        value = loader(key)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value, ttl=None):
+        '''
+        Stores a value for the key, evicting the least recently used entries
+        if the cache is full. ttl overrides the cache's default TTL.
+        '''
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else self.clock() + ttl
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        '''
+        Removes the entry for the key, if there is one.
+        '''
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        '''
+        Removes every entry (the counters are kept).
+        '''
+        with self._lock:
+            self._entries.clear()
+
+    def keys(self):
+        '''
+        Returns a list of the keys of the entries, including expired ones.
+        '''
+        with self._lock:
+            return list(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry[1])
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        '''
+        Returns the cache counters as a dictionary.
+        '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries),
+                    'maxsize': self.maxsize,
+                    'ttl': self.ttl,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,252 @@
+'''
+This module contains the EventCatalog class, an in-memory copy of the events
+collection.
+
+The catalog is loaded once from the event repository and then kept up to
+date, either by a Firestore snapshot listener (on_snapshot) or, when
+listening is not available (for example against the Firestore emulator, or
+with the local SQLite repository), by polling the repository. Admin writes
+are applied to the catalog directly so that they show up immediately, and
+many changes (like a bulk edit of the events) can be applied as one, so that
+the caches that depend on the catalog are cleared once.
+
+Events are kept as immutable events.Event records, which are handed out
+without copying, and are indexed by Candidates' Weekend number and by day,
+so that the schedule pages never have to scan the collection.
+'''
+import os
+import threading
+from events import Event
+from repositories import RepositorySync, polling_requested
+
+POLL_INTERVAL = float(os.environ.get('CATALOG_POLL_INTERVAL', 15))
+
+class EventCatalog():
+    '''
+    In-memory, indexed copy of the events collection.
+
+    >>> catalog = EventCatalog('General Event Info')
+    >>> catalog.load({'General Event Info': {'cw_number': '2'},
+    ...               'Lunch-2': {'cw_number': '2', 'day': 'Friday'},
+    ...               'Tour-All': {'cw_number': 'All', 'day': 'Saturday'}})
+    >>> catalog.put('Dinner-1', Event('Dinner-1', '18:00', '19:00', 'Friday',
+    ...                               'Dining Hall', '', '1', 'All'))
+    >>> catalog.get('General Event Info') is None
+    True
+    >>> catalog.select(('2', 'All'))[0]
+    ['Lunch-2', 'Tour-All']
+    >>> catalog.select(('2', 'All'), 'Friday')[0]
+    ['Lunch-2']
+    >>> catalog.remove('Lunch-2'); catalog.names()
+    ['Dinner-1', 'Tour-All']
+    >>> catalog.version
+    4
+    >>> catalog.apply({'Lunch-2': Event('Lunch-2', '12:00', '13:00', 'Friday',
+    ...                                 '', '', '2', 'All')},
+    ...               removed=['Dinner-1']); catalog.names(), catalog.version
+    (['Lunch-2', 'Tour-All'], 5)
+    '''
+    def __init__(self, settings_id, decode=Event.from_dict):
+        '''
+        Creates an empty catalog.
+
+        Attributes:
+        settings_id: the id of the document in the events collection that
+                     held the general information before it moved to the
+                     settings collection, which the catalog skips
+        decode: function that creates an event record from its document id
+                and its document
+        '''
+        self.settings_id = settings_id
+        self.decode = decode
+        self.version = 0
+        self.loaded = False
+        self._events = {}
+        self._by_cw = {}
+        self._by_day = {}
+        self._listeners = []
+        self._version_listeners = []
+        self._sync = RepositorySync('event-catalog-poller')
+        self._lock = threading.RLock()
+
+    # ----- reading -----
+    def get(self, name):
+        '''
+        Returns an event, or None if there is no such event.
+        '''
+        with self._lock:
+            return self._events.get(name)
+
+    def names(self):
+        '''
+        Returns the sorted names (document ids) of every event.
+        '''
+        with self._lock:
+            return sorted(self._events)
+
+    def all(self):
+        '''
+        Returns the names of every event and a parallel list of the events.
+        '''
+        with self._lock:
+            names = sorted(self._events)
+            return names, [self._events[name] for name in names]
+
+    def select(self, cw_numbers, day=None):
+        '''
+        Returns the names of the events in any of the given Candidates'
+        Weekends (and on the given day, if there is one), and a parallel list
+        of the events.
+        '''
+        with self._lock:
+            selected = set()
+            for cw_number in cw_numbers:
+                selected |= self._by_cw.get(cw_number, set())
+            if day is not None:
+                selected &= self._by_day.get(day, set())
+
+            names = sorted(selected)
+            return names, [self._events[name] for name in names]
+
+    # ----- writing -----
+    def subscribe(self, listener):
+        '''
+        Registers a function to be called as listener(name, old, new)
+        whenever an event changes. old is None for new events and new is
+        None for removed events.
+        '''
+        self._listeners.append(listener)
+
+    def subscribe_version(self, listener):
+        '''
+        Registers a function to be called as listener(version) after every
+        change to the catalog, once per change (and once for all the changes
+        made by one call to apply).
+        '''
+        self._version_listeners.append(listener)
+
+    def _index(self, name, event):
+        self._by_cw.setdefault(event.cw_number, set()).add(name)
+        self._by_day.setdefault(event.day, set()).add(name)
+
+    def _unindex(self, name, event):
+        self._by_cw.get(event.cw_number, set()).discard(name)
+        self._by_day.get(event.day, set()).discard(name)
+
+    def _notify(self, name, old, new):
+        for listener in self._listeners:
+            listener(name, old, new)
+
+    def _notify_version(self):
+        for listener in self._version_listeners:
+            listener(self.version)
+
+    def _put(self, name, info):
+        '''
+        Stores an event without telling the listeners.
+
+        Returns: (old, new) if the catalog changed, or None
+        '''
+        old = self._events.get(name)
+        if old == info:
+            return None
+        if old is not None:
+            self._unindex(name, old)
+        self._events[name] = info
+        self._index(name, info)
+        return old, info
+
+    def _remove(self, name):
+        old = self._events.pop(name, None)
+        if old is None:
+            return None
+        self._unindex(name, old)
+        return old, None
+
+    def put(self, name, info):
+        '''
+        Adds or replaces an event.
+        '''
+        self.apply({name: info})
+
+    def put_document(self, name, document):
+        '''
+        Adds or replaces an event from its document in the database. The
+        document that held the general information is skipped.
+        '''
+        if name != self.settings_id:
+            self.put(name, self.decode(name, document))
+
+    def remove(self, name):
+        '''
+        Removes an event from the catalog, if it is present.
+        '''
+        self.apply(removed=[name])
+
+    def apply(self, events=None, removed=()):
+        '''
+        Adds or replaces many events (a dictionary of name to event) and
+        removes others, as one change: the version increases once, and the
+        version listeners are called once.
+        '''
+        with self._lock:
+            changes = [(name, self._put(name, info))
+                       for name, info in (events or {}).items()]
+            changes += [(name, self._remove(name)) for name in removed]
+            changes = [(name, change) for name, change in changes
+                       if change is not None]
+            if not changes:
+                return
+            self.version += 1
+
+        for name, (old, new) in changes:
+            self._notify(name, old, new)
+        self._notify_version()
+
+    def load(self, documents):
+        '''
+        Replaces the contents of the catalog with the given documents (a
+        dictionary of document id to document).
+        '''
+        with self._lock:
+            for name in set(self._events) - set(documents):
+                self.remove(name)
+            for name, document in documents.items():
+                self.put_document(name, document)
+            self.loaded = True
+
+    # ----- keeping up to date -----
+    def _on_snapshot(self, changes):
+        '''
+        Applies the (kind, document id, document) changes delivered by a
+        snapshot listener.
+        '''
+        for kind, name, document in changes:
+            if kind == 'REMOVED':
+                self.remove(name)
+            else:
+                self.put_document(name, document)
+        self.loaded = True
+
+    def start(self, repository, poll=None, interval=POLL_INTERVAL):
+        '''
+        Loads the events from the event repository and keeps the catalog in
+        sync with it.
+
+        Uses a snapshot listener if possible. The events are re-read every
+        interval seconds instead if poll is True, if poll is None and the
+        FIRESTORE_EMULATOR_HOST or CATALOG_POLL environment variable is set,
+        or if the repository cannot notify listeners.
+        '''
+        self.load(repository.get_all())
+        if poll is None:
+            poll = polling_requested('CATALOG_POLL')
+        self._sync.start(repository.on_snapshot, self._on_snapshot,
+                         lambda: self.load(repository.get_all()), poll,
+                         interval)
+
+    def stop(self):
+        '''
+        Stops listening for (or polling for) changes to the events.
+        '''
+        self._sync.stop()
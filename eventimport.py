@@ -0,0 +1,392 @@
+'''
+This module contains the functions used to edit many events at once: from a
+spreadsheet (an Excel file, or CSV text pasted by the admin), or by cloning
+every event of one Candidates' Weekend into another.
+
+Bulk editing happens in two steps, so that the admin can check the changes
+before anything is written:
+    - plan_changes - reads the spreadsheet and compares its events with the
+      event catalog, which gives the events to add, update and (optionally)
+      delete, and the rows that could not be read
+    - commit_changes - writes the changes to the database with batched
+      writes, up to WRITE_BATCH_SIZE documents per batch (see repositories),
+      and reports how long each batch took
+
+Cloning a weekend uses the same commit step: plan_clone gives the events to
+add to a weekend to make it a copy of another one, skipping the ones that
+were already copied, so that a clone that failed part of the way can be
+finished by running it again.
+
+Each event is a row with its name and Candidates' Weekend number (which make
+up its document id, like 'Lunch-1'), its day, times, location, description
+and access. The images of existing events are kept, and so are their
+location, description, access and links if the spreadsheet has no column
+for them (or, for the access, if the cell is blank). New events without an
+access are for everyone.
+'''
+import io
+import re
+import time
+from collections import namedtuple
+import pandas as pd
+from events import Event, Day, Access, get_links_dict, get_raw_name
+from repositories import WRITE_BATCH_SIZE
+from timeutil import parse_time, parse_times, clock_times, INVALID
+from userimport import FIRST_ROW, chunks, clean_string
+
+# Names that get_raw_name would shorten, because they end like a document id
+# ('Lunch-1'). Copies made by Duplicate Event ('Lunch-copy') are allowed.
+NUMBERED_NAME = re.compile(r'-[0-9]+$')
+
+# Spreadsheet column for each field of an event
+COLUMNS = {
+    'name': 'Name',
+    'cw_number': "Candidates' Weekend Number",
+    'day': 'Day',
+    'start_time': 'Start Time',
+    'end_time': 'End Time',
+    'location': 'Location',
+    'description': 'Description',
+    'access': 'Access',
+    'links': 'Links'
+}
+
+TIME_FIELDS = ('start_time', 'end_time')
+
+# Fields that are kept from the existing event if the spreadsheet has no
+# column for them
+OPTIONAL_FIELDS = ('location', 'description', 'access', 'links')
+
+# Fields shown in the preview, in order
+PREVIEW_FIELDS = ('day', 'start_time', 'end_time', 'location', 'description',
+                  'access', 'links')
+
+ADD = 'add'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# A change to one event: old is None for added events, and new is None for
+# deleted ones
+Change = namedtuple('Change', ['kind', 'name', 'old', 'new'])
+
+def read_sheet(source, filename=None):
+    '''
+    Reads a spreadsheet into a pandas DataFrame: an uploaded file (CSV if
+    its name ends with .csv, Excel otherwise), or CSV text.
+    '''
+    if isinstance(source, str):
+        return pd.read_csv(io.StringIO(source), dtype=str)
+    if filename is not None and filename.lower().endswith('.csv'):
+        return pd.read_csv(source, dtype=str)
+    return pd.read_excel(source)
+
+def clean_time(value):
+    '''
+    Converts a spreadsheet time (Excel cells hold datetime.time objects) to
+    a string.
+
+    >>> import datetime
+    >>> clean_time(datetime.time(9, 5)), clean_time('9:05')
+    ('09:05', '9:05')
+    '''
+    if hasattr(value, 'strftime'):
+        return value.strftime('%H:%M')
+    return clean_string(value)
+
+def read_event_records(file_df):
+    '''
+    Extracts the events from a spreadsheet (a pandas DataFrame).
+
+    Returns: a list of dictionaries (one per row), each with the row number
+    in the spreadsheet under 'row' and the event's fields. The fields in
+    OPTIONAL_FIELDS are None if the spreadsheet has no column for them.
+    '''
+    file_df = file_df.fillna('')
+
+    # Converts each column to a list of plain Python values at once
+    columns = {}
+    for field, column in COLUMNS.items():
+        if column not in file_df:
+            columns[field] = [None if field in OPTIONAL_FIELDS else ''] * \
+                             len(file_df)
+        elif field in TIME_FIELDS:
+            columns[field] = [clean_time(value)
+                              for value in file_df[column].tolist()]
+        else:
+            columns[field] = [clean_string(value)
+                              for value in file_df[column].tolist()]
+
+    # Stores times as 'HH:MM', keeping the text of values that are not times
+    # so that they can be reported
+    for field in TIME_FIELDS:
+        minutes = parse_times(columns[field])
+        columns[field] = [
+            time if parsed != INVALID else text for parsed, time, text in
+            zip(minutes.tolist(), clock_times(minutes), columns[field])]
+
+    records = []
+    for i in range(len(file_df)):
+        record = {field: values[i] for field, values in columns.items()}
+        record['row'] = i + FIRST_ROW
+        records.append(record)
+
+    return records
+
+def check_record(record):
+    '''
+    Returns why a row cannot be imported, or None if it can.
+
+    >>> record = {'name': 'Lunch', 'cw_number': '1', 'day': 'Friday',
+    ...           'start_time': '12:00', 'end_time': '13:00', 'access': ''}
+    >>> check_record(record) is None
+    True
+    >>> check_record(dict(record, name='Lunch-copy-copy')) is None
+    True
+    >>> check_record(dict(record, name='Lunch-2'))
+    'Event names cannot end with a dash and a number'
+    >>> check_record(dict(record, end_time='11:00'))
+    'End Time is before Start Time'
+    '''
+    if record['name'] == '' or record['cw_number'] == '':
+        return "Missing name or Candidates' Weekend number"
+    # The document id adds '-<number>' to the name, and get_raw_name takes
+    # off the last dash and what follows it
+    if NUMBERED_NAME.search(record['name']):
+        return 'Event names cannot end with a dash and a number'
+    if Day.parse(record['day']) is None:
+        return 'Unknown day: ' + record['day']
+    if record['access'] and Access.parse(record['access']) is None:
+        return 'Unknown access: ' + record['access']
+
+    start_min, end_min = (parse_time(record[field]) for field in TIME_FIELDS)
+    if start_min is None or end_min is None:
+        return 'Times must be written as HH:MM'
+    if end_min < start_min:
+        return 'End Time is before Start Time'
+    return None
+
+def make_event(record, old):
+    '''
+    Creates the event for a row of the spreadsheet, keeping the images of
+    the event it replaces, and its location, description, access and links
+    if the spreadsheet has none.
+
+    >>> tour = Event('Tour-1', '14:00', '15:00', 'Friday', 'Library',
+    ...              'A tour', '1', 'Parents')
+    >>> record = {'name': 'Tour', 'cw_number': '1', 'day': 'Friday',
+    ...           'start_time': '14:30', 'end_time': '15:00',
+    ...           'location': None, 'description': None, 'access': None,
+    ...           'links': None}
+    >>> event = make_event(record, tour)
+    >>> event.start_time, event.location, event.description, event.access
+    ('14:30', 'Library', 'A tour', <Access.PARENTS: 'Parents'>)
+    >>> make_event(dict(record, name='Lunch'), None).access
+    <Access.ALL: 'All'>
+    '''
+    def keep(field, value):
+        if value is not None:
+            return value
+        return getattr(old, field) if old is not None else None
+
+    links = get_links_dict(record['links']) if record['links'] is not None \
+            else keep('links', None)
+    access = record['access'] or keep('access', None) or Access.ALL.value
+    return Event(record['name'] + '-' + record['cw_number'],
+                 record['start_time'], record['end_time'], record['day'],
+                 keep('location', record['location']) or '',
+                 keep('description', record['description']) or '',
+                 record['cw_number'], access,
+                 old.img_files if old is not None else None, links)
+
+def failure(record, reason):
+    '''
+    Returns the report entry for a row that could not be imported.
+    '''
+    return {'row': record['row'], 'name': record['name'],
+            'cw_number': record['cw_number'], 'error': reason}
+
+def plan_changes(records, current, delete_missing=False):
+    '''
+    Compares the events of a spreadsheet with the current events.
+
+    Inputs:
+    records - the rows of the spreadsheet (see read_event_records)
+    current - the current events, by name
+    delete_missing - whether to delete the events of the spreadsheet's
+                     weekends that are not in the spreadsheet
+
+    Returns: (changes, errors), where changes is a list of Change and errors
+    is a list with one dictionary per row that could not be read
+
+    >>> lunch = Event('Lunch-1', '12:00', '13:00', 'Friday', '', '', '1', 'All')
+    >>> tour = Event('Tour-1', '14:00', '15:00', 'Friday', '', '', '1', 'All')
+    >>> records = [{'row': 2, 'name': 'Lunch', 'cw_number': '1',
+    ...             'day': 'Friday', 'start_time': '12:30', 'end_time': '13:00',
+    ...             'location': '', 'description': '', 'access': 'All',
+    ...             'links': None},
+    ...            {'row': 3, 'name': 'Dinner', 'cw_number': '1',
+    ...             'day': 'Friday', 'start_time': '18:00', 'end_time': '19:00',
+    ...             'location': '', 'description': '', 'access': '',
+    ...             'links': None}]
+    >>> changes, errors = plan_changes(records, {'Lunch-1': lunch,
+    ...                                          'Tour-1': tour}, True)
+    >>> [(change.kind, change.name) for change in changes], errors
+    ([('update', 'Lunch-1'), ('add', 'Dinner-1'), ('delete', 'Tour-1')], [])
+    '''
+    changes = []
+    errors = []
+    seen = set()
+    for record in records:
+        reason = check_record(record)
+        name = record['name'] + '-' + record['cw_number']
+        if reason is None and name in seen:
+            reason = 'Duplicate event'
+        if reason is not None:
+            errors.append(failure(record, reason))
+            continue
+        seen.add(name)
+
+        old = current.get(name)
+        new = make_event(record, old)
+        if old is None:
+            changes.append(Change(ADD, name, None, new))
+        elif new != old:
+            changes.append(Change(UPDATE, name, old, new))
+
+    # Only deletes events of the weekends that the spreadsheet is about
+    if delete_missing:
+        weekends = {name.rsplit('-', 1)[1] for name in seen}
+        changes += [Change(DELETE, name, event, None)
+                    for name, event in sorted(current.items())
+                    if event.cw_number in weekends and name not in seen]
+
+    return changes, errors
+
+def plan_clone(source_cw, target_cw, current, overwrite=False):
+    '''
+    Finds the changes that copy every event of one Candidates' Weekend into
+    another. Each copy gets the target weekend's number in place of the
+    source's at the end of its name (so 'Lunch-1' becomes 'Lunch-2') and
+    shares the original's images, without uploading them again.
+
+    Inputs:
+    source_cw - the number of the weekend to copy
+    target_cw - the number of the weekend to copy it into
+    current - the current events, by name
+    overwrite - whether to replace the target weekend's events that differ
+                from the source's (otherwise they are skipped)
+
+    Returns: (changes, skipped), where skipped is the names of the target
+    weekend's events that differ from the source's and were kept. Events
+    that were already copied are in neither, so planning the same clone
+    again after it is done gives no changes.
+
+    >>> lunch = Event('Lunch-1', '12:00', '13:00', 'Friday', '', '', '1', 'All',
+    ...               [{'name': 'lunch.jpg'}])
+    >>> tour = Event('Tour-1', '14:00', '15:00', 'Friday', '', '', '1', 'All')
+    >>> changes, skipped = plan_clone('1', '2', {'Lunch-1': lunch,
+    ...                                          'Tour-1': tour})
+    >>> [(change.kind, change.name) for change in changes]
+    [('add', 'Lunch-2'), ('add', 'Tour-2')]
+    >>> changes[0].new.cw_number, changes[0].new.img_files
+    ('2', ({'name': 'lunch.jpg'},))
+    >>> plan_clone('1', '2', {'Lunch-1': lunch, 'Tour-1': tour,
+    ...                       'Lunch-2': changes[0].new,
+    ...                       'Tour-2': tour.replace(name='Tour-2',
+    ...                                              cw_number='2',
+    ...                                              location='Quad')})
+    ([], ['Tour-2'])
+    '''
+    changes = []
+    skipped = []
+    for name, event in sorted(current.items()):
+        if event.cw_number != source_cw:
+            continue
+        target_name = get_raw_name(name) + '-' + target_cw
+        new = event.replace(name=target_name, cw_number=target_cw)
+        old = current.get(target_name)
+        if old is None:
+            changes.append(Change(ADD, target_name, None, new))
+        elif old == new:
+            continue
+        elif overwrite:
+            changes.append(Change(UPDATE, target_name, old, new))
+        else:
+            skipped.append(target_name)
+    return changes, skipped
+
+def describe_change(change):
+    '''
+    Returns a change for the preview, with the fields that it changes as
+    (field, old value, new value) tuples.
+    '''
+    old = change.old.to_dict() if change.old is not None else {}
+    new = change.new.to_dict() if change.new is not None else {}
+    fields = [(field, old.get(field, ''), new.get(field, ''))
+              for field in PREVIEW_FIELDS
+              if old.get(field, '') != new.get(field, '')]
+    return {'kind': change.kind, 'name': change.name, 'fields': fields}
+
+def encode_changes(changes):
+    '''
+    Converts changes to a list that can be stored as JSON, until the admin
+    commits them.
+    '''
+    return [{'kind': change.kind, 'name': change.name,
+             'old': change.old.to_dict() if change.old is not None else None,
+             'new': change.new.to_dict() if change.new is not None else None}
+            for change in changes]
+
+def decode_changes(data):
+    '''
+    Creates the changes stored by encode_changes.
+    '''
+    return [Change(entry['kind'], entry['name'],
+                   Event.from_dict(entry['name'], entry['old'])
+                   if entry['old'] is not None else None,
+                   Event.from_dict(entry['name'], entry['new'])
+                   if entry['new'] is not None else None)
+            for entry in data]
+
+def find_stale(changes, current):
+    '''
+    Returns the names of the events that changed after the changes were
+    planned (so the changes would overwrite someone else's edits).
+    '''
+    return [change.name for change in changes
+            if current.get(change.name) != change.old]
+
+def commit_changes(event_repository, changes, job=None, committed=None):
+    '''
+    Writes changes to the database, in batches of up to WRITE_BATCH_SIZE
+    documents. If the commit runs as a background job, its progress is
+    recorded on the job. The changes are added to the committed list (if
+    one is given) as their batches are committed, so that the caller knows
+    which changes were written if a later batch fails.
+
+    Returns: a report with the number of events added, updated and deleted,
+    and the number of documents and time of each batch
+    '''
+    operations = [change for change in changes if change.kind != DELETE] + \
+                 [change for change in changes if change.kind == DELETE]
+    batches = []
+    start = time.perf_counter()
+    for batch_changes in chunks(operations, WRITE_BATCH_SIZE):
+        batch_start = time.perf_counter()
+        event_repository.write_batch(
+            sets=[(change.name, change.new.to_dict())
+                  for change in batch_changes if change.kind != DELETE],
+            deletes=[change.name for change in batch_changes
+                     if change.kind == DELETE])
+        batches.append({'documents': len(batch_changes),
+                        'seconds': time.perf_counter() - batch_start})
+        if committed is not None:
+            committed.extend(batch_changes)
+        if job is not None:
+            job.progress(sum(batch['documents'] for batch in batches) /
+                         len(operations))
+
+    kinds = [change.kind for change in changes]
+    return {'added': kinds.count(ADD), 'updated': kinds.count(UPDATE),
+            'deleted': kinds.count(DELETE), 'documents': len(operations),
+            'batches': batches, 'seconds': time.perf_counter() - start}
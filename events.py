@@ -5,7 +5,8 @@ This includes:
     Functions involved in creating/updating events:
         - allowed_file - a function that checks to see if an uploaded file is
           a valid file type (used to validate files associated with events)
-        - the Event class - the object representation of an event
+        - the Event class - the object representation of an event, with the
+          Day and Access enumerations for its day and who can attend it
         - get_links_dict - a function that takes in a string of text defining links
           and converts them into a dictionary, so that they can be stored in the
           database
@@ -18,6 +19,10 @@ This includes:
           description for text and converts it into a list, so that line breaks
           can be preserved
 '''
+from types import MappingProxyType
+from records import Record, TextEnum
+from timeutil import parse_time, clock_time
+
 ALLOWED_EXTENSIONS = set(['png', 'jpg', 'jpeg', 'gif'])
 
 def allowed_file(filename):
@@ -34,10 +39,38 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-class Event():
+class Day(TextEnum):
+    '''
+    The days of Candidates' Weekend.
+    '''
+    FRIDAY = 'Friday'
+    SATURDAY = 'Saturday'
+
+class Access(TextEnum):
+    '''
+    Who can attend an event.
     '''
-    Events that occur during Candidates' Weekend.
+    ALL = 'All'
+    CANDIDATES = 'Candidates'
+    PARENTS = 'Parents'
+
+class Event(Record):
     '''
+    Events that occur during Candidates' Weekend. Events are immutable.
+
+    >>> event = Event('Lunch-1', '12:00', '13:30', 'Friday', 'Dining Hall',
+    ...               'Food!', '1', 'All')
+    >>> event.start_min, event.end_time, event.day is Day.FRIDAY
+    (720, '13:30', True)
+    >>> Event.from_dict('Lunch-1', event.to_dict()) == event
+    True
+    >>> Event('Tour-1', 'TBD', '', 'Sunday', '', '', '1', '').to_dict()['day']
+    'Sunday'
+    '''
+    __slots__ = ('name', 'start_min', 'end_min', 'day', 'location',
+                 'description', 'cw_number', 'access', 'img_files', 'links',
+                 'unparsed')
+
     def __init__(self, name, start_time, end_time, day, location,
                  description, cw_number, access, img_files=None,
                  links_dict=None):
@@ -46,47 +79,86 @@ class Event():
 
         Attributes:
         name: name of the event
-        start_time: starting time
-        end_time: ending time
-        day: which day the event will take place on (friday or saturday)
+        start_time: starting time, as 'HH:MM' or as minutes after midnight
+                    (kept as minutes in start_min)
+        end_time: ending time, in the same formats (kept in end_min)
+        day: which day the event will take place on (a Day)
         location: place where event occurs
         description: string describing the event
                     /more information about the event
-        img_files: any related files (must be PDFs)
+        img_files: any related images, as a tuple of dictionaries with the
+                   link to the image and the links to its resized variants
+                   (see the imaging module)
         cw_number: string denoting which candidates' weekend the
                    schedule is displaying
-        access: string denoting who can attend the event (candidates only,
+        access: who can attend the event (an Access: candidates only,
                 guests only, or all)
         links: the dictionary of links, with the key being the link itself
                and the value being the text to e displayed for each link
         '''
-        self.name = name
-        self.start_time = start_time
-        self.end_time = end_time
-        self.day = day
-        self.location = location
-        self.description = description
-        self.img_files = img_files
-        self.cw_number = cw_number
-        self.links = links_dict
-        self.access = access
+        unparsed = {}
+        self._set('name', name)
+        self._parse('start_min', parse_time, start_time, unparsed)
+        self._parse('end_min', parse_time, end_time, unparsed)
+        self._parse('day', Day.parse, day, unparsed)
+        self._set('location', location)
+        self._set('description', description)
+        self._set('cw_number', cw_number)
+        self._parse('access', Access.parse, access, unparsed)
+        self._set('img_files', tuple(img_files or ()))
+        self._set('links', MappingProxyType(dict(links_dict or {})))
+        self._set_unparsed(unparsed)
+
+    @property
+    def start_time(self):
+        '''
+        The starting time, as 'HH:MM'.
+        '''
+        return clock_time(self.start_min)
+
+    @property
+    def end_time(self):
+        '''
+        The ending time, as 'HH:MM'.
+        '''
+        return clock_time(self.end_min)
+
+    @classmethod
+    def from_dict(cls, name, event_dict):
+        '''
+        Creates an event from its document in the database.
+        '''
+        return cls(name, event_dict.get('start_time'),
+                   event_dict.get('end_time'), event_dict.get('day'),
+                   event_dict.get('location'), event_dict.get('description'),
+                   event_dict.get('cw_number'), event_dict.get('access'),
+                   event_dict.get('img_files'), event_dict.get('links'))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        '''
+        Creates an event from a Firestore document snapshot.
+        '''
+        return cls.from_dict(snapshot.id, snapshot.to_dict())
 
     def to_dict(self):
         '''
         Stores object data in a dictionary so
-        that it can be stored in database.
+        that it can be stored in database. Values that could not be parsed
+        are stored as they were.
         '''
         event_dict = {
             'name': self.name,
-            'start_time': self.start_time,
-            'end_time': self.end_time,
-            'day': self.day,
+            'start_time': self._stored('start_min', self.start_time),
+            'end_time': self._stored('end_min', self.end_time),
+            'day': self._stored('day', self.day.value if self.day else ''),
             'location': self.location,
             'description': self.description,
-            'img_files': self.img_files,
+            'img_files': list(self.img_files),
             'cw_number': self.cw_number,
-            'links': self.links,
-            'access': self.access
+            'links': dict(self.links),
+            'access': self._stored('access',
+                                   self.access.value if self.access else '')
         }
 
         return event_dict
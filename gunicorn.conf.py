@@ -0,0 +1,33 @@
+'''
+gunicorn settings for running the web app in production:
+
+    gunicorn --config gunicorn.conf.py wsgi:application
+
+The number of worker processes, the worker class and the number of threads
+per worker can be set with environment variables. The app is not preloaded
+in the master process: each worker imports it after being forked, so that
+the Firebase clients (which use threads and network connections that do not
+survive a fork) are created in the worker.
+'''
+import multiprocessing
+import os
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+
+# Heroku sets WEB_CONCURRENCY from the size of the dyno
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             min(4, multiprocessing.cpu_count() * 2)))
+
+# Tells the workers how many of them there are, so that their password
+# hashing pools share the cores instead of each starting one per core
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+preload_app = False
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
@@ -0,0 +1,221 @@
+'''
+This module contains the image pipeline for event images.
+
+Uploaded images have their EXIF data (like camera and location information)
+removed before they are stored. For each image, the pipeline then creates
+smaller copies (variants) for thumbnails, phones and larger screens, in both
+WebP and JPEG. The variants are stored in the same bucket as the original,
+under names that include a hash of their contents.
+
+Event images are stored in an event's img_files as dictionaries:
+    - src - the link to the original image
+    - name - the name of the original image in the bucket
+    - filename - the name of the file that was uploaded
+    - variants - a list with the name, link, size, width and format of each
+      variant (added once the variants have been created)
+    - srcset - for each format, the srcset attribute listing its variants,
+      so that browsers can pick the smallest image that fits the screen
+    - fallback - the link to the largest JPEG variant, for browsers that
+      cannot pick from the srcsets
+Older events store plain links instead, which templates still display.
+'''
+import hashlib
+import io
+import os
+from PIL import Image, ImageOps
+
+# Largest width (in pixels) of each variant
+VARIANT_WIDTHS = (('thumb', 320), ('mobile', 800), ('full', 1600))
+
+# Pillow format name, file extension and content type of each format
+FORMATS = (('WEBP', 'webp', 'image/webp'), ('JPEG', 'jpg', 'image/jpeg'))
+QUALITY = 80
+
+def get_image_entry(name, link, filename=None):
+    '''
+    Returns the img_files entry for an uploaded image that has no variants
+    yet.
+
+    >>> get_image_entry('0a1b.jpg', 'https://example.com/0a1b.jpg', 'map.jpg')
+    {'src': 'https://example.com/0a1b.jpg', 'name': '0a1b.jpg', 'filename': 'map.jpg'}
+    '''
+    return {'src': link, 'name': name, 'filename': filename or name}
+
+def get_image_src(img_file):
+    '''
+    Returns the link to display for an img_files entry, which is either a
+    dictionary or (for older events) the link itself.
+
+    >>> get_image_src({'src': 'a.jpg', 'name': 'a.jpg'}), get_image_src('b.jpg')
+    ('a.jpg', 'b.jpg')
+    '''
+    if isinstance(img_file, dict):
+        return img_file['src']
+    return img_file
+
+def get_image_fallback(img_file):
+    '''
+    Returns the link that browsers which cannot pick from the srcsets show
+    for an img_files entry: its largest JPEG variant, or the original image
+    if it has no variants yet.
+
+    >>> get_image_fallback({'src': 'a.jpg', 'name': 'a.jpg',
+    ...                     'fallback': 'a-full.jpg'})
+    'a-full.jpg'
+    >>> get_image_fallback({'src': 'a.jpg', 'name': 'a.jpg'})
+    'a.jpg'
+    '''
+    if isinstance(img_file, dict) and img_file.get('fallback'):
+        return img_file['fallback']
+    return get_image_src(img_file)
+
+def remove_metadata(file_obj):
+    '''
+    Removes the EXIF data from an uploaded image, turning the image the
+    right way up since its orientation tag is not kept. Images without EXIF
+    data (and files that are not images) are not decoded.
+
+    Returns: a file object with the image, which is file_obj itself if
+    nothing was removed
+    '''
+    file_obj.seek(0)
+    try:
+        image = Image.open(file_obj)
+        exif = image.getexif()
+    except (OSError, SyntaxError):
+        exif = None
+    if not exif:
+        file_obj.seek(0)
+        return file_obj
+
+    image_format = image.format
+    image = ImageOps.exif_transpose(image)
+    # Saving without exif= drops the EXIF data, except where Pillow copies
+    # it from the image's info
+    image.info.pop('exif', None)
+
+    output = io.BytesIO()
+    image.save(output, image_format, quality=95)
+    output.seek(0)
+    return output
+
+def get_variant_name(original_name, variant, data, extension):
+    '''
+    Returns the name a variant is stored under: the original's name, the
+    variant and the start of the SHA-256 hash of the variant's contents.
+
+    >>> get_variant_name('map.jpg', 'thumb', b'abc', 'webp')
+    'map-thumb-ba7816bf8f01cfea.webp'
+    '''
+    stem = os.path.splitext(original_name)[0]
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    return '{}-{}-{}.{}'.format(stem, variant, digest, extension)
+
+def get_srcset(variants, extension):
+    '''
+    Returns the srcset attribute listing the variants in one format.
+
+    >>> get_srcset([{'url': 'a.webp', 'width': 320, 'extension': 'webp'},
+    ...             {'url': 'b.webp', 'width': 800, 'extension': 'webp'}],
+    ...            'webp')
+    'a.webp 320w, b.webp 800w'
+    '''
+    return ', '.join('{} {}w'.format(variant['url'], variant['width'])
+                     for variant in variants
+                     if variant['extension'] == extension)
+
+def resize_image(image, width):
+    '''
+    Returns a copy of an image that is at most width pixels wide, keeping its
+    proportions. Images are never made larger.
+    '''
+    if image.width <= width:
+        return image.copy()
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+def make_variants(data):
+    '''
+    Creates the variants of an image.
+
+    Inputs:
+    data - the contents of the original image file, as bytes
+
+    Returns: a list of dictionaries with the variant's name (like 'thumb'),
+    its width, its Pillow format, file extension, content type and contents
+    '''
+    image = Image.open(io.BytesIO(data))
+
+    # Turns the image the right way up, since the EXIF orientation tag is
+    # not kept
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              else 'RGB')
+
+    variants = []
+    widths_done = set()
+    for variant, width in VARIANT_WIDTHS:
+        resized = resize_image(image, width)
+
+        # Skips variants that would be the same size as a smaller one
+        if resized.width in widths_done:
+            continue
+        widths_done.add(resized.width)
+
+        for image_format, extension, content_type in FORMATS:
+            output = io.BytesIO()
+            # JPEG has no transparency; saving without exif= drops the
+            # EXIF data
+            to_save = resized.convert('RGB') if image_format == 'JPEG' \
+                      else resized
+            to_save.save(output, image_format, quality=QUALITY,
+                         optimize=image_format == 'JPEG')
+            variants.append({'variant': variant,
+                             'width': resized.width,
+                             'format': image_format,
+                             'extension': extension,
+                             'content_type': content_type,
+                             'data': output.getvalue()})
+    return variants
+
+def add_variants(bucket, img_file):
+    '''
+    Creates and uploads the variants of an event image.
+
+    Inputs:
+    bucket - the Firebase Storage bucket (or a LocalBucket)
+    img_file - the image's img_files entry, with the name of the original
+
+    Returns: the img_files entry with the variants and srcsets added
+    '''
+    original = bucket.get_blob(img_file['name'])
+    variants = make_variants(original.download_as_string())
+
+    stored = []
+    for variant in variants:
+        name = get_variant_name(img_file['name'], variant['variant'],
+                                variant['data'], variant['extension'])
+        # Variants are named after their contents, so a stored variant with
+        # the same name is the same file
+        blob = bucket.get_blob(name)
+        if blob is None:
+            blob = bucket.blob(name)
+            blob.upload_from_string(variant['data'],
+                                    content_type=variant['content_type'])
+            blob.make_public()
+        stored.append({'name': name,
+                       'url': blob.media_link,
+                       'variant': variant['variant'],
+                       'width': variant['width'],
+                       'extension': variant['extension'],
+                       'size': len(variant['data'])})
+
+    entry = dict(img_file)
+    entry['variants'] = stored
+    entry['srcset'] = {extension: get_srcset(stored, extension)
+                       for image_format, extension, content_type in FORMATS}
+    entry['fallback'] = max(
+        (variant for variant in stored if variant['extension'] == 'jpg'),
+        key=lambda variant: variant['width'])['url']
+    return entry
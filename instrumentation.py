@@ -0,0 +1,323 @@
+'''
+This module measures where the time of each request goes.
+
+The backends (the repositories, the Storage bucket and authentication) are
+wrapped in InstrumentedProxy objects, and slow functions (like template
+rendering, password hashing and get_media_link) are wrapped with timed().
+While a request is handled, every call is recorded in the request's
+RequestProfile, by category ('database', 'storage', 'auth', 'render',
+'hash', 'media') and by operation (like 'database.get').
+
+At the end of each request, the Instrumentation class:
+    - adds a Server-Timing header with the count and time of each category,
+      which browsers show in their developer tools
+    - logs one line of JSON for the request
+    - adds the request to the statistics of its route, which the admin can
+      see (along with the N+1 patterns found, like a page that calls
+      get_media_link once per image) with report()
+'''
+import functools
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+# Number of calls to the same operation in one request from which the
+# request is reported as an N+1 pattern
+N_PLUS_ONE_CALLS = 3
+
+# Number of recent requests kept per route to compute percentiles
+ROUTE_HISTORY = 500
+
+LOGGER = logging.getLogger('cw.requests')
+
+_local = threading.local()
+
+# ----- RECORDING CALLS -----
+class RequestProfile():
+    '''
+    The backend calls made while handling one request.
+
+    >>> profile = RequestProfile('GET', '/schedule/<user_id>')
+    >>> profile.record('media', 'get_media_link', 0.002)
+    >>> profile.record('media', 'get_media_link', 0.001)
+    >>> profile.record('database', 'get', 0.010)
+    >>> profile.server_timing()
+    'database;dur=10.0;desc="1 call", media;dur=3.0;desc="2 calls"'
+    >>> profile.repeated(2)
+    {'media.get_media_link': 2}
+    '''
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.counts = Counter()
+        self.times = Counter()
+        self.operations = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, category, name, seconds):
+        '''
+        Records one call.
+        '''
+        with self._lock:
+            self.counts[category] += 1
+            self.times[category] += seconds
+            self.operations[category + '.' + name] += 1
+
+    def finish(self, status):
+        '''
+        Records the end of the request.
+        '''
+        self.duration = time.perf_counter() - self.started
+        self.status = status
+
+    def repeated(self, calls=N_PLUS_ONE_CALLS):
+        '''
+        Returns the operations that were called at least calls times.
+        '''
+        return {name: count for name, count in sorted(self.operations.items())
+                if count >= calls}
+
+    def server_timing(self):
+        '''
+        Returns the value of the Server-Timing header for the request.
+        '''
+        metrics = ['{};dur={:.1f};desc="{} call{}"'.format(
+            category, self.times[category] * 1000, count,
+            '' if count == 1 else 's')
+                   for category, count in sorted(self.counts.items())]
+        if self.duration is not None:
+            metrics.append('total;dur={:.1f}'.format(self.duration * 1000))
+        return ', '.join(metrics)
+
+    def to_dict(self):
+        '''
+        Returns the profile as a dictionary, for logging.
+        '''
+        return {'method': self.method,
+                'route': self.route,
+                'status': self.status,
+                'duration_ms': round((self.duration or 0) * 1000, 2),
+                'calls': dict(self.counts),
+                'times_ms': {category: round(seconds * 1000, 2)
+                             for category, seconds in self.times.items()},
+                'repeated': self.repeated()}
+
+BACKGROUND = RequestProfile(None, None)
+
+def current_profile():
+    '''
+    Returns the profile of the request being handled by this thread, or the
+    BACKGROUND profile if there is none.
+    '''
+    return getattr(_local, 'profile', None) or BACKGROUND
+
+def record(category, name, seconds):
+    '''
+    Records a call in the current request's profile.
+    '''
+    current_profile().record(category, name, seconds)
+
+def timed(category, name=None):
+    '''
+    Decorator that records every call of a function under a category.
+
+    >>> @timed('media')
+    ... def get_link(name):
+    ...     return name
+    >>> get_link('a'), BACKGROUND.operations['media.get_link'] > 0
+    ('a', True)
+    '''
+    def decorator(function):
+        operation = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(category, operation, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+def bind(function):
+    '''
+    Returns a version of a function that records its calls in the current
+    request's profile, even when it runs in another thread (like the upload
+    threads).
+    '''
+    profile = getattr(_local, 'profile', None)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'profile', None)
+        _local.profile = profile
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.profile = previous
+
+    return wrapper
+
+class InstrumentedProxy():
+    '''
+    Wraps a backend object (a repository, a Storage bucket or the
+    authentication client) and records every method call on it.
+
+    Objects returned by the wrapped methods that have methods of their own
+    (like Storage blobs) are wrapped as well.
+    '''
+    def __init__(self, wrapped, category):
+        self._wrapped = wrapped
+        self._category = category
+
+    def __getattr__(self, name):
+        attribute = getattr(self._wrapped, name)
+        if not callable(attribute):
+            return attribute
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+            finally:
+                record(self._category, name, time.perf_counter() - start)
+            if hasattr(result, 'make_public'):
+                return InstrumentedProxy(result, self._category)
+            return result
+
+        return wrapper
+
+# ----- ROUTE STATISTICS -----
+class RouteStats():
+    '''
+    Timings of the recent requests to one route.
+    '''
+    def __init__(self):
+        self.requests = 0
+        self.durations = deque(maxlen=ROUTE_HISTORY)
+        self.counts = Counter()
+        self.times = Counter()
+        self.repeated = Counter()
+        self.max_repeated = Counter()
+
+    def add(self, profile):
+        '''
+        Adds a finished request.
+        '''
+        self.requests += 1
+        self.durations.append(profile.duration)
+        self.counts.update(profile.counts)
+        self.times.update(profile.times)
+        for name, count in profile.repeated().items():
+            self.repeated[name] += 1
+            self.max_repeated[name] = max(self.max_repeated[name], count)
+
+    def summary(self):
+        '''
+        Returns the statistics as a dictionary. Times are in milliseconds.
+        '''
+        durations = sorted(self.durations)
+        return {'requests': self.requests,
+                'p50_ms': durations[len(durations) // 2] * 1000,
+                'p95_ms': durations[int(len(durations) * 0.95)] * 1000,
+                'max_ms': durations[-1] * 1000,
+                'calls_per_request': {
+                    category: count / self.requests
+                    for category, count in sorted(self.counts.items())},
+                'ms_per_request': {
+                    category: self.times[category] * 1000 / self.requests
+                    for category in sorted(self.times)}}
+
+class Instrumentation():
+    '''
+    Profiles every request of a Flask app.
+    '''
+    def __init__(self, app=None):
+        self.routes = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''
+        Registers the request hooks with a Flask app.
+        '''
+        from flask import request
+
+        @app.before_request
+        def start_profile():
+            rule = request.url_rule.rule if request.url_rule else request.path
+            _local.profile = RequestProfile(request.method, rule)
+
+        @app.after_request
+        def finish_profile(response):
+            profile = getattr(_local, 'profile', None)
+            if profile is not None:
+                profile.finish(response.status_code)
+                response.headers['Server-Timing'] = profile.server_timing()
+            return response
+
+        # Runs even for requests that raised (which never reach
+        # after_request), so that failed requests are recorded too and
+        # their profile does not carry over to the thread's next request
+        @app.teardown_request
+        def record_profile(error=None):
+            profile = getattr(_local, 'profile', None)
+            _local.profile = None
+            if profile is not None:
+                if profile.status is None:
+                    profile.finish(500)
+                self.add(profile)
+
+    def subscribe(self, listener):
+        '''
+        Registers a function to be called as listener(profile) after each
+        request.
+        '''
+        self._listeners.append(listener)
+
+    def add(self, profile):
+        '''
+        Logs a finished request and adds it to its route's statistics.
+        '''
+        LOGGER.info(json.dumps(profile.to_dict(), sort_keys=True))
+
+        key = profile.method + ' ' + profile.route
+        with self._lock:
+            self.routes.setdefault(key, RouteStats()).add(profile)
+        for listener in self._listeners:
+            listener(profile)
+
+    def report(self, limit=20):
+        '''
+        Returns the slowest routes (by 95th percentile latency) and the N+1
+        patterns found, as a dictionary.
+        '''
+        with self._lock:
+            summaries = {key: stats.summary()
+                         for key, stats in self.routes.items()}
+            patterns = [{'route': key, 'operation': name,
+                         'requests': stats.repeated[name],
+                         'share_of_requests': stats.repeated[name] /
+                                              stats.requests,
+                         'max_calls': stats.max_repeated[name]}
+                        for key, stats in self.routes.items()
+                        for name in stats.repeated]
+
+        slowest = sorted(summaries, key=lambda key: summaries[key]['p95_ms'],
+                         reverse=True)[:limit]
+        patterns.sort(key=lambda pattern: (pattern['max_calls'],
+                                           pattern['requests']), reverse=True)
+        return {'slowest_routes': [dict(summaries[key], route=key)
+                                   for key in slowest],
+                'n_plus_one': patterns[:limit],
+                'background_calls': dict(BACKGROUND.counts)}
@@ -0,0 +1,283 @@
+'''
+This module contains a small background job system for long-running admin
+operations, like importing users.
+
+Jobs run on a thread pool, and every job is recorded in a SQLite table, with
+its status, progress, result, duration and the time taken by each of its
+steps. Because the table is on disk, jobs that were queued or running when
+a worker stopped are picked up again when the app restarts.
+
+A job is a function registered under a name (its kind), which is called as
+function(job, **args), where job is a Job that the function can use to
+report progress and time its steps. The arguments and results must be
+JSON-serializable, so that they can be stored.
+
+A job can be queued to run after a delay. Until then it waits on a timer,
+not on one of the pool's threads, so it does not hold up other jobs.
+'''
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner INTEGER,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    steps TEXT NOT NULL DEFAULT '[]',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL
+)
+'''
+
+def process_alive(pid):
+    '''
+    Checks whether a process with the given id is running.
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class Job():
+    '''
+    The handle a running job uses to report its progress.
+    '''
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+        self.steps = []
+
+    def progress(self, fraction, message=None):
+        '''
+        Records how much of the job is done, as a fraction from 0 to 1.
+        '''
+        self.queue._update(self.id, progress=fraction, message=message)
+
+    @contextmanager
+    def step(self, name):
+        '''
+        Times a step of the job, and records it in the job table.
+        '''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.steps.append({'name': name,
+                               'duration': time.time() - start})
+            self.queue._update(self.id, steps=json.dumps(self.steps),
+                               message=name)
+
+class JobQueue():
+    '''
+    A thread pool that runs jobs recorded in a SQLite table.
+
+    >>> queue = JobQueue(':memory:')
+    >>> @queue.task('add')
+    ... def add(job, a, b):
+    ...     with job.step('adding'):
+    ...         return a + b
+    >>> job_id = queue.enqueue('add', a=1, b=2)
+    >>> while not queue.get(job_id)['done']:
+    ...     time.sleep(0.01)
+    >>> job = queue.get(job_id)
+    >>> job['status'], job['result'], [step['name'] for step in job['steps']]
+    ('succeeded', 3, ['adding'])
+    >>> @queue.task('unstorable')
+    ... def unstorable(job):
+    ...     return object()
+    >>> job_id = queue.enqueue('unstorable')
+    >>> while not queue.get(job_id)['done']:
+    ...     time.sleep(0.01)
+    >>> queue.get(job_id)['status']
+    'failed'
+    >>> later = queue.enqueue('add', delay=60, a=1, b=2)
+    >>> time.sleep(0.1); queue.get(later)['status']
+    'queued'
+    '''
+    def __init__(self, path, workers=2):
+        '''
+        Creates a job queue.
+
+        Attributes:
+        path: the path of the SQLite database file holding the job table, or
+              ':memory:' for a table that only lasts as long as the queue
+        workers: the number of jobs that can run at the same time
+        '''
+        self.path = path
+        # Every thread has its own connection, so an in-memory table has to
+        # be shared between the connections
+        if path == ':memory:':
+            self._database = 'file:jobs-{}?mode=memory&cache=shared'.format(
+                uuid.uuid4().hex)
+        else:
+            self._database = path
+        self.workers = workers
+        self.tasks = {}
+        self._executor = None
+        self._local = threading.local()
+
+    def _connection(self):
+        '''
+        Returns this thread's connection to the job table.
+        '''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._database, timeout=30,
+                                         isolation_level=None,
+                                         uri=self.path == ':memory:')
+            connection.row_factory = sqlite3.Row
+            connection.execute(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(name + ' = ?' for name in fields)
+        self._connection().execute(
+            'UPDATE jobs SET ' + assignments + ' WHERE id = ?',
+            list(fields.values()) + [job_id])
+
+    def task(self, kind):
+        '''
+        Decorator that registers a function as the job of the given kind.
+        '''
+        def register(function):
+            self.tasks[kind] = function
+            return function
+        return register
+
+    def start(self):
+        '''
+        Starts the thread pool and resumes the jobs that were queued, or that
+        were running in a process that has since stopped.
+        '''
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        connection = self._connection()
+        for row in connection.execute(
+                'SELECT id, owner FROM jobs WHERE status = ?', (RUNNING,)):
+            if row['owner'] is None or not process_alive(row['owner']):
+                connection.execute(
+                    'UPDATE jobs SET status = ?, owner = NULL '
+                    'WHERE id = ? AND status = ?', (QUEUED, row['id'], RUNNING))
+
+        for row in connection.execute(
+                'SELECT id, not_before FROM jobs WHERE status = ? '
+                'ORDER BY created_at', (QUEUED,)).fetchall():
+            self._submit(row['id'], row['not_before'])
+
+    def _submit(self, job_id, not_before):
+        '''
+        Hands a job to the thread pool, at once or (with a timer) once its
+        not_before time has come.
+        '''
+        delay = not_before - time.time()
+        if delay <= 0:
+            self._executor.submit(self._run, job_id)
+            return
+        timer = threading.Timer(delay, self._executor.submit,
+                                (self._run, job_id))
+        timer.daemon = True
+        timer.start()
+
+    def enqueue(self, kind, delay=0, **args):
+        '''
+        Records a job and queues it to run, after delay seconds if a delay
+        is given.
+
+        Returns: the id of the job
+        '''
+        if kind not in self.tasks:
+            raise KeyError('Unknown job kind: ' + kind)
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            'INSERT INTO jobs (id, kind, args, status, not_before, '
+            'created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(args), QUEUED, now + delay, now))
+
+        self.start()
+        self._submit(job_id, now + delay)
+        return job_id
+
+    def _claim(self, job_id):
+        '''
+        Marks a queued job as running in this process. Returns False if
+        another thread or process claimed it first, or if it is not time to
+        run it yet.
+        '''
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE jobs SET status = ?, owner = ?, started_at = ?, '
+            'attempts = attempts + 1 '
+            'WHERE id = ? AND status = ? AND not_before <= ?',
+            (RUNNING, os.getpid(), now, job_id, QUEUED, now))
+        return cursor.rowcount == 1
+
+    def _run(self, job_id):
+        if not self._claim(job_id):
+            return
+
+        row = self._connection().execute(
+            'SELECT kind, args, started_at FROM jobs WHERE id = ?',
+            (job_id,)).fetchone()
+        job = Job(self, job_id)
+        try:
+            result = self.tasks[row['kind']](job, **json.loads(row['args']))
+            result = json.dumps(result)
+        except Exception as error:  # Records the failure on the job
+            status, result, message = FAILED, json.dumps(None), repr(error)
+        else:
+            status, message = SUCCEEDED, None
+
+        finished_at = time.time()
+        fields = {'status': status, 'result': result,
+                  'error': message, 'finished_at': finished_at,
+                  'duration': finished_at - row['started_at'],
+                  'steps': json.dumps(job.steps)}
+        if status == SUCCEEDED:
+            fields['progress'] = 1.0
+        self._update(job_id, **fields)
+
+    def get(self, job_id):
+        '''
+        Returns a dictionary describing a job, or None if there is no such
+        job.
+        '''
+        row = self._connection().execute(
+            'SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['args'] = json.loads(job['args'])
+        job['steps'] = json.loads(job['steps'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['done'] = job['status'] in (SUCCEEDED, FAILED)
+        return job
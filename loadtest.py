@@ -0,0 +1,466 @@
+'''
+This program load tests the web app by replaying the traffic of a
+Candidates' Weekend.
+
+The app runs on the local backend (a SQLite database and a media folder in a
+temporary directory, see the repositories module), which is filled with
+generated candidates and events. Simulated candidates then go through the
+same pages as real candidates:
+
+    /login -> /auth/<user_id> -> /schedule/<user_id>
+        -> /event-info/<name>/<user_id> -> /candidate-info/<user_id>
+
+while an admin edits events at the same time. Requests are sent either
+through Flask's test client, or over HTTP to a local WSGI server (--server).
+
+For each route, the program reports the number of requests, the requests per
+second, the 50th, 95th and 99th percentile latency, and the average number of
+backend calls per request (database reads and writes, Storage calls,
+authentication calls, password hash operations, template renders and media
+link lookups, as recorded by the instrumentation module). The results are
+written to a JSON file, and can be compared with the results of an earlier
+run to find regressions:
+
+    python loadtest.py --candidates 200 --concurrency 20 --duration 30
+    python loadtest.py --baseline loadtest.json --output loadtest-new.json
+'''
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from instrumentation import BACKGROUND
+
+CW_NUMBER = '1'
+PASSWORD = 'candidates-weekend'
+MEDIA_FILES = ('oval.png', 'olinheader.jpg', 'campusmap.jpg', 'welcomepage.jpg')
+
+# Backend calls made by each request, by route
+REQUEST_CALLS = defaultdict(list)
+_calls_lock = threading.Lock()
+
+# ----- COUNTING BACKEND CALLS -----
+def instrument(web):
+    '''
+    Records the backend calls made by each request (as counted by the
+    instrumentation module) per route.
+    '''
+    def record_calls(profile):
+        with _calls_lock:
+            REQUEST_CALLS[profile.method + ' ' + profile.route].append(
+                Counter(profile.counts))
+
+    web.INSTRUMENTATION.subscribe(record_calls)
+
+# ----- TEST DATA -----
+def configure_backend(folder):
+    '''
+    Makes the app use the local backend, with its files in the given folder.
+    Must be called before the Web module is imported.
+    '''
+    os.environ['DATA_BACKEND'] = 'local'
+    os.environ['LOCAL_DATABASE'] = os.path.join(folder, 'local.sqlite3')
+    os.environ['LOCAL_MEDIA_FOLDER'] = os.path.join(folder, 'local_media')
+    os.environ['JOBS_DATABASE'] = os.path.join(folder, 'jobs.sqlite3')
+    os.environ['JOB_FILES_FOLDER'] = os.path.join(folder, 'job_files')
+
+def make_events(count):
+    '''
+    Returns the names and information dictionaries of count events, spread
+    over the Friday and Saturday of one Candidates' Weekend.
+    '''
+    from events import Event
+
+    names, infos = [], []
+    for number in range(count):
+        day = 'Friday' if number % 2 == 0 else 'Saturday'
+        start = 8 * 60 + (number // 2) * 30
+        event = Event('Event {}-{}'.format(number, CW_NUMBER),
+                      '{:02d}:{:02d}'.format(start // 60, start % 60),
+                      '{:02d}:{:02d}'.format((start + 45) // 60,
+                                             (start + 45) % 60),
+                      day, 'Room {}'.format(number),
+                      'Description of event {}.'.format(number), CW_NUMBER,
+                      ('All', 'Candidates', 'Parents')[number % 3], [], {})
+        names.append(event.name)
+        infos.append(event.to_dict())
+    return names, infos
+
+def make_users(count, password_hash):
+    '''
+    Returns the ids and information dictionaries of count candidates, who
+    all have the same password.
+    '''
+    from users import User
+
+    ids, infos = [], []
+    for number in range(count):
+        user_id = 'candidate{}'.format(number)
+        user = User(user_id, user_id + '@example.com', 'ABCDEFGH'[number % 8],
+                    '{:02d}:00'.format(9 + number % 8),
+                    'Interview Room {}'.format(number % 20), str(number % 30),
+                    'Group Room {}'.format(number % 8), CW_NUMBER,
+                    'Candidate {}'.format(number), 'Model Class',
+                    'Classroom {}'.format(number % 4), 'Interviewer')
+        info = user.to_dict()
+        info['password'] = password_hash
+        ids.append(user_id)
+        infos.append(info)
+    return ids, infos
+
+def seed(web, candidates, events):
+    '''
+    Fills the local backend with candidates, events and the images every
+    page shows.
+
+    Returns: the ids of the candidates and the names of the events
+    '''
+    web.SETTINGS_DB.set({'cw_number': CW_NUMBER})
+
+    event_names, event_infos = make_events(events)
+    web.EVENTS_DB.write_batch(sets=list(zip(event_names, event_infos)))
+
+    user_ids, user_infos = make_users(candidates, web.hash_password(PASSWORD))
+    web.USERS_DB.write_batch(sets=list(zip(user_ids, user_infos)))
+
+    for name in MEDIA_FILES:
+        web.BUCKET.blob(name).upload_from_string(b'', content_type='image/png')
+
+    return user_ids, event_names
+
+def start_app(web):
+    '''
+    Starts the app the same way as running Web.py does, without the
+    development server.
+    '''
+    web.SETTINGS.start(web.SETTINGS_DB, poll=True)
+    web.CATALOG.start(web.EVENTS_DB, poll=True)
+    web.USERS.start(web.USERS_DB, poll=True)
+    web.JOBS.start()
+
+# ----- CLIENTS -----
+class TestClient():
+    '''
+    Sends requests through Flask's test client.
+    '''
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, url, data=None):
+        '''
+        Sends a request without following redirects.
+
+        Returns: the status code and the redirect location (or None)
+        '''
+        response = self.client.open(url, method=method, data=data)
+        response.close()
+        return response.status_code, response.headers.get('Location')
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HttpClient():
+    '''
+    Sends requests over HTTP to a running server.
+    '''
+    def __init__(self, base_url):
+        self.base_url = base_url
+        # Keeps the session cookie between the requests of a visit
+        self.opener = urllib.request.build_opener(
+            NoRedirects, urllib.request.HTTPCookieProcessor())
+
+    def request(self, method, url, data=None):
+        '''
+        Sends a request without following redirects.
+
+        Returns: the status code and the redirect location (or None)
+        '''
+        body = urllib.parse.urlencode(data).encode() if data else None
+        http_request = urllib.request.Request(self.base_url + url, data=body,
+                                              method=method)
+        try:
+            with self.opener.open(http_request) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.get('Location')
+
+def start_server(app):
+    '''
+    Serves the app from a local WSGI server in a background thread.
+
+    Returns: the server's base URL
+    '''
+    from werkzeug.serving import make_server
+
+    # Leaves out the line the server logs for every request
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server',
+                     daemon=True).start()
+    return 'http://127.0.0.1:{}'.format(server.server_port)
+
+# ----- TRAFFIC -----
+class Recorder():
+    '''
+    Collects the latency and outcome of every request, by route.
+    '''
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def send(self, client, route, method, url, data=None, expected=(200,)):
+        '''
+        Sends a request and records its latency under the route.
+
+        Returns: the redirect location of the response, if any
+        '''
+        start = time.perf_counter()
+        try:
+            status, location = client.request(method, url, data)
+        except Exception:
+            status, location = None, None
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            if status not in expected:
+                self.errors[route] += 1
+        return location
+
+def candidate_visit(client, recorder, user_id, event_names, event_pages):
+    '''
+    Goes through the pages a candidate visits on Candidates' Weekend.
+    '''
+    quoted_id = urllib.parse.quote(user_id)
+    email = user_id + '@example.com'
+
+    recorder.send(client, 'GET /login', 'GET', '/login')
+    recorder.send(client, 'POST /login', 'POST', '/login', {'email': email},
+                  expected=(302,))
+    recorder.send(client, 'GET /auth/<user_id>', 'GET', '/auth/' + quoted_id)
+    recorder.send(client, 'POST /auth/<user_id>', 'POST', '/auth/' + quoted_id,
+                  {'password': PASSWORD}, expected=(302,))
+    recorder.send(client, 'GET /schedule/<user_id>', 'GET',
+                  '/schedule/' + quoted_id)
+    for name in random.sample(event_names, min(event_pages, len(event_names))):
+        recorder.send(client, 'GET /event-info/<name>/<user_id>', 'GET',
+                      '/event-info/{}/{}'.format(urllib.parse.quote(name),
+                                                 quoted_id))
+    recorder.send(client, 'GET /candidate-info/<user_id>', 'GET',
+                  '/candidate-info/' + quoted_id)
+
+def admin_edit(client, recorder, web, event_name):
+    '''
+    Opens an event in the admin editor and saves it with a new description.
+    '''
+    from events import get_raw_name
+
+    recorder.send(client, 'GET /admin/edit-event/<event_name>', 'GET',
+                  '/admin/edit-event/' + urllib.parse.quote(event_name))
+
+    event = web.CATALOG.get(event_name)
+    form = {'button': 'Submit', 'name': get_raw_name(event_name),
+            'cw_number': event.cw_number,
+            'start_time': event.start_time, 'end_time': event.end_time,
+            'day': event.day.value, 'location': event.location,
+            'description': 'Edited at {:.3f}.'.format(time.time()),
+            'access': event.access.value, 'links': ''}
+    recorder.send(client, 'POST /admin/edit-event/<event_name>', 'POST',
+                  '/admin/edit-event/' +
+                  urllib.parse.quote(get_raw_name(event_name)),
+                  form, expected=(302,))
+
+def run_traffic(make_client, web, user_ids, event_names, args):
+    '''
+    Runs args.concurrency simulated candidates and one admin until
+    args.duration seconds have passed.
+
+    Returns: the recorder and the number of seconds the traffic ran for
+    '''
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.duration
+
+    def candidates():
+        client = make_client()
+        while time.perf_counter() < deadline:
+            candidate_visit(client, recorder, random.choice(user_ids),
+                            event_names, args.event_pages)
+
+    def admin():
+        client = make_client()
+        while time.perf_counter() < deadline:
+            admin_edit(client, recorder, web, random.choice(event_names))
+            time.sleep(args.admin_interval)
+
+    threads = [threading.Thread(target=candidates)
+               for _ in range(args.concurrency)]
+    if args.admin_interval >= 0:
+        threads.append(threading.Thread(target=admin))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - start
+
+# ----- RESULTS -----
+def percentile(values, fraction):
+    '''
+    Returns the value below which the given fraction of the values fall
+    (using the nearest rank).
+
+    >>> percentile([5, 1, 4, 2, 3], 0.5)
+    3
+    >>> percentile(list(range(1, 101)), 0.99)
+    99
+    '''
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(recorder, elapsed):
+    '''
+    Returns the results of a run, as a dictionary that can be saved as JSON.
+    Latencies are in milliseconds.
+    '''
+    routes = {}
+    for route, latencies in sorted(recorder.latencies.items()):
+        calls = REQUEST_CALLS.get(route, [])
+        categories = set().union(*calls) if calls else set()
+        routes[route] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[route],
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'mean_ms': sum(latencies) / len(latencies) * 1000,
+            'backend_calls_per_request': {
+                category: sum(count[category] for count in calls) / len(calls)
+                for category in sorted(categories)}}
+
+    total = sum(route['requests'] for route in routes.values())
+    return {'duration_s': elapsed,
+            'requests': total,
+            'errors': sum(recorder.errors.values()),
+            'requests_per_second': total / elapsed,
+            'routes': routes,
+            'background_calls': dict(BACKGROUND.counts)}
+
+def compare(results, baseline, tolerance):
+    '''
+    Compares the 95th percentile latency of each route with an earlier run.
+
+    Returns: the routes whose latency grew by more than the tolerance (a
+    fraction, like 0.2 for 20%), with the old and new latency
+    '''
+    regressions = {}
+    for route, stats in results['routes'].items():
+        old = baseline.get('routes', {}).get(route)
+        if old and stats['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions[route] = (old['p95_ms'], stats['p95_ms'])
+    return regressions
+
+def print_results(results):
+    '''
+    Prints a table of the results.
+    '''
+    print('{:<40} {:>7} {:>7} {:>8} {:>8} {:>8}  {}'.format(
+        'Route', 'Count', 'Req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+        'Backend calls per request'))
+    for route, stats in results['routes'].items():
+        calls = ', '.join('{} {:.1f}'.format(category, count) for
+                          category, count in
+                          stats['backend_calls_per_request'].items())
+        print('{:<40} {:>7} {:>7.1f} {:>8.1f} {:>8.1f} {:>8.1f}  {}'.format(
+            route, stats['requests'], stats['requests_per_second'],
+            stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], calls))
+    print('{} requests, {} errors, {:.1f} requests/s'.format(
+        results['requests'], results['errors'], results['requests_per_second']))
+
+def main():
+    '''
+    Runs the load test from the command line.
+
+    Returns: the exit status (1 if there were errors or regressions)
+    '''
+    parser = argparse.ArgumentParser(description="Load tests the app with "
+                                     "Candidates' Weekend traffic.")
+    parser.add_argument('--candidates', type=int, default=200,
+                        help='number of candidates in the database')
+    parser.add_argument('--events', type=int, default=24,
+                        help='number of events in the schedule')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='number of candidates browsing at the same time')
+    parser.add_argument('--duration', type=float, default=20.0,
+                        help='how long to send traffic for, in seconds')
+    parser.add_argument('--event-pages', type=int, default=3,
+                        help='number of event pages each candidate opens')
+    parser.add_argument('--admin-interval', type=float, default=1.0,
+                        help='seconds between admin edits (negative for '
+                        'no admin)')
+    parser.add_argument('--server', action='store_true',
+                        help='send requests over HTTP to a local WSGI server')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed, so that runs can be repeated')
+    parser.add_argument('--output', default='loadtest.json',
+                        help='file to write the results to')
+    parser.add_argument('--baseline',
+                        help='results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed growth of the p95 latency compared '
+                        'with the baseline')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    folder = tempfile.mkdtemp(prefix='cw-loadtest-')
+    configure_backend(folder)
+    import Web as web
+
+    web.init_backend()
+    instrument(web)
+    user_ids, event_names = seed(web, args.candidates, args.events)
+    start_app(web)
+    BACKGROUND.counts.clear()
+
+    if args.server:
+        base_url = start_server(web.app)
+        make_client = lambda: HttpClient(base_url)
+    else:
+        make_client = lambda: TestClient(web.app)
+
+    recorder, elapsed = run_traffic(make_client, web, user_ids, event_names,
+                                    args)
+    results = summarize(recorder, elapsed)
+    results['settings'] = vars(args)
+    print_results(results)
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+    status = 1 if results['errors'] else 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file),
+                                  args.tolerance)
+        for route, (old, new) in sorted(regressions.items()):
+            print('Regression: {} p95 {:.1f} ms -> {:.1f} ms'.format(route, old,
+                                                                     new))
+        status = 1 if regressions else status
+    return status
+
+if __name__ == '__main__':
+    raise SystemExit(main())
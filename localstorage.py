@@ -0,0 +1,133 @@
+'''
+This module contains a local stand-in for a Firebase Storage bucket, which
+keeps files in a folder on disk.
+
+LocalBucket and LocalBlob implement the parts of the google-cloud-storage
+Bucket and Blob classes that the app uses, so that the image pipeline (and
+the rest of the app) can be run and tested without Firebase.
+'''
+import os
+from urllib.parse import quote
+
+class LocalBlob():
+    '''
+    A file in a LocalBucket.
+    '''
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+
+    @property
+    def path(self):
+        '''
+        The path of the file on disk.
+        '''
+        return os.path.join(self.bucket.root, self.name)
+
+    @property
+    def media_link(self):
+        '''
+        The URL of the file, or None if it has not been uploaded.
+        '''
+        if not self.exists():
+            return None
+        return self.bucket.base_url + quote(self.name, safe='')
+
+    @property
+    def size(self):
+        '''
+        The size of the file in bytes, or None if it has not been uploaded.
+        '''
+        return os.path.getsize(self.path) if self.exists() else None
+
+    def exists(self):
+        '''
+        Checks whether the file has been uploaded.
+        '''
+        return os.path.isfile(self.path)
+
+    def upload_from_string(self, data, content_type=None):
+        '''
+        Stores the given bytes (or text) as the file's contents.
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'wb') as file:
+            file.write(data)
+        self.content_type = content_type
+        self.bucket.calls += 1
+
+    def upload_from_file(self, file_obj, rewind=False, content_type=None):
+        '''
+        Stores the contents of a file object as the file's contents.
+        '''
+        if rewind:
+            file_obj.seek(0)
+        self.upload_from_string(file_obj.read(), content_type=content_type)
+
+    def download_as_string(self):
+        '''
+        Returns the file's contents as bytes.
+        '''
+        self.bucket.calls += 1
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def make_public(self):
+        '''
+        Files in a local bucket are always public.
+        '''
+        self.bucket.calls += 1
+
+    def delete(self):
+        '''
+        Deletes the file.
+        '''
+        self.bucket.calls += 1
+        os.remove(self.path)
+
+class LocalBucket():
+    '''
+    A folder that stands in for a Firebase Storage bucket.
+
+    >>> import tempfile
+    >>> bucket = LocalBucket(tempfile.mkdtemp(), '/local-media/')
+    >>> bucket.get_blob('map.jpg') is None
+    True
+    >>> bucket.blob('map.jpg').upload_from_string(b'jpeg bytes')
+    >>> bucket.get_blob('map.jpg').media_link
+    '/local-media/map.jpg'
+    >>> bucket.get_blob('map.jpg').download_as_string()
+    b'jpeg bytes'
+    '''
+    def __init__(self, root, base_url='/local-media/'):
+        '''
+        Creates a local bucket.
+
+        Attributes:
+        root: the folder the files are kept in
+        base_url: the URL the folder is served from
+        calls: the number of uploads, downloads and other operations made,
+               which stand for round trips to Firebase Storage
+        '''
+        self.root = root
+        self.base_url = base_url
+        self.calls = 0
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, name):
+        '''
+        Returns a blob for a file, whether or not it has been uploaded.
+        '''
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        '''
+        Returns the blob for an uploaded file, or None if there is no such
+        file.
+        '''
+        self.calls += 1
+        blob = LocalBlob(self, name)
+        return blob if blob.exists() else None
@@ -0,0 +1,201 @@
+'''
+This module keeps track of the event media stored in Firebase Storage.
+
+Event images are stored under the SHA-256 hash of their contents, so the
+same file is only ever stored (and uploaded) once, however many events use
+it and whatever it was called when it was uploaded.
+
+The MediaIndex class counts how many events refer to each stored file. It is
+kept up to date from the event catalog, which is the record of which events
+use which files, so the counts are rebuilt whenever the catalog is loaded.
+Files that are no longer used by any event can then be deleted, as long as
+they are stored under a content name (older events link to files like
+'campusmap.jpg' directly, which the site itself may also use).
+'''
+import hashlib
+import os
+import re
+import threading
+from collections import Counter
+from urllib.parse import unquote, urlparse
+
+IMG_FILES = 'img_files'
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Names given by get_content_name, and the names of their variants (see
+# imaging.get_variant_name)
+CONTENT_NAME = re.compile(r'^[0-9a-f]{64}(-[a-z]+-[0-9a-f]{16})?\.[a-z0-9]+$')
+
+def get_content_name(file_obj, filename):
+    '''
+    Returns the name a file is stored under: the SHA-256 hash of its
+    contents, with the extension of its original filename. Reads the file
+    object to the end and then rewinds it.
+
+    >>> import io
+    >>> get_content_name(io.BytesIO(b'abc'), 'Campus Map.JPG')[-20:]
+    'b410ff61f20015ad.jpg'
+    '''
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file_obj.seek(0)
+
+    extension = os.path.splitext(filename)[1].lower()
+    return digest.hexdigest() + extension
+
+def is_content_name(name):
+    '''
+    Checks whether a stored file is named after the hash of its contents
+    (or is a variant of such a file), and so only belongs to events.
+
+    >>> is_content_name('ab' * 32 + '.jpg')
+    True
+    >>> is_content_name('ab' * 32 + '-thumb-' + 'ab' * 8 + '.webp')
+    True
+    >>> is_content_name('campusmap.jpg')
+    False
+    '''
+    return CONTENT_NAME.match(name) is not None
+
+def get_link_blob_name(link):
+    '''
+    Gets the name of the stored file a media link points to.
+
+    >>> get_link_blob_name('https://www.googleapis.com/download/storage/v1/'
+    ...                    'b/cw.appspot.com/o/map%20a.jpg?alt=media')
+    'map a.jpg'
+    >>> get_link_blob_name('/local-media/map.jpg')
+    'map.jpg'
+    '''
+    path = urlparse(link).path
+    if '/o/' in path:
+        return unquote(path.split('/o/', 1)[1])
+    return unquote(path.rsplit('/', 1)[-1])
+
+def get_blob_names(img_file):
+    '''
+    Gets the names of the stored files used by an img_files entry: the
+    original image and its variants.
+
+    >>> get_blob_names({'src': '/m/a.jpg', 'name': 'a.jpg',
+    ...                 'variants': [{'name': 'a-thumb.webp'}]})
+    ['a.jpg', 'a-thumb.webp']
+    '''
+    if isinstance(img_file, dict):
+        return [img_file['name']] + [variant['name'] for variant
+                                     in img_file.get('variants', [])]
+    return [get_link_blob_name(img_file)]
+
+class MediaIndex():
+    '''
+    Counts the events that use each stored file.
+
+    >>> from events import Event
+    >>> def tour(name, img_files):
+    ...     return Event(name, '', '', 'Friday', '', '', '1', 'All', img_files)
+    >>> stored = 'a' * 64 + '.jpg'
+    >>> index = MediaIndex()
+    >>> index.on_change('Tour-1', None, tour('Tour-1', ['/m/' + stored]))
+    >>> index.on_change('Tour-2', None, tour('Tour-2', ['/m/' + stored,
+    ...                                                 '/m/campusmap.jpg']))
+    >>> index.references(stored)
+    2
+    >>> index.on_change('Tour-1', tour('Tour-1', ['/m/' + stored]), None)
+    >>> index.on_change('Tour-2', tour('Tour-2', ['/m/' + stored,
+    ...                                           '/m/campusmap.jpg']),
+    ...                 tour('Tour-2', []))
+    >>> index.take_unused() == [stored]
+    True
+    '''
+    def __init__(self, protected=()):
+        '''
+        Attributes:
+        protected - names of stored files that are never deleted, like the
+                    images the site itself shows
+        '''
+        self.protected = frozenset(protected)
+        self._counts = Counter()
+        self._entries = {}
+        self._unused = set()
+        self._lock = threading.Lock()
+
+    def _files(self, event):
+        # The catalog reports added and removed events with None in place
+        # of the old or new event
+        return getattr(event, IMG_FILES, None) or ()
+
+    def on_change(self, event_name, old, new):
+        '''
+        Updates the counts after an event changed. Meant to be subscribed to
+        the event catalog.
+        '''
+        with self._lock:
+            for img_file in self._files(new):
+                for name in get_blob_names(img_file):
+                    self._counts[name] += 1
+                    self._unused.discard(name)
+                # Remembers the most complete entry for each image
+                if isinstance(img_file, dict) and ('variants' in img_file or
+                                                   img_file['name'] not in
+                                                   self._entries):
+                    self._entries[img_file['name']] = img_file
+
+            for img_file in self._files(old):
+                for name in get_blob_names(img_file):
+                    self._counts[name] -= 1
+                    if self._counts[name] <= 0:
+                        del self._counts[name]
+                        self._entries.pop(name, None)
+                        self._unused.add(name)
+
+    def references(self, name):
+        '''
+        Returns the number of events that use a stored file.
+        '''
+        with self._lock:
+            return self._counts.get(name, 0)
+
+    def find_entry(self, name):
+        '''
+        Returns a copy of the img_files entry an event already has for a
+        stored image (with its variants, if they have been created), or None
+        if no event uses the image.
+        '''
+        with self._lock:
+            entry = self._entries.get(name)
+            return dict(entry) if entry is not None else None
+
+    def collectable(self, name):
+        '''
+        Checks whether a stored file may be deleted once no event uses it:
+        only files stored under a content name, and not protected.
+        '''
+        return name not in self.protected and is_content_name(name)
+
+    def take_unused(self):
+        '''
+        Returns (and forgets) the names of the files that stopped being used
+        since the last call, and that may be deleted.
+        '''
+        with self._lock:
+            unused, self._unused = sorted(self._unused), set()
+        return [name for name in unused if self.collectable(name)]
+
+    def collect(self, bucket, names):
+        '''
+        Deletes the given files from the bucket, unless an event uses them
+        again or they may not be deleted.
+
+        Returns: the names of the deleted files
+        '''
+        deleted = []
+        for name in names:
+            if self.references(name) > 0 or not self.collectable(name):
+                continue
+            blob = bucket.get_blob(name)
+            if blob is not None:
+                blob.delete()
+                deleted.append(name)
+        return deleted
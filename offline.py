@@ -0,0 +1,242 @@
+'''
+This module writes the offline bundles of the Candidates' Weekend schedule.
+
+A bundle is a folder of prebuilt files for one Candidates' Weekend and one
+audience (candidates or parents), which the app serves from disk without
+rendering anything or contacting the database:
+    - welcome.html, schedule.html and one page per event, rendered from the
+      app's templates with their links pointing to each other and their
+      image links already resolved
+    - schedule.json - the schedule in a compact form, for scripts
+    - sw.js - a service worker that keeps a copy of every file (and of the
+      images) on the phone, so that the schedule works without a network
+    - offline-manifest.json - the files of the bundle, with the hash of each
+      file and of what it was rendered from
+
+Exporting a bundle again is incremental: a page is only rendered again if
+what it is rendered from (like its event) changed, a file is only rewritten
+if its contents changed, and files that are no longer needed are deleted.
+The service worker changes whenever any file does, which tells the phones
+to download the new files.
+'''
+import json
+import os
+import re
+import tempfile
+from pagecache import get_etag
+
+BUNDLE_MANIFEST = 'offline-manifest.json'
+SERVICE_WORKER = 'sw.js'
+SCHEDULE_JSON = 'schedule.json'
+SCHEDULE_PAGE = 'schedule.html'
+WELCOME_PAGE = 'welcome.html'
+
+# Fields of each entry in schedule.json
+SCHEDULE_FIELDS = ('start', 'end', 'name', 'location', 'access', 'page')
+
+# Registers the service worker, added to the end of every page
+REGISTER_SCRIPT = '''<script>
+if ('serviceWorker' in navigator) {
+  navigator.serviceWorker.register('%s');
+}
+</script>
+''' % SERVICE_WORKER
+
+SERVICE_WORKER_SCRIPT = '''// Offline copy of the Candidates' Weekend schedule
+const PREFIX = %(prefix)s;
+const CACHE = PREFIX + %(version)s;
+const FILES = %(files)s;
+const MEDIA = %(media)s;
+
+self.addEventListener('install', event => {
+  event.waitUntil(caches.open(CACHE).then(cache => Promise.all([
+    // Skips the browser's cache, which may hold the previous files
+    cache.addAll(FILES.map(file => new Request(file, {cache: 'reload'}))),
+    // Images are kept if they can be downloaded, but are not required
+    ...MEDIA.map(url => fetch(url, {mode: 'no-cors'})
+      .then(response => cache.put(url, response))
+      .catch(() => null))
+  ])).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(caches.keys().then(keys => Promise.all(
+    keys.filter(key => key.startsWith(PREFIX) && key !== CACHE)
+        .map(key => caches.delete(key))
+  )).then(() => self.clients.claim()));
+});
+
+self.addEventListener('fetch', event => {
+  if (event.request.method !== 'GET') {
+    return;
+  }
+  event.respondWith(caches.match(event.request)
+    .then(cached => cached || fetch(event.request)));
+});
+'''
+
+def get_event_page(name):
+    '''
+    Returns the file name of an event's page in a bundle.
+
+    >>> get_event_page('Lunch-1')
+    'event-Lunch-1-75bf82fd.html'
+    >>> get_event_page('Tour & Talk-All')
+    'event-Tour_Talk-All-6f1e9c6a.html'
+    '''
+    # The hash keeps names that only differ in other characters apart
+    slug = re.sub(r'[^A-Za-z0-9-]+', '_', name)
+    return 'event-{}-{}.html'.format(slug, get_etag(name)[:8])
+
+def get_fingerprint(*inputs):
+    '''
+    Returns a hash of everything a file is made from, to tell whether the
+    file has to be made again.
+
+    >>> get_fingerprint({'a': 1}, 'b') == get_fingerprint({'a': 1}, 'b')
+    True
+    '''
+    return get_etag(json.dumps(inputs, sort_keys=True, default=str))
+
+def relink(html, links):
+    '''
+    Replaces the app's links in a rendered page with links to the bundle's
+    files, and adds the script that registers the service worker.
+
+    >>> relink('<a href="/schedule/guest">x</a></body>',
+    ...        {'/schedule/guest': 'schedule.html'})[:34]
+    '<a href="schedule.html">x</a><scri'
+    '''
+    for url, target in links.items():
+        html = html.replace('href="{}"'.format(url),
+                            'href="{}"'.format(target))
+    return html.replace('</body>', REGISTER_SCRIPT + '</body>', 1)
+
+def encode_schedule(cw_number, audience, days, pages):
+    '''
+    Converts a weekend's schedule to the compact form of schedule.json:
+    the entries of each day are lists of the SCHEDULE_FIELDS.
+
+    Inputs:
+    days - (day, schedule entries) pairs
+    pages - the bundle's page for each event that has one, by event name
+    '''
+    return {'cw_number': cw_number,
+            'audience': str(audience),
+            'fields': SCHEDULE_FIELDS,
+            'days': {str(day): [[entry.start_min, entry.end_min, entry.name,
+                                 entry.location, str(entry.access),
+                                 pages.get(entry.full_name)]
+                                for entry in entries]
+                     for day, entries in days}}
+
+class BundleWriter():
+    '''
+    Writes the files of a bundle, rewriting only the files that changed.
+
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> writer = BundleWriter(folder, 'cw-1-parents')
+    >>> writer.write('a.html', '<p>A</p>', inputs='1')
+    True
+    >>> writer.finish()['written']
+    ['a.html']
+    >>> writer = BundleWriter(folder, 'cw-1-parents')
+    >>> writer.unchanged('a.html', '1')
+    True
+    >>> report = writer.finish(); report['written'], report['deleted']
+    ([], [])
+    >>> writer = BundleWriter(folder, 'cw-1-parents')
+    >>> report = writer.finish(); report['deleted']
+    ['a.html']
+    '''
+    def __init__(self, folder, name):
+        '''
+        Attributes:
+        folder - the folder of the bundle
+        name - a name for the bundle that no other bundle served by the app
+               has (its service worker's caches start with it)
+        '''
+        self.folder = folder
+        self.name = name
+        os.makedirs(folder, exist_ok=True)
+        try:
+            with open(os.path.join(folder, BUNDLE_MANIFEST)) as manifest_file:
+                self.previous = json.load(manifest_file)['files']
+        except (OSError, ValueError, KeyError):
+            self.previous = {}
+        self.files = {}
+        self.written = []
+
+    def unchanged(self, path, inputs):
+        '''
+        Checks whether a file was already made from the same inputs, and if
+        so keeps it in the bundle as it is.
+        '''
+        entry = self.previous.get(path)
+        if entry is None or entry['inputs'] != get_fingerprint(inputs) or \
+           not os.path.exists(os.path.join(self.folder, path)):
+            return False
+        self.files[path] = entry
+        return True
+
+    def _save(self, path, text):
+        # Replaces the file at once, so that it is never served half-written
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.folder,
+                                                      suffix='.tmp')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as new_file:
+            new_file.write(text)
+        os.replace(temporary_path, os.path.join(self.folder, path))
+
+    def write(self, path, text, inputs=None):
+        '''
+        Adds a file to the bundle, and writes it unless it has not changed.
+
+        Returns: whether the file was written
+        '''
+        entry = {'hash': get_etag(text), 'inputs': get_fingerprint(inputs)}
+        self.files[path] = entry
+        previous = self.previous.get(path)
+        if previous is not None and previous['hash'] == entry['hash'] and \
+           os.path.exists(os.path.join(self.folder, path)):
+            return False
+        self._save(path, text)
+        self.written.append(path)
+        return True
+
+    def finish(self, media=()):
+        '''
+        Deletes the files that are no longer part of the bundle, and writes
+        the service worker (which keeps copies of the bundle's files and of
+        the given image links) and the manifest.
+
+        Returns: a report with the files written and deleted, and the
+        bundle's version
+        '''
+        deleted = sorted(path for path in self.previous
+                         if path not in self.files and path != SERVICE_WORKER)
+        for path in deleted:
+            try:
+                os.remove(os.path.join(self.folder, path))
+            except FileNotFoundError:
+                pass
+
+        files = sorted(path for path in self.files if path != SERVICE_WORKER)
+        version = get_fingerprint([(path, self.files[path]['hash'])
+                                   for path in files], sorted(media))[:16]
+        self.write(SERVICE_WORKER, SERVICE_WORKER_SCRIPT % {
+            'prefix': json.dumps('cw-offline-' + self.name + '-'),
+            'version': json.dumps(version),
+            'files': json.dumps(['./'] + ['./' + path for path in files]),
+            'media': json.dumps(sorted(media))})
+
+        self._save(BUNDLE_MANIFEST, json.dumps(
+            {'version': version, 'files': self.files}, indent=1,
+            sort_keys=True))
+
+        return {'version': version,
+                'written': [path for path in self.written
+                            if path != SERVICE_WORKER],
+                'unchanged': len(files) - len([path for path in self.written
+                                               if path != SERVICE_WORKER]),
+                'deleted': deleted}
@@ -0,0 +1,99 @@
+'''
+This module contains the PageCache class, which caches rendered pages.
+
+Most pages look the same for every candidate: the only part that depends on
+the user is the user id in the navigation links. So each page is rendered
+once with a placeholder in place of the user id, and the placeholder is
+replaced with the real user id for each request. Pages for guests (and pages
+without a user id) are cached as they are.
+
+Responses carry an ETag, so that a phone that already has the page gets a
+304 (Not Modified) response instead of the page.
+'''
+import hashlib
+from urllib.parse import quote
+from flask import make_response, request
+from caching import LRUCache
+
+USER_PLACEHOLDER = '--cw-user-id--'
+GUEST = 'guest'
+
+def get_etag(text):
+    '''
+    Returns an ETag for a piece of text.
+
+    >>> get_etag('abc')
+    'a9993e364706816aba3e25717850c26c9cd0d89d'
+    '''
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def fill_user_id(template_html, user_id):
+    '''
+    Replaces the user id placeholder in a rendered page with a user id,
+    quoted the way url_for would quote it.
+
+    >>> fill_user_id('<a href="/schedule/--cw-user-id--">', 'ab c')
+    '<a href="/schedule/ab%20c">'
+    '''
+    return template_html.replace(USER_PLACEHOLDER, quote(user_id, safe=''))
+
+class PageCache():
+    '''
+    Cache of rendered pages, keyed by the template and whatever the page's
+    content depends on (like the Candidates' Weekend number and the version
+    of the event catalog).
+    '''
+    def __init__(self, maxsize=512, ttl=None):
+        self.pages = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def clear(self, *args):
+        '''
+        Removes every cached page. Accepts (and ignores) any arguments, so
+        that it can be subscribed to the event catalog directly.
+        '''
+        self.pages.clear()
+
+    def stats(self):
+        '''
+        Returns the hit and miss counters of the cache.
+        '''
+        return self.pages.stats()
+
+    def get_html(self, key, render, user_id=None):
+        '''
+        Gets the HTML for a page for a user, rendering it with
+        render(user_id) if it is not cached.
+
+        Returns: (html, etag)
+        '''
+        if user_id is None or user_id == GUEST:
+            # Guest pages are cached as they are
+            html, etag = self.pages.get(
+                key + (user_id,),
+                lambda cache_key: self._render(render, user_id))
+            return html, etag
+
+        # Pages for candidates are cached with a placeholder for the user id
+        html, etag = self.pages.get(
+            key + (USER_PLACEHOLDER,),
+            lambda cache_key: self._render(render, USER_PLACEHOLDER))
+        return fill_user_id(html, user_id), get_etag(etag + user_id)
+
+    @staticmethod
+    def _render(render, user_id):
+        html = render(user_id)
+        return html, get_etag(html)
+
+    def response(self, key, render, user_id=None):
+        '''
+        Creates the response for a page, which is a 304 (Not Modified)
+        response if the request's If-None-Match header matches the page.
+        '''
+        html, etag = self.get_html(key, render, user_id)
+
+        response = make_response(html)
+        response.set_etag(etag)
+        # Lets browsers keep the page, but makes them check that it is
+        # still current before using it
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
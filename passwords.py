@@ -0,0 +1,165 @@
+'''
+This module hashes and checks the candidates' passwords.
+
+Password hashing is slow on purpose, and it uses the CPU the whole time, so
+it runs in a pool of worker processes instead of in the web server's
+request threads. By default, each web server process gets an equal share of
+the cores (one each if there are more processes than cores). The hashing
+method and its cost (the number of PBKDF2 iterations) can be configured, and
+passwords hashed with older settings can be detected with needs_rehash, so
+that they are hashed again the next time the candidate logs in.
+
+Run this module with --benchmark to see how many hashes per second each core
+manages with the current settings:
+
+    python passwords.py --benchmark
+'''
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash, \
+    DEFAULT_PBKDF2_ITERATIONS
+
+# Method passed to werkzeug, as 'pbkdf2:<hash name>:<iterations>'
+PASSWORD_METHOD = os.environ.get(
+    'PASSWORD_METHOD', 'pbkdf2:sha256:{}'.format(DEFAULT_PBKDF2_ITERATIONS))
+PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+
+# Number of web server processes on this machine (each has its own pool)
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Number of worker processes; 0 hashes in the calling thread instead. By
+# default the cores are shared between the web server processes' pools.
+PASSWORD_WORKERS = int(os.environ.get(
+    'PASSWORD_WORKERS', max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    '''
+    Returns the pool of hashing processes, starting it the first time.
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Uses fresh processes rather than forks of a process that
+            # already has network clients and threads running
+            _pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def run(function, *args):
+    '''
+    Runs a hashing function in the pool and waits for its result.
+    '''
+    if PASSWORD_WORKERS == 0:
+        return function(*args)
+    return get_pool().submit(function, *args).result()
+
+def hash_password(password, method=None):
+    '''
+    Hashes a password with the configured method and cost.
+
+    Returns: the hash, in werkzeug's 'method$salt$hash' format
+    '''
+    return run(_hash, password, method or PASSWORD_METHOD)
+
+def check_password(password_hash, password):
+    '''
+    Checks a password against its hash.
+
+    Returns: True if the password matches
+    '''
+    if not password_hash:
+        return False
+    return run(check_password_hash, password_hash, password)
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method,
+                                  salt_length=PASSWORD_SALT_LENGTH)
+
+def normalize_method(method):
+    '''
+    Returns a hashing method with the number of iterations spelled out, so
+    that methods can be compared.
+
+    >>> normalize_method('pbkdf2:sha256') == 'pbkdf2:sha256:{}'.format(
+    ...     DEFAULT_PBKDF2_ITERATIONS)
+    True
+    >>> normalize_method('pbkdf2:sha256:260000')
+    'pbkdf2:sha256:260000'
+    '''
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        if len(parts) == 1:
+            parts.append('sha256')
+        if len(parts) == 2:
+            # werkzeug's default number of iterations
+            parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ':'.join(parts)
+
+def needs_rehash(password_hash, method=None):
+    '''
+    Checks whether a password hash was made with different settings than
+    the configured ones.
+
+    >>> needs_rehash('pbkdf2:sha256:50000$salt$hash', 'pbkdf2:sha256:150000')
+    True
+    >>> needs_rehash('pbkdf2:sha256$salt$hash', PASSWORD_METHOD)
+    False
+    '''
+    used = password_hash.split('$', 1)[0]
+    return normalize_method(used) != normalize_method(method or
+                                                      PASSWORD_METHOD)
+
+def benchmark(seconds=5.0, method=None):
+    '''
+    Measures how many hashes per second one worker process and the whole
+    pool can compute.
+
+    Returns: a dictionary with the results
+    '''
+    method = method or PASSWORD_METHOD
+    pool = get_pool()
+
+    # Starts the worker processes before timing
+    list(pool.map(_hash, ['warm up'] * PASSWORD_WORKERS,
+                  [method] * PASSWORD_WORKERS))
+
+    results = {'method': method, 'workers': PASSWORD_WORKERS}
+    for name, parallel in (('one_worker', 1), ('all_workers', PASSWORD_WORKERS)):
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            list(pool.map(_hash, ['benchmark'] * parallel, [method] * parallel))
+            count += parallel
+        elapsed = time.perf_counter() - start
+        results[name] = count / elapsed
+
+    results['per_core'] = results['all_workers'] / PASSWORD_WORKERS
+    results['scaling'] = results['all_workers'] / results['one_worker']
+    return results
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description='Password hashing tools.')
+    PARSER.add_argument('--benchmark', action='store_true',
+                        help='measure hashes per second per core')
+    PARSER.add_argument('--seconds', type=float, default=5.0,
+                        help='how long to run each part of the benchmark')
+    PARSER.add_argument('--method', default=PASSWORD_METHOD,
+                        help='hashing method, like pbkdf2:sha256:150000')
+    ARGS = PARSER.parse_args()
+
+    if ARGS.benchmark:
+        RESULTS = benchmark(ARGS.seconds, ARGS.method)
+        print('Method: {method}, workers: {workers}'.format(**RESULTS))
+        print('One worker:  {one_worker:8.1f} hashes/s'.format(**RESULTS))
+        print('All workers: {all_workers:8.1f} hashes/s '
+              '({per_core:.1f} per core, {scaling:.2f}x)'.format(**RESULTS))
+    else:
+        PARSER.print_help()
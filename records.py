@@ -0,0 +1,127 @@
+'''
+This module contains the building blocks of the app's record types (like
+events.Event and users.User):
+    - Record - a base class for immutable objects that keep their fields in
+      __slots__ instead of a per-object dictionary, which makes them much
+      smaller when thousands of them are cached
+    - TextEnum - a base class for enumerations whose members are also the
+      strings stored in the database (so templates can compare them with
+      strings, and they can be used as dictionary keys in place of strings)
+
+Records parse some of their fields (like times and days) when they are
+created. Values that cannot be parsed are kept as they were in the record's
+unparsed field, so that writing the record back to the database does not
+erase them.
+'''
+from enum import Enum
+from types import MappingProxyType
+
+class TextEnum(str, Enum):
+    '''
+    Enumeration whose members behave like their string values.
+
+    >>> class Color(TextEnum):
+    ...     RED = 'Red'
+    >>> Color.RED == 'Red', {'Red': 1}[Color.RED], str(Color.RED)
+    (True, 1, 'Red')
+    >>> Color.parse('Blue') is None
+    True
+    '''
+    def __str__(self):
+        return self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    @classmethod
+    def parse(cls, value):
+        '''
+        Returns the member with the given value, or None if there is none.
+        '''
+        try:
+            return cls(value)
+        except ValueError:
+            return None
+
+class Record():
+    '''
+    Base class for immutable records. Subclasses list their fields in
+    __slots__ and set them in __init__ with _set. Subclasses with parsed
+    fields also have an 'unparsed' slot, which they set with _set_unparsed
+    after setting the fields with _parse.
+
+    >>> class Slot(Record):
+    ...     __slots__ = ('day', 'unparsed')
+    ...     def __init__(self, day):
+    ...         unparsed = {}
+    ...         self._parse('day', Day.parse, day, unparsed)
+    ...         self._set_unparsed(unparsed)
+    ...     def to_dict(self):
+    ...         return {'day': self._stored('day', self.day and self.day.value)}
+    >>> class Day(TextEnum):
+    ...     FRIDAY = 'Friday'
+    >>> Slot('Friday').to_dict(), Slot('Sunday').day, Slot('Sunday').to_dict()
+    ({'day': 'Friday'}, None, {'day': 'Sunday'})
+    '''
+    __slots__ = ()
+
+    def _set(self, name, value):
+        object.__setattr__(self, name, value)
+
+    def _parse(self, name, parse, value, unparsed):
+        '''
+        Sets a field to parse(value). If parse does not recognise the value
+        (it returns None), the value is added to unparsed instead.
+        '''
+        parsed = parse(value)
+        if parsed is None and value not in (None, ''):
+            unparsed[name] = value
+        self._set(name, parsed)
+
+    def _set_unparsed(self, unparsed):
+        self._set('unparsed', MappingProxyType(unparsed))
+
+    def _stored(self, name, text):
+        '''
+        Returns the value to store in the database for a parsed field: its
+        text, or the value it was created from if that could not be parsed.
+        '''
+        if getattr(self, name) is None:
+            return self.unparsed.get(name, text)
+        return text
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name in self.__slots__))
+
+    def replace(self, **changes):
+        '''
+        Returns a copy of the record with some fields changed.
+        '''
+        record = object.__new__(type(self))
+        for name in self.__slots__:
+            record._set(name, changes.pop(name, getattr(self, name)))
+        if changes:
+            raise TypeError('unknown fields: ' + ', '.join(sorted(changes)))
+        return record
@@ -0,0 +1,575 @@
+'''
+This module contains the data access layer of the app.
+
+The app reads and writes its data through three repositories:
+    - EventRepository - the events collection
+    - UserRepository - the users collection
+    - SettingsRepository - the general information, like the current
+      Candidates' Weekend number, in a versioned document of its own
+
+Each repository works on a collection, which can either be a Firestore
+collection (FirestoreCollection) or a table in a local SQLite database
+(SqliteCollection). Both kinds of collection behave the same way, so the
+whole app can run on a laptop without Firebase (for example for load tests)
+by using the SQLite collections, along with the LocalAuth stand-in for
+Firebase Authentication and a localstorage.LocalBucket for Firebase Storage.
+
+Documents are represented as plain dictionaries. In-memory copies of the
+data (like the event catalog) are kept up to date with a RepositorySync.
+'''
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+WRITE_BATCH_SIZE = 500
+
+# The id of the settings document in the settings collection
+SETTINGS_ID = 'general'
+
+ADDED = 'ADDED'
+MODIFIED = 'MODIFIED'
+REMOVED = 'REMOVED'
+
+Repositories = namedtuple('Repositories', ['events', 'users', 'settings'])
+
+# ----- COLLECTIONS -----
+class FirestoreCollection():
+    '''
+    A collection in Firestore.
+    '''
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.ref = db.collection(name)
+
+    def get_all(self):
+        '''
+        Returns every document, as a dictionary of id to document.
+        '''
+        return {snapshot.id: snapshot.to_dict() for snapshot in self.ref.get()}
+
+    def get(self, document_id):
+        '''
+        Returns a document, or None if there is no such document.
+        '''
+        snapshot = self.ref.document(document_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def get_many(self, document_ids):
+        '''
+        Returns the documents that exist among the given ids, as a dictionary
+        of id to document, reading them all in one request.
+        '''
+        references = [self.ref.document(document_id)
+                      for document_id in document_ids]
+        if not references:
+            return {}
+        return {snapshot.id: snapshot.to_dict()
+                for snapshot in self.db.get_all(references) if snapshot.exists}
+
+    def set(self, document_id, data, merge=False):
+        '''
+        Writes a document. With merge, only the given fields are changed.
+        '''
+        self.ref.document(document_id).set(data, merge=merge)
+
+    def delete(self, document_id):
+        '''
+        Deletes a document.
+        '''
+        self.ref.document(document_id).delete()
+
+    def find(self, field, value):
+        '''
+        Returns the ids of the documents whose field equals the value.
+        '''
+        return [snapshot.id for snapshot in
+                self.ref.where(field, '==', value).get()]
+
+    def update(self, document_id, change):
+        '''
+        Reads a document and replaces it with change(document) in one
+        transaction, so that concurrent updates cannot overwrite each other.
+        change receives None if there is no such document.
+
+        Returns: the new document
+        '''
+        from firebase_admin import firestore
+        reference = self.ref.document(document_id)
+
+        @firestore.transactional
+        def update_in_transaction(transaction):
+            snapshot = reference.get(transaction=transaction)
+            data = change(snapshot.to_dict() if snapshot.exists else None)
+            transaction.set(reference, data)
+            return data
+
+        return update_in_transaction(self.db.transaction())
+
+    def write_batch(self, sets=(), deletes=()):
+        '''
+        Writes and deletes many documents, with up to WRITE_BATCH_SIZE
+        operations per batch.
+
+        Inputs:
+        sets - a list of (document id, document) pairs to write
+        deletes - a list of ids of documents to delete
+
+        Returns: the number of batches committed
+        '''
+        operations = [('set', document_id, data) for document_id, data in sets]
+        operations += [('delete', document_id, None) for document_id in deletes]
+
+        batches = 0
+        for start in range(0, len(operations), WRITE_BATCH_SIZE):
+            batch = self.db.batch()
+            for kind, document_id, data in operations[start:start +
+                                                      WRITE_BATCH_SIZE]:
+                if kind == 'set':
+                    batch.set(self.ref.document(document_id), data)
+                else:
+                    batch.delete(self.ref.document(document_id))
+            batch.commit()
+            batches += 1
+        return batches
+
+    def on_snapshot(self, callback):
+        '''
+        Calls callback(changes) whenever documents change, where changes is a
+        list of (kind, document id, document) tuples and kind is ADDED,
+        MODIFIED or REMOVED.
+
+        Returns: the watch, which has an unsubscribe() method
+        '''
+        def on_changes(collection_snapshot, changes, read_time):
+            callback([(change.type.name, change.document.id,
+                       change.document.to_dict()) for change in changes])
+
+        return self.ref.on_snapshot(on_changes)
+
+class SqliteDatabase():
+    '''
+    A local SQLite database that holds collections of JSON documents.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.connection().execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            'collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, '
+            'PRIMARY KEY (collection, id))')
+
+    def connection(self):
+        '''
+        Returns this thread's connection to the database.
+        '''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30,
+                                         isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def collection(self, name):
+        '''
+        Returns a collection in this database.
+        '''
+        return SqliteCollection(self, name)
+
+class SqliteCollection():
+    '''
+    A collection in a local SQLite database, with the same behavior as a
+    FirestoreCollection.
+
+    >>> users = SqliteDatabase(':memory:').collection('users')
+    >>> users.set('kaoki', {'email': 'kaoki@olin.edu', 'password': ''})
+    >>> users.set('kaoki', {'password': 'hash'}, merge=True)
+    >>> users.get('kaoki')
+    {'email': 'kaoki@olin.edu', 'password': 'hash'}
+    >>> users.find('email', 'kaoki@olin.edu')
+    ['kaoki']
+    >>> users.update('kaoki', lambda user: dict(user, password='new'))
+    {'email': 'kaoki@olin.edu', 'password': 'new'}
+    >>> users.write_batch(sets=[('mku', {'email': 'mku@olin.edu'})],
+    ...                   deletes=['kaoki'])
+    1
+    >>> sorted(users.get_all())
+    ['mku']
+    >>> users.get_many(['kaoki', 'mku'])
+    {'mku': {'email': 'mku@olin.edu'}}
+    '''
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+
+    def _execute(self, statement, parameters=()):
+        return self.database.connection().execute(statement, parameters)
+
+    def get_all(self):
+        rows = self._execute('SELECT id, data FROM documents '
+                             'WHERE collection = ? ORDER BY id', (self.name,))
+        return {document_id: json.loads(data) for document_id, data in rows}
+
+    def get(self, document_id):
+        row = self._execute('SELECT data FROM documents '
+                            'WHERE collection = ? AND id = ?',
+                            (self.name, document_id)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def get_many(self, document_ids):
+        documents = {}
+        for document_id in document_ids:
+            data = self.get(document_id)
+            if data is not None:
+                documents[document_id] = data
+        return documents
+
+    def _set(self, document_id, data, merge=False):
+        if merge:
+            old = self.get(document_id) or {}
+            old.update(data)
+            data = old
+        self._execute('INSERT OR REPLACE INTO documents (collection, id, data) '
+                      'VALUES (?, ?, ?)',
+                      (self.name, document_id, json.dumps(data)))
+
+    def set(self, document_id, data, merge=False):
+        self._set(document_id, data, merge)
+
+    def delete(self, document_id):
+        self._execute('DELETE FROM documents WHERE collection = ? AND id = ?',
+                      (self.name, document_id))
+
+    def find(self, field, value):
+        return [document_id for document_id, data in self.get_all().items()
+                if data.get(field) == value]
+
+    def update(self, document_id, change):
+        # Locks the database for writing until the new document is written
+        connection = self.database.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            data = change(self.get(document_id))
+            self._set(document_id, data)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return data
+
+    def write_batch(self, sets=(), deletes=()):
+        sets, deletes = list(sets), list(deletes)
+        operations = len(sets) + len(deletes)
+
+        # Commits all the writes at once, like a Firestore batch
+        connection = self.database.connection()
+        connection.execute('BEGIN')
+        try:
+            for document_id, data in sets:
+                self._set(document_id, data)
+            for document_id in deletes:
+                self.delete(document_id)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+        return -(-operations // WRITE_BATCH_SIZE)
+
+    def on_snapshot(self, callback):
+        '''
+        SQLite cannot notify listeners, so returns None; the caller should
+        poll get_all() instead.
+        '''
+        return None
+
+# ----- REPOSITORIES -----
+class EventRepository():
+    '''
+    The events, by document id (the event's name and Candidates' Weekend
+    number, like 'Lunch-1').
+    '''
+    def __init__(self, collection, settings_id):
+        '''
+        Attributes:
+        collection - the collection holding the events
+        settings_id - the id of the document in the collection that holds
+                      general information instead of an event
+        '''
+        self.collection = collection
+        self.settings_id = settings_id
+
+    def get_all(self):
+        '''
+        Returns every document in the collection (including the general
+        information document), as a dictionary of id to document.
+        '''
+        return self.collection.get_all()
+
+    def get(self, event_id):
+        return self.collection.get(event_id)
+
+    def set(self, event_id, event_dict, merge=False):
+        self.collection.set(event_id, event_dict, merge)
+
+    def delete(self, event_id):
+        self.collection.delete(event_id)
+
+    def update(self, event_id, change):
+        '''
+        Replaces an event with change(event) in one transaction. change
+        receives None if there is no such event.
+
+        Returns: the new event
+        '''
+        return self.collection.update(event_id, change)
+
+    def write_batch(self, sets=(), deletes=()):
+        return self.collection.write_batch(sets, deletes)
+
+    def on_snapshot(self, callback):
+        return self.collection.on_snapshot(callback)
+
+class UserRepository():
+    '''
+    The users, by user id.
+    '''
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_all(self):
+        '''
+        Returns every user, as a dictionary of user id to user information.
+        '''
+        return self.collection.get_all()
+
+    def get(self, user_id):
+        return self.collection.get(user_id)
+
+    def get_many(self, user_ids):
+        '''
+        Returns the users that exist among the given ids, as a dictionary of
+        user id to user information.
+        '''
+        return self.collection.get_many(user_ids)
+
+    def set(self, user_id, user_dict, merge=False):
+        self.collection.set(user_id, user_dict, merge)
+
+    def delete(self, user_id):
+        self.collection.delete(user_id)
+
+    def write_batch(self, sets=(), deletes=()):
+        return self.collection.write_batch(sets, deletes)
+
+    def find_by_email(self, email):
+        '''
+        Returns the id of the user with the given email address, or None if
+        there is no such user. If several users have the address, returns
+        the last one.
+        '''
+        user_ids = self.collection.find('email', email)
+        return user_ids[-1] if user_ids else None
+
+    def on_snapshot(self, callback):
+        return self.collection.on_snapshot(callback)
+
+class SettingsRepository():
+    '''
+    The general information for the app, stored in one document of its own
+    collection.
+
+    Before the settings had their own collection, they were kept in a
+    document of the events collection. That document is read (as version 0
+    of the settings) until the settings are first written.
+
+    >>> database = SqliteDatabase(':memory:')
+    >>> events = database.collection('events')
+    >>> events.set('General Event Info', {'cw_number': '1'})
+    >>> settings = SettingsRepository(database.collection('settings'),
+    ...                               SETTINGS_ID, events, 'General Event Info')
+    >>> settings.get()
+    {'cw_number': '1'}
+    >>> settings.update(lambda old: dict(old, version=1))
+    {'cw_number': '1', 'version': 1}
+    '''
+    def __init__(self, collection, document_id, legacy_collection=None,
+                 legacy_id=None):
+        '''
+        Attributes:
+        collection - the collection holding the settings
+        document_id - the id of the settings document
+        legacy_collection - the collection that held the settings before
+                            they had a collection of their own, if any
+        legacy_id - the id of the settings document in legacy_collection
+        '''
+        self.collection = collection
+        self.document_id = document_id
+        self.legacy_collection = legacy_collection
+        self.legacy_id = legacy_id
+
+    def _legacy(self):
+        if self.legacy_collection is None:
+            return None
+        return self.legacy_collection.get(self.legacy_id)
+
+    def get(self):
+        '''
+        Returns the general information, as a dictionary.
+        '''
+        settings = self.collection.get(self.document_id)
+        if settings is None:
+            settings = self._legacy()
+        return settings or {}
+
+    def set(self, settings):
+        '''
+        Replaces the general information.
+        '''
+        self.collection.set(self.document_id, settings)
+
+    def update(self, change):
+        '''
+        Replaces the general information with change(settings) atomically.
+
+        Returns: the new general information
+        '''
+        return self.collection.update(
+            self.document_id,
+            lambda settings: change(settings if settings is not None else
+                                    self._legacy() or {}))
+
+    def on_snapshot(self, callback):
+        '''
+        Calls callback(settings) whenever the general information changes.
+
+        Returns: the watch, which has an unsubscribe() method, or None if the
+        collection cannot notify listeners
+        '''
+        def on_changes(changes):
+            for kind, document_id, document in changes:
+                if document_id == self.document_id and kind != REMOVED:
+                    callback(document)
+
+        return self.collection.on_snapshot(on_changes)
+
+def firestore_repositories(db, events_collection, users_collection,
+                           settings_collection, legacy_settings_id):
+    '''
+    Returns the repositories for a Firestore database.
+    '''
+    events = FirestoreCollection(db, events_collection)
+    return Repositories(EventRepository(events, legacy_settings_id),
+                        UserRepository(FirestoreCollection(db, users_collection)),
+                        SettingsRepository(
+                            FirestoreCollection(db, settings_collection),
+                            SETTINGS_ID, events, legacy_settings_id))
+
+def sqlite_repositories(path, events_collection, users_collection,
+                        settings_collection, legacy_settings_id):
+    '''
+    Returns the repositories for a local SQLite database file.
+    '''
+    database = SqliteDatabase(path)
+    events = database.collection(events_collection)
+    return Repositories(EventRepository(events, legacy_settings_id),
+                        UserRepository(database.collection(users_collection)),
+                        SettingsRepository(
+                            database.collection(settings_collection),
+                            SETTINGS_ID, events, legacy_settings_id))
+
+# ----- KEEPING COPIES UP TO DATE -----
+def polling_requested(variable):
+    '''
+    Checks whether copies should poll their repository instead of listening
+    to it: listening is not available against the Firestore emulator, and
+    polling can be asked for with the given environment variable.
+    '''
+    return 'FIRESTORE_EMULATOR_HOST' in os.environ or variable in os.environ
+
+class RepositorySync():
+    '''
+    Keeps an in-memory copy of a repository's data up to date, with a
+    snapshot listener if possible, or else by re-reading the repository on a
+    background thread.
+
+    >>> import time
+    >>> reads = []
+    >>> sync = RepositorySync('example-poller')
+    >>> sync.start(lambda callback: None, print, lambda: reads.append(1),
+    ...            poll=False, interval=0.01)
+    >>> time.sleep(0.1); sync.stop(); len(reads) > 0
+    True
+    '''
+    def __init__(self, name):
+        '''
+        Attributes:
+        name - the name of the polling thread
+        '''
+        self.name = name
+        self._watch = None
+        self._poller = None
+        self._stop = threading.Event()
+
+    def _poll(self, reload, interval):
+        while not self._stop.wait(interval):
+            try:
+                reload()
+            except Exception:  # Keeps the last good copy
+                continue
+
+    def start(self, on_snapshot, on_changes, reload, poll, interval):
+        '''
+        Starts keeping the copy up to date.
+
+        Inputs:
+        on_snapshot - the repository's on_snapshot method
+        on_changes - the function that applies the changes delivered by the
+                     snapshot listener
+        reload - the function that re-reads the repository into the copy
+        poll - whether to poll even if the repository can notify listeners
+        interval - the number of seconds between polls
+        '''
+        self._stop.clear()
+        if not poll:
+            self._watch = on_snapshot(on_changes)
+        if self._watch is None:
+            self._poller = threading.Thread(target=self._poll,
+                                            args=(reload, interval),
+                                            name=self.name, daemon=True)
+            self._poller.start()
+
+    def stop(self):
+        '''
+        Stops listening for (or polling for) changes.
+        '''
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+# ----- AUTHENTICATION -----
+ImportResult = namedtuple('ImportResult', ['success_count', 'failure_count',
+                                           'errors'])
+
+class LocalAuth():
+    '''
+    Stand-in for firebase_admin.auth that keeps accounts in memory, for
+    running the app without Firebase.
+    '''
+    def __init__(self):
+        self.accounts = {}
+        self._lock = threading.Lock()
+
+    def update_user(self, uid, **kwargs):
+        with self._lock:
+            self.accounts.setdefault(uid, {}).update(kwargs)
+
+    def import_users(self, users):
+        with self._lock:
+            for user in users:
+                self.accounts[user.uid] = {'email': user.email,
+                                           'display_name': user.display_name}
+        return ImportResult(len(users), 0, [])
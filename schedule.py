@@ -0,0 +1,201 @@
+'''
+This module contains the precomputed schedules for each Candidates' Weekend.
+
+This includes:
+    - the ScheduleEntry type - an immutable row of the schedule, with the
+      start and end times stored both as minutes (for sorting) and as the
+      strings that are displayed
+    - the ScheduleIndex class - keeps a sorted schedule for each
+      (Candidates' Weekend number, day) pair, and for each audience (the
+      events that candidates see, and the events that guests see). The
+      schedules are updated one event at a time (by inserting into or
+      removing from the sorted lists), so they never have to be rebuilt or
+      re-sorted, and serving a schedule only returns a prebuilt tuple.
+'''
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from timeutil import display_time
+from events import Event, Access, get_display_name
+
+ALL_WEEKENDS = "All"
+DAYS = ('Friday', 'Saturday')
+
+# The events each audience sees: candidates see the events for candidates
+# and guests see the events for parents, besides the events for everyone
+AUDIENCES = {Access.CANDIDATES: (Access.CANDIDATES, Access.ALL),
+             Access.PARENTS: (Access.PARENTS, Access.ALL)}
+
+ScheduleEntry = namedtuple('ScheduleEntry', [
+    'sort_key', 'full_name', 'name', 'start_min', 'end_min', 'start_time',
+    'end_time', 'day', 'location', 'description', 'cw_number', 'access'])
+
+def make_entry(full_name, event):
+    '''
+    Creates the schedule entry for an event.
+
+    >>> entry = make_entry('Lunch-1', Event('Lunch-1', '12:00', '13:30',
+    ...     'Friday', 'Dining Hall', '', '1', 'All'))
+    >>> entry.name, entry.start_min, entry.start_time, entry.end_time
+    ('Lunch', 720, '12:00 PM', '1:30 PM')
+    '''
+    name = get_display_name(full_name)
+
+    return ScheduleEntry(sort_key=(event.start_min, name, full_name),
+                         full_name=full_name,
+                         name=name,
+                         start_min=event.start_min,
+                         end_min=event.end_min,
+                         start_time=display_time(event.start_min),
+                         end_time=display_time(event.end_min),
+                         day=event.day,
+                         location=event.location,
+                         description=event.description,
+                         cw_number=event.cw_number,
+                         access=event.access)
+
+def is_scheduled(event):
+    '''
+    Checks whether an event (None for removed and added events) belongs on
+    the schedule.
+    '''
+    return (isinstance(event, Event) and event.start_min is not None and
+            event.end_min is not None)
+
+def is_shown(entry, audience):
+    '''
+    Checks whether an audience sees a schedule entry. The audience None (like
+    the admin) sees every entry, and entries without an access level are
+    shown to everyone.
+    '''
+    return (audience is None or entry.access is None or
+            entry.access in AUDIENCES[audience])
+
+class SortedEntries():
+    '''
+    A list of schedule entries kept in order by their sort keys, with an
+    immutable snapshot of the current contents.
+    '''
+    def __init__(self, entries=()):
+        self._keys = []
+        self._entries = []
+        for entry in entries:
+            self.add(entry)
+        self.snapshot = tuple(self._entries)
+
+    def add(self, entry):
+        '''
+        Inserts an entry in order.
+        '''
+        index = bisect_left(self._keys, entry.sort_key)
+        self._keys.insert(index, entry.sort_key)
+        self._entries.insert(index, entry)
+
+    def discard(self, entry):
+        '''
+        Removes an entry, if it is present.
+        '''
+        index = bisect_left(self._keys, entry.sort_key)
+        if index < len(self._keys) and self._keys[index] == entry.sort_key:
+            del self._keys[index]
+            del self._entries[index]
+
+    def publish(self):
+        '''
+        Refreshes the immutable snapshot after a change.
+        '''
+        self.snapshot = tuple(self._entries)
+
+class ScheduleIndex():
+    '''
+    Sorted schedules for every Candidates' Weekend, day and audience.
+
+    >>> index = ScheduleIndex()
+    >>> tour = Event('Tour-All', '14:00', '15:00', 'Friday', '', '', 'All',
+    ...              'Parents')
+    >>> index.on_change('Tour-All', None, tour)
+    >>> index.on_change('Lunch-1', None, Event('Lunch-1', '12:00', '13:00',
+    ...     'Friday', '', '', '1', 'All'))
+    >>> [entry.name for entry in index.day('1', 'Friday')]
+    ['Lunch', 'Tour']
+    >>> [entry.name for entry in index.day('1', 'Friday', Access.CANDIDATES)]
+    ['Lunch']
+    >>> [entry.name for entry in index.day('2', 'Friday', Access.PARENTS)]
+    ['Tour']
+    >>> index.on_change('Tour-All', tour, None)
+    >>> [entry.name for entry in index.day('1', 'Friday')]
+    ['Lunch']
+    '''
+    def __init__(self):
+        # Entries that belong to exactly one weekend (or to all weekends)
+        self._own = {}
+        # Entries shown to an audience for a weekend: the weekend's own
+        # entries plus the entries for all weekends, for that audience
+        self._views = {}
+        self._lock = threading.RLock()
+
+    def _view(self, cw_number, day, audience=None):
+        '''
+        Returns the merged entries for a weekend, day and audience, creating
+        them from the weekend's own entries and the shared entries if needed.
+        '''
+        key = (cw_number, day, audience)
+        if key not in self._views:
+            entries = list(self._own_entries(cw_number, day).snapshot)
+            if cw_number != ALL_WEEKENDS:
+                entries += self._own_entries(ALL_WEEKENDS, day).snapshot
+            self._views[key] = SortedEntries(
+                entry for entry in entries if is_shown(entry, audience))
+        return self._views[key]
+
+    def _own_entries(self, cw_number, day):
+        return self._own.setdefault((cw_number, day), SortedEntries())
+
+    def _affected_views(self, entry):
+        '''
+        Returns the merged views that show an entry. Views that have not been
+        created yet will include the change when they are.
+        '''
+        return [view for (cw_number, day, audience), view
+                in self._views.items()
+                if day == entry.day and
+                entry.cw_number in (cw_number, ALL_WEEKENDS) and
+                is_shown(entry, audience)]
+
+    def _apply(self, entry, add):
+        targets = ([self._own_entries(entry.cw_number, entry.day)] +
+                   self._affected_views(entry))
+        for target in targets:
+            if add:
+                target.add(entry)
+            else:
+                target.discard(entry)
+            target.publish()
+
+    def on_change(self, full_name, old, new):
+        '''
+        Updates the schedules after one event was added (old is None),
+        removed (new is None) or edited. Meant to be subscribed to the event
+        catalog. Documents that are not events, and events without times,
+        are ignored.
+        '''
+        with self._lock:
+            if is_scheduled(old):
+                self._apply(make_entry(full_name, old), add=False)
+            if is_scheduled(new):
+                self._apply(make_entry(full_name, new), add=True)
+
+    def day(self, cw_number, day, audience=None):
+        '''
+        Returns the sorted entries for a weekend and day as a tuple, with
+        only the events an audience (Access.CANDIDATES or Access.PARENTS)
+        sees if one is given.
+        '''
+        with self._lock:
+            return self._view(cw_number, day, audience).snapshot
+
+    def weekend(self, cw_number, audience=None):
+        '''
+        Returns the sorted Friday and Saturday entries for a weekend.
+        '''
+        return tuple(self.day(cw_number, day, audience) for day in DAYS)
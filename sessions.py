@@ -0,0 +1,345 @@
+'''
+This module contains the candidates' login sessions.
+
+When a candidate logs in, a session is created that holds their user id,
+their Candidates' Weekend number and their profile (their users.User, without
+the password hash), and the browser gets a signed cookie with the session's
+id. The pages of their visit then get everything they need about the user
+from the session, without looking the user up.
+
+Sessions are kept by a SessionStore: an in-process LRU cache, in front of an
+optional backend shared by all of the server's processes:
+    - SqliteSessionBackend - a local SQLite database file (for several
+      workers on one machine)
+    - RedisSessionBackend - a Redis (or Redis-compatible) server, for several
+      machines; needs the redis package
+
+Sessions expire after SESSION_TTL seconds, and the admin can revoke all of a
+user's sessions. Processes trust their cached copy of a session for
+SESSION_CACHE_TTL seconds, so a revocation made in another process takes
+effect within that time.
+'''
+import binascii
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from itsdangerous import BadSignature, Signer
+from caching import LRUCache
+from users import User
+
+SESSION_COOKIE = 'cw_session'
+
+# Sessions last for the whole Candidates' Weekend
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 3 * 24 * 60 * 60))
+SESSION_CACHE_SIZE = 4096
+SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 60))
+
+Session = namedtuple('Session', ['session_id', 'user_id', 'cw_number', 'user',
+                                 'expires'])
+
+def load_secret_key(path):
+    '''
+    Returns the secret key stored in a file, creating the file with a new
+    random key the first time. All of the server's processes share the
+    file, so they all accept each other's cookies.
+    '''
+    try:
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path) as key_file:
+            return key_file.read().strip()
+    key = secrets.token_hex(32)
+    with os.fdopen(descriptor, 'w') as key_file:
+        key_file.write(key)
+    return key
+
+def encode_session(session):
+    '''
+    Converts a session to a dictionary that can be stored as JSON.
+    '''
+    return {'user_id': session.user_id, 'cw_number': session.cw_number,
+            'user': session.user.to_dict(), 'expires': session.expires}
+
+def decode_session(session_id, data):
+    '''
+    Creates a session from its stored dictionary.
+    '''
+    user = User.from_dict(data['user_id'], data['user']).replace(password=None)
+    return Session(session_id, data['user_id'], data['cw_number'], user,
+                   data['expires'])
+
+# ----- BACKENDS -----
+class SqliteSessionBackend():
+    '''
+    Sessions stored in a local SQLite database file.
+
+    >>> backend = SqliteSessionBackend(':memory:')
+    >>> backend.put('s1', 'kaoki', {'cw_number': '1'}, time.time() + 60)
+    >>> backend.get('s1'), backend.find_user('kaoki')
+    ({'cw_number': '1'}, ['s1'])
+    >>> backend.delete('s1'); backend.get('s1') is None
+    True
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.connection().execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'id TEXT PRIMARY KEY, user_id TEXT NOT NULL, data TEXT NOT NULL, '
+            'expires REAL NOT NULL)')
+        self.connection().execute(
+            'CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user_id)')
+
+    def connection(self):
+        '''
+        Returns this thread's connection to the database.
+        '''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30,
+                                         isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def get(self, session_id):
+        '''
+        Returns a session's data, or None if there is no such session (or
+        it has expired).
+        '''
+        row = self.connection().execute(
+            'SELECT data FROM sessions WHERE id = ? AND expires > ?',
+            (session_id, time.time())).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, session_id, user_id, data, expires):
+        '''
+        Stores a session, and forgets the sessions that have expired.
+        '''
+        connection = self.connection()
+        connection.execute('DELETE FROM sessions WHERE expires <= ?',
+                           (time.time(),))
+        connection.execute('INSERT OR REPLACE INTO sessions '
+                           '(id, user_id, data, expires) VALUES (?, ?, ?, ?)',
+                           (session_id, user_id, json.dumps(data), expires))
+
+    def delete(self, session_id):
+        '''
+        Removes a session.
+        '''
+        self.connection().execute('DELETE FROM sessions WHERE id = ?',
+                                  (session_id,))
+
+    def find_user(self, user_id):
+        '''
+        Returns the ids of a user's sessions.
+        '''
+        return [session_id for session_id, in self.connection().execute(
+            'SELECT id FROM sessions WHERE user_id = ? AND expires > ?',
+            (user_id, time.time()))]
+
+class RedisSessionBackend():
+    '''
+    Sessions stored in a Redis (or Redis-compatible) server, which removes
+    them when they expire.
+    '''
+    PREFIX = 'cw:session:'
+    USER_PREFIX = 'cw:user-sessions:'
+
+    def __init__(self, url):
+        # Only needed when sessions are kept in Redis
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, session_id):
+        data = self.client.get(self.PREFIX + session_id)
+        return json.loads(data) if data is not None else None
+
+    def put(self, session_id, user_id, data, expires):
+        seconds = max(1, int(expires - time.time()))
+        user_key = self.USER_PREFIX + user_id
+        pipeline = self.client.pipeline()
+        pipeline.set(self.PREFIX + session_id, json.dumps(data), ex=seconds)
+        pipeline.sadd(user_key, session_id)
+        pipeline.expire(user_key, SESSION_TTL)
+        pipeline.execute()
+
+    def delete(self, session_id):
+        self.client.delete(self.PREFIX + session_id)
+
+    def find_user(self, user_id):
+        session_ids = [session_id.decode('utf-8') for session_id in
+                       self.client.smembers(self.USER_PREFIX + user_id)]
+        # Forgets the sessions that have expired
+        expired = [session_id for session_id in session_ids
+                   if not self.client.exists(self.PREFIX + session_id)]
+        if expired:
+            self.client.srem(self.USER_PREFIX + user_id, *expired)
+        return [session_id for session_id in session_ids
+                if session_id not in expired]
+
+def make_session_backend(url):
+    '''
+    Creates the session backend for a URL: 'redis://...' for Redis,
+    'sqlite:///path' for a SQLite database file, or '' for no backend (the
+    sessions are then only kept in the process's memory).
+    '''
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisSessionBackend(url)
+    if url.startswith('sqlite:///'):
+        return SqliteSessionBackend(url[len('sqlite:///'):])
+    raise ValueError('unknown session backend: ' + url)
+
+# ----- STORE -----
+class SessionStore():
+    '''
+    Login sessions, by session id, with signed cookies.
+
+    >>> store = SessionStore('secret', SqliteSessionBackend(':memory:'))
+    >>> user = User.from_dict('kaoki', {'cw_number': '1', 'password': 'hash'})
+    >>> cookie = store.cookie_value(store.create('kaoki', user))
+    >>> session = store.from_cookie(cookie)
+    >>> session.user_id, session.cw_number, session.user.password
+    ('kaoki', '1', None)
+    >>> tampered = cookie[:-1] + ('x' if cookie[-1] != 'x' else 'y')
+    >>> store.from_cookie(tampered) is None
+    True
+    >>> store.revoke_user('kaoki'), store.from_cookie(cookie)
+    (1, None)
+    '''
+    def __init__(self, secret_key, backend=None, ttl=SESSION_TTL,
+                 maxsize=SESSION_CACHE_SIZE, cache_ttl=SESSION_CACHE_TTL):
+        '''
+        Attributes:
+        secret_key - the key that the session cookies are signed with
+        backend - where sessions are shared between processes, or None to
+                  keep them in this process only
+        ttl - the number of seconds a session lasts
+        cache_ttl - the number of seconds a process trusts its copy of a
+                    session before reading it from the backend again
+        '''
+        self.signer = Signer(secret_key, salt='cw-session')
+        self.backend = backend
+        self.ttl = ttl
+        # Without a backend, the cache is where the sessions are kept
+        self.sessions = LRUCache(maxsize=maxsize,
+                                 ttl=cache_ttl if backend is not None else ttl)
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def _cache(self, session):
+        self.sessions.put(session.session_id, session)
+        with self._lock:
+            self._by_user.setdefault(session.user_id, set()).add(
+                session.session_id)
+
+    def _forget(self, user_id, session_id):
+        self.sessions.invalidate(session_id)
+        with self._lock:
+            self._by_user.get(user_id, set()).discard(session_id)
+
+    def _save(self, session):
+        if self.backend is not None:
+            self.backend.put(session.session_id, session.user_id,
+                             encode_session(session), session.expires)
+        self._cache(session)
+
+    def create(self, user_id, user):
+        '''
+        Starts a session for a user who just logged in.
+
+        Returns: the new Session
+        '''
+        session = Session(secrets.token_urlsafe(32), user_id, user.cw_number,
+                          user.replace(password=None), time.time() + self.ttl)
+        self._save(session)
+        return session
+
+    def get(self, session_id):
+        '''
+        Returns a session, or None if there is no such session (or it has
+        expired or been revoked).
+        '''
+        found, session = self.sessions.lookup(session_id)
+        if not found and self.backend is not None:
+            data = self.backend.get(session_id)
+            if data is not None:
+                session = decode_session(session_id, data)
+                self._cache(session)
+        if session is None or session.expires <= time.time():
+            return None
+        return session
+
+    def cookie_value(self, session):
+        '''
+        Returns the signed value of the cookie for a session.
+        '''
+        return self.signer.sign(session.session_id).decode('ascii')
+
+    def from_cookie(self, value):
+        '''
+        Returns the session that a cookie points to, or None if the cookie is
+        missing, has been tampered with, or points to no valid session.
+        '''
+        if not value:
+            return None
+        try:
+            session_id = self.signer.unsign(value).decode('ascii')
+        except (BadSignature, binascii.Error, UnicodeError):
+            return None
+        return self.get(session_id)
+
+    def _user_sessions(self, user_id):
+        with self._lock:
+            session_ids = set(self._by_user.get(user_id, ()))
+        if self.backend is not None:
+            session_ids.update(self.backend.find_user(user_id))
+        return session_ids
+
+    def revoke(self, session):
+        '''
+        Ends a session (for example when the user logs out).
+        '''
+        if self.backend is not None:
+            self.backend.delete(session.session_id)
+        self._forget(session.user_id, session.session_id)
+
+    def revoke_user(self, user_id):
+        '''
+        Ends every session of a user.
+
+        Returns: the number of sessions ended
+        '''
+        session_ids = self._user_sessions(user_id)
+        for session_id in session_ids:
+            if self.backend is not None:
+                self.backend.delete(session_id)
+            self._forget(user_id, session_id)
+        return len(session_ids)
+
+    def refresh_user(self, user_id, load_user):
+        '''
+        Updates the profile in a user's sessions after the user changed.
+        load_user() returns the new User (or None if the user was deleted,
+        which ends their sessions), and is only called if the user has
+        sessions.
+        '''
+        session_ids = self._user_sessions(user_id)
+        if not session_ids:
+            return
+        user = load_user()
+        if user is None:
+            self.revoke_user(user_id)
+            return
+
+        for session_id in session_ids:
+            session = self.get(session_id)
+            if session is not None:
+                self._save(session._replace(
+                    cw_number=user.cw_number,
+                    user=user.replace(password=None)))
@@ -0,0 +1,151 @@
+'''
+This module contains the Settings class, an in-memory copy of the app's
+general information (like the current Candidates' Weekend number).
+
+The general information is kept in one versioned document, in a collection
+of its own. It is read once when the app starts and then kept up to date,
+either by a Firestore snapshot listener or by polling the repository (like
+the event catalog), so that serving a page never reads it from the
+database.
+
+Changing the current weekend (a rollover) is one atomic update of the
+document, which sets the new weekend number and increases the version.
+Listeners are told about the change, so that each process can load the new
+weekend's pages into its caches. Older versions of the document (for
+example from a poll that started before a rollover) are ignored.
+'''
+import os
+import threading
+import time
+from repositories import RepositorySync, polling_requested
+
+CW_NUMBER = 'cw_number'
+VERSION = 'version'
+UPDATED = 'updated'
+
+POLL_INTERVAL = float(os.environ.get('SETTINGS_POLL_INTERVAL', 15))
+
+def get_version(settings):
+    '''
+    Returns the version of a settings document (0 for documents written
+    before the settings had versions).
+
+    >>> get_version({'cw_number': '1'}), get_version({'version': 3})
+    (0, 3)
+    '''
+    return settings.get(VERSION, 0)
+
+class Settings():
+    '''
+    In-memory copy of the general information.
+
+    >>> from repositories import SqliteDatabase, SettingsRepository
+    >>> repository = SettingsRepository(
+    ...     SqliteDatabase(':memory:').collection('settings'), 'general')
+    >>> repository.set({'cw_number': '1'})
+    >>> settings = Settings()
+    >>> settings.subscribe(lambda old, new: print(old.get('cw_number'), '->',
+    ...                                           new['cw_number']))
+    >>> settings.start(repository, poll=False)
+    None -> 1
+    >>> settings.rollover('2')['version']
+    1 -> 2
+    1
+    >>> settings.cw_number(), settings.version()
+    ('2', 1)
+    >>> settings.apply({'cw_number': '1'}); settings.cw_number()
+    '2'
+    >>> settings.stop()
+    '''
+    def __init__(self):
+        self.repository = None
+        self.settings = {}
+        self.loaded = False
+        self._listeners = []
+        self._sync = RepositorySync('settings-poller')
+        self._lock = threading.Lock()
+
+    # ----- reading -----
+    def cw_number(self):
+        '''
+        Returns the current Candidates' Weekend number, or None if the
+        settings have not been loaded.
+        '''
+        return self.settings.get(CW_NUMBER)
+
+    def version(self):
+        '''
+        Returns the version of the settings.
+        '''
+        return get_version(self.settings)
+
+    def get(self):
+        '''
+        Returns a copy of the settings, as a dictionary.
+        '''
+        return dict(self.settings)
+
+    # ----- writing -----
+    def subscribe(self, listener):
+        '''
+        Registers a function to be called as listener(old, new) whenever the
+        settings change, with the old and new settings as dictionaries.
+        '''
+        self._listeners.append(listener)
+
+    def apply(self, settings):
+        '''
+        Replaces the in-memory settings, unless they are older than the
+        current ones.
+        '''
+        with self._lock:
+            old = self.settings
+            if self.loaded and (get_version(settings) < get_version(old) or
+                                settings == old):
+                return
+            self.settings = dict(settings)
+            self.loaded = True
+
+        for listener in self._listeners:
+            listener(old, self.settings)
+
+    def rollover(self, cw_number):
+        '''
+        Makes a Candidates' Weekend the current one, in one atomic update of
+        the settings document that also increases its version.
+
+        Returns: the new settings
+        '''
+        def change(settings):
+            return dict(settings, cw_number=cw_number,
+                        version=get_version(settings) + 1,
+                        updated=time.time())
+
+        settings = self.repository.update(change)
+        self.apply(settings)
+        return settings
+
+    # ----- keeping up to date -----
+    def start(self, repository, poll=None, interval=POLL_INTERVAL):
+        '''
+        Loads the settings from the settings repository and keeps them in
+        sync with it.
+
+        Uses a snapshot listener on the settings document if possible. The
+        document is re-read every interval seconds instead if poll is True,
+        if poll is None and the FIRESTORE_EMULATOR_HOST or SETTINGS_POLL
+        environment variable is set, or if the repository cannot notify
+        listeners.
+        '''
+        self.repository = repository
+        self.apply(repository.get())
+        if poll is None:
+            poll = polling_requested('SETTINGS_POLL')
+        self._sync.start(repository.on_snapshot, self.apply,
+                         lambda: self.apply(repository.get()), poll, interval)
+
+    def stop(self):
+        '''
+        Stops listening for (or polling for) changes to the settings.
+        '''
+        self._sync.stop()
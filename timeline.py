@@ -0,0 +1,268 @@
+'''
+This module builds each candidate's personal timeline for Candidates'
+Weekend and finds the conflicts in it.
+
+A candidate's day is made of the shared events of their Candidates' Weekend
+(from schedule.ScheduleIndex) and of their own slots from the users
+collection:
+    - their individual interview, at their interview_time, which is added to
+      the schedule as an entry of its own
+    - their model class and group interview, whose locations are filled in
+      on the shared 'Model Class' and 'Group Interview' events
+
+Conflicts are found with an IntervalTree per weekend and day, built from the
+events that candidates see. The trees are rebuilt only when the schedule
+changes, so checking one candidate takes O(log n) time, and report() checks
+every candidate of a weekend at once.
+'''
+import heapq
+import os
+import threading
+from collections import namedtuple
+from events import Access, Day
+from schedule import ScheduleEntry, DAYS
+from timeutil import display_time
+
+# The day and length of the individual interviews
+INTERVIEW_DAY = Day(os.environ.get('INTERVIEW_DAY', 'Saturday'))
+INTERVIEW_MINUTES = int(os.environ.get('INTERVIEW_MINUTES', 30))
+
+INTERVIEW_EVENT = 'Individual Interview'
+MODEL_CLASS_EVENT = 'Model Class'
+GROUP_INTERVIEW_EVENT = 'Group Interview'
+
+# Shared events during which the individual interviews take place, which
+# do not conflict with them
+INTERVIEW_BLOCKS = (INTERVIEW_EVENT, 'Individual Interviews')
+
+Conflict = namedtuple('Conflict', ['user_id', 'name', 'slot', 'event'])
+
+class IntervalTree():
+    '''
+    Static interval tree: the intervals are kept sorted by start time in an
+    implicit balanced binary tree (the middle of each range is the root of
+    that range), and every node knows the latest end time in its subtree.
+    Finding the intervals that overlap a query takes O(log n + k) time for k
+    results.
+
+    >>> tree = IntervalTree([(540, 600, 'a'), (570, 630, 'b'),
+    ...                      (700, 760, 'c'), (600, 615, 'd')])
+    >>> tree.overlapping(590, 605)
+    ['a', 'b', 'd']
+    >>> tree.overlapping(630, 700), len(tree)
+    ([], 4)
+    '''
+    def __init__(self, intervals):
+        '''
+        Attributes:
+        intervals - (start, end, item) tuples, where an interval covers the
+                    times from start up to (but not including) end
+        '''
+        self._intervals = sorted(intervals, key=lambda interval:
+                                 (interval[0], interval[1]))
+        self._max_end = [None] * len(self._intervals)
+        self._build(0, len(self._intervals))
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def _build(self, low, high):
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        ends = [self._intervals[middle][1], self._build(low, middle),
+                self._build(middle + 1, high)]
+        self._max_end[middle] = max(end for end in ends if end is not None)
+        return self._max_end[middle]
+
+    def overlapping(self, start, end):
+        '''
+        Returns the items of the intervals that overlap the times from start
+        up to end, in order of their start times.
+        '''
+        found = []
+        self._search(0, len(self._intervals), start, end, found)
+        return found
+
+    def _search(self, low, high, start, end, found):
+        if low >= high:
+            return
+        middle = (low + high) // 2
+        # Nothing in this subtree ends after the query starts
+        if self._max_end[middle] <= start:
+            return
+        self._search(low, middle, start, end, found)
+
+        interval_start, interval_end, item = self._intervals[middle]
+        # This interval, and everything after it, starts too late
+        if interval_start >= end:
+            return
+        if interval_end > start:
+            found.append(item)
+        self._search(middle + 1, high, start, end, found)
+
+def make_interview_entry(user, day=INTERVIEW_DAY, minutes=INTERVIEW_MINUTES):
+    '''
+    Creates the schedule entry for a user's individual interview, or returns
+    None if the user has no interview time.
+    '''
+    if user.interview_min is None:
+        return None
+    start_min = user.interview_min
+    end_min = start_min + minutes
+    return ScheduleEntry(sort_key=(start_min, INTERVIEW_EVENT, INTERVIEW_EVENT),
+                         full_name=INTERVIEW_EVENT,
+                         name=INTERVIEW_EVENT,
+                         start_min=start_min,
+                         end_min=end_min,
+                         start_time=display_time(start_min),
+                         end_time=display_time(end_min),
+                         day=day,
+                         location=user.interview_location or '',
+                         description='',
+                         cw_number=user.cw_number,
+                         access=Access.CANDIDATES)
+
+def get_personal_locations(user):
+    '''
+    Returns the locations to show on the shared events that are different
+    for each candidate, by event name.
+    '''
+    model_class = ' - '.join(part for part in (user.model_class,
+                                               user.model_class_location)
+                             if part)
+    locations = {MODEL_CLASS_EVENT: model_class,
+                 GROUP_INTERVIEW_EVENT: user.group_interview_location}
+    return {name: location for name, location in locations.items()
+            if location}
+
+class TimelineEngine():
+    '''
+    Builds personal timelines and finds schedule conflicts, from the shared
+    schedules of a ScheduleIndex.
+
+    >>> from events import Event
+    >>> from schedule import ScheduleIndex
+    >>> from users import User
+    >>> schedules = ScheduleIndex()
+    >>> for event in [Event('Lunch-1', '12:00', '13:00', 'Saturday', '', '',
+    ...                     '1', 'All'),
+    ...               Event('Model Class-1', '14:00', '15:00', 'Saturday', '',
+    ...                     '', '1', 'Candidates')]:
+    ...     schedules.on_change(event.name, None, event)
+    >>> engine = TimelineEngine(schedules, Day.SATURDAY, 30)
+    >>> user = User('kaoki', '', 'A', '12:45', 'Room 1', '', '', '1', 'Kai',
+    ...             'Robotics', 'AC 109', '')
+    >>> [(entry.name, entry.start_time, entry.location)
+    ...  for entry in engine.timeline(user)[1]]
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [('Lunch', '12:00 PM', ''), ('Individual Interview', '12:45 PM', 'Room 1'),
+     ('Model Class', '2:00 PM', 'Robotics - AC 109')]
+    >>> report = engine.report(['kaoki'], [user])
+    >>> report['candidates'], [(conflict['event'], conflict['event_time'])
+    ...                        for conflict in report['conflicts']]
+    (1, [('Lunch-1', '12:00 PM - 1:00 PM')])
+    '''
+    def __init__(self, schedules, interview_day=INTERVIEW_DAY,
+                 interview_minutes=INTERVIEW_MINUTES):
+        '''
+        Attributes:
+        schedules - the ScheduleIndex with the shared events
+        interview_day - the day of the individual interviews
+        interview_minutes - the length of an individual interview
+        '''
+        self.schedules = schedules
+        self.interview_day = interview_day
+        self.interview_minutes = interview_minutes
+        # (weekend, day) -> (schedule the tree was built from, tree)
+        self._trees = {}
+        self._lock = threading.Lock()
+
+    def tree(self, cw_number, day):
+        '''
+        Returns the interval tree of the events that candidates attend on a
+        day of a weekend, rebuilding it if the schedule changed.
+        '''
+        entries = self.schedules.day(cw_number, day, Access.CANDIDATES)
+        with self._lock:
+            built = self._trees.get((cw_number, day))
+            if built is None or built[0] is not entries:
+                tree = IntervalTree(
+                    (entry.start_min, entry.end_min, entry)
+                    for entry in entries if entry.name not in INTERVIEW_BLOCKS)
+                built = (entries, tree)
+                self._trees[(cw_number, day)] = built
+        return built[1]
+
+    def personal_entries(self, user):
+        '''
+        Returns the entries that only appear in one user's schedule.
+        '''
+        interview = make_interview_entry(user, self.interview_day,
+                                         self.interview_minutes)
+        return (interview,) if interview is not None else ()
+
+    def personal_key(self, user):
+        '''
+        Returns everything a user's timeline depends on besides the shared
+        schedule, so that users with the same slots can share a cached page.
+        '''
+        return (self.personal_entries(user),
+                tuple(sorted(get_personal_locations(user).items())))
+
+    def timeline(self, user):
+        '''
+        Returns a user's Friday and Saturday schedules, with their personal
+        entries merged in and their locations filled in.
+        '''
+        personal = self.personal_entries(user)
+        locations = get_personal_locations(user)
+
+        days = []
+        for day in DAYS:
+            shared = [entry._replace(location=locations[entry.name])
+                      if entry.name in locations else entry
+                      for entry in self.schedules.day(user.cw_number, day,
+                                                      Access.CANDIDATES)]
+            own = [entry for entry in personal if entry.day == day]
+            days.append(tuple(heapq.merge(shared, own,
+                                          key=lambda entry: entry.sort_key)))
+        return tuple(days)
+
+    def conflicts(self, user_id, user):
+        '''
+        Returns the conflicts between a user's personal entries and the
+        events they are expected to attend.
+        '''
+        return [Conflict(user_id, user.name, entry, event)
+                for entry in self.personal_entries(user)
+                for event in self.tree(user.cw_number, entry.day).overlapping(
+                    entry.start_min, entry.end_min)]
+
+    def report(self, user_ids, users, cw_number=None):
+        '''
+        Checks every candidate (of one weekend, if cw_number is given) for
+        conflicts.
+
+        Returns: a dictionary with the number of candidates checked and the
+        conflicts found, for the admin's conflict report
+        '''
+        checked = 0
+        conflicts = []
+        for user_id, user in zip(user_ids, users):
+            if cw_number is not None and user.cw_number != cw_number:
+                continue
+            checked += 1
+            conflicts += self.conflicts(user_id, user)
+
+        return {'candidates': checked,
+                'conflicts': [{'user_id': conflict.user_id,
+                               'name': conflict.name,
+                               'slot': conflict.slot.name,
+                               'day': str(conflict.slot.day),
+                               'slot_time': conflict.slot.start_time + ' - ' +
+                                            conflict.slot.end_time,
+                               'event': conflict.event.full_name,
+                               'event_time': conflict.event.start_time +
+                                             ' - ' + conflict.event.end_time}
+                              for conflict in conflicts]}
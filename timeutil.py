@@ -0,0 +1,207 @@
+'''
+This module converts times of day between the formats the app uses:
+    - minutes after midnight (ints, used for sorting and comparing)
+    - 'HH:MM' or 'HH:MM:SS' strings (stored in the database and used by time
+      inputs in forms)
+    - conventional display strings like '9:05 AM'
+
+Every minute of the day is converted to its strings once, when the module is
+loaded, so formatting a time is a lookup in a 1440-entry table. Parsing a
+single time is a dictionary lookup for the usual 'H:MM' and 'HH:MM' forms,
+and parse_times parses a whole column of times at once with NumPy (for
+example the interview times of an imported spreadsheet).
+
+Run this module to compare it with the functions the app used before (the
+to_min and to_hours functions of the old sortbytime module):
+
+    python timeutil.py
+'''
+import timeit
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+
+# Returned by parse_times for values that are not times
+INVALID = -1
+
+def _display(minutes):
+    hour, minute = divmod(minutes, 60)
+    marker = 'AM' if hour < 12 else 'PM'
+    return '{}:{:02d} {}'.format(hour % 12 or 12, minute, marker)
+
+# Conventional display string and 'HH:MM' string of every minute of the day
+DISPLAY_TIMES = tuple(_display(minutes) for minutes in range(MINUTES_PER_DAY))
+CLOCK_TIMES = tuple('{:02d}:{:02d}'.format(*divmod(minutes, 60))
+                    for minutes in range(MINUTES_PER_DAY))
+
+# Minutes for every 'HH:MM' and 'H:MM' string
+_PARSED = {text: minutes for minutes, text in enumerate(CLOCK_TIMES)}
+_PARSED.update({text[1:]: minutes for text, minutes in list(_PARSED.items())
+                if text.startswith('0')})
+
+_DISPLAY_ARRAY = np.array(DISPLAY_TIMES)
+_CLOCK_ARRAY = np.array(CLOCK_TIMES)
+
+def parse_time(value):
+    '''
+    Converts a time to minutes after midnight. Accepts 'H:MM', 'HH:MM' and
+    'HH:MM:SS' strings, and numbers of minutes.
+
+    Returns: the number of minutes, or None if the value is not a time
+
+    >>> parse_time('09:05'), parse_time('9:05'), parse_time('13:30:00')
+    (545, 545, 810)
+    >>> parse_time(75), parse_time('') is None, parse_time('25:00') is None
+    (75, True, True)
+    '''
+    if isinstance(value, int):
+        return value
+    minutes = _PARSED.get(value)
+    if minutes is None and isinstance(value, str):
+        # Allows seconds and surrounding spaces
+        minutes = _PARSED.get(value.strip()[:5].rstrip(':'))
+    return minutes
+
+def parse_times(values):
+    '''
+    Converts a column of 'H:MM', 'HH:MM' or 'HH:MM:SS' strings to minutes
+    after midnight, all at once.
+
+    Returns: a NumPy array of minutes, with INVALID for values that are not
+    times
+
+    >>> parse_times(['09:05', '9:05', '23:59:59', 'noon', '', '24:00']).tolist()
+    [545, 545, 1439, -1, -1, -1]
+    '''
+    text = np.char.strip(np.asarray(values, dtype='U8')).astype('U8')
+    count = len(text)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # The code points of each string, with '0' as 0, one row per string
+    digits = text.view(np.uint32).reshape(count, 8).astype(np.int64) - ord('0')
+    colon = np.char.find(text, ':')
+    rows = np.arange(count)
+    start = np.clip(colon, 0, 5)
+
+    hour_tens = np.where(colon == 2, digits[:, 0], 0)
+    hour_ones = digits[rows, np.clip(colon - 1, 0, 7)]
+    minute_tens = digits[rows, start + 1]
+    minute_ones = digits[rows, start + 2]
+    after = digits[rows, start + 3]
+
+    hours = hour_tens * 10 + hour_ones
+    valid = (((colon == 1) | (colon == 2)) &
+             (hour_tens >= 0) & (hour_tens <= 9) &
+             (hour_ones >= 0) & (hour_ones <= 9) &
+             (minute_tens >= 0) & (minute_tens <= 5) &
+             (minute_ones >= 0) & (minute_ones <= 9) &
+             # Nothing but seconds may follow the minutes
+             ((after == ord(':') - ord('0')) | (after == -ord('0'))) &
+             (hours < 24))
+    return np.where(valid, hours * 60 + minute_tens * 10 + minute_ones,
+                    INVALID)
+
+def display_time(minutes):
+    '''
+    Converts minutes after midnight to a conventional time, like '9:05 AM'.
+
+    >>> display_time(545), display_time(0), display_time(12 * 60 + 30)
+    ('9:05 AM', '12:00 AM', '12:30 PM')
+    '''
+    return DISPLAY_TIMES[minutes % MINUTES_PER_DAY]
+
+def clock_time(minutes):
+    '''
+    Converts minutes after midnight to an 'HH:MM' string, or to '' if there
+    is no time.
+
+    >>> clock_time(545), clock_time(None)
+    ('09:05', '')
+    '''
+    if minutes is None:
+        return ''
+    return CLOCK_TIMES[minutes % MINUTES_PER_DAY]
+
+def display_times(minutes):
+    '''
+    Converts a column of minutes to conventional times at once.
+
+    >>> display_times([545, 1439])
+    ['9:05 AM', '11:59 PM']
+    '''
+    return _DISPLAY_ARRAY[np.asarray(minutes) % MINUTES_PER_DAY].tolist()
+
+def clock_times(minutes):
+    '''
+    Converts a column of minutes to 'HH:MM' strings at once.
+
+    >>> clock_times([545, 1439])
+    ['09:05', '23:59']
+    '''
+    return _CLOCK_ARRAY[np.asarray(minutes) % MINUTES_PER_DAY].tolist()
+
+def convert_conventional(time_string):
+    '''
+    Converts an 'HH:MM' string to a conventional time, or to '' if it is not
+    a time.
+
+    >>> convert_conventional('14:05')
+    '2:05 PM'
+    '''
+    minutes = parse_time(time_string)
+    return display_time(minutes) if minutes is not None else ''
+
+# ----- BENCHMARK -----
+def _old_to_min(time):
+    # sortbytime.to_min, as it was before this module
+    time_list = time.split(':')
+    time_list = [int(t) for t in time_list]
+    return time_list[0]*60 + time_list[1]
+
+def _old_to_hours(minutes):
+    # sortbytime.to_hours, as it was before this module
+    h = str(minutes//60)
+    time_marker = "AM"
+    if int(h) > 12:
+        hour = int(h)
+        hour -= 12
+        h = str(hour)
+        time_marker = "PM"
+    if int(h) == 12:
+        time_marker = "PM"
+    m = str(minutes%60)
+    if int(m) < 10:
+        m += '0'
+    return h + ':' + m + " " + time_marker
+
+def benchmark(count=10000, repeat=5):
+    '''
+    Times parsing and formatting count times with this module and with the
+    functions sortbytime used before.
+
+    Returns: a dictionary with the best time (in seconds) of each method
+    '''
+    times = [CLOCK_TIMES[(i * 7) % MINUTES_PER_DAY] for i in range(count)]
+    minutes = [(i * 7) % MINUTES_PER_DAY for i in range(count)]
+
+    def best(function):
+        return min(timeit.repeat(function, number=1, repeat=repeat))
+
+    return {
+        'parse: sortbytime.to_min': best(
+            lambda: [_old_to_min(text) for text in times]),
+        'parse: parse_time': best(lambda: [parse_time(text) for text in times]),
+        'parse: parse_times': best(lambda: parse_times(times)),
+        'format: sortbytime.to_hours': best(
+            lambda: [_old_to_hours(value) for value in minutes]),
+        'format: display_time': best(
+            lambda: [display_time(value) for value in minutes]),
+        'format: display_times': best(lambda: display_times(minutes)),
+    }
+
+if __name__ == '__main__':
+    COUNT = 10000
+    for NAME, SECONDS in benchmark(COUNT).items():
+        print('{:<30} {:8.2f} ms for {} times'.format(NAME, SECONDS * 1000,
+                                                      COUNT))
@@ -0,0 +1,191 @@
+'''
+This module contains the UserDirectory class, an in-process cache of the
+users (as immutable users.User records).
+
+The directory keeps:
+    - an index from email address to user id, so that logging in does not
+      need a query on the users collection
+    - a size-bounded cache of the users' records, whose
+      entries expire after a time-to-live, so that the pages of one
+      candidate's visit share a single document read
+
+The directory is warmed with every user when the app starts, and the routes
+that change users invalidate the users they change. Changes made by other
+processes (other web workers, or the admin pages of another instance) reach
+the directory through a snapshot listener on the users collection, or by
+re-reading the collection if the database cannot notify listeners.
+'''
+import os
+import threading
+from caching import LRUCache
+from repositories import RepositorySync, polling_requested
+from users import User
+
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 10 * 60
+POLL_INTERVAL = float(os.environ.get('USERS_POLL_INTERVAL', 15))
+
+class UserDirectory():
+    '''
+    Cache of users by id, with an index by email address.
+
+    >>> reads = []
+    >>> def load(user_id):
+    ...     reads.append(user_id)
+    ...     return User.from_dict(user_id, {'email': user_id + '@olin.edu',
+    ...                                     'cw_number': '1'})
+    >>> directory = UserDirectory(load, lambda email: None)
+    >>> directory.warm(['kaoki'], [User.from_dict('kaoki',
+    ...                                           {'email': 'kaoki@olin.edu'})])
+    >>> directory.find_by_email('kaoki@olin.edu')
+    'kaoki'
+    >>> directory.get('mku').cw_number, directory.get('mku').cw_number
+    ('1', '1')
+    >>> reads
+    ['mku']
+    '''
+    def __init__(self, load_user, find_user_id, maxsize=USER_CACHE_SIZE,
+                 ttl=USER_CACHE_TTL):
+        '''
+        Creates a user directory.
+
+        Attributes:
+        load_user: function that reads a user from the database by user id,
+                   as a User (returning None if there is no such user)
+        find_user_id: function that looks up a user id in the database by
+                      email address (returning None if there is no such user)
+        '''
+        self.load_user = load_user
+        self.find_user_id = find_user_id
+        self.users = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._emails = {}
+        self._lock = threading.Lock()
+        self._sync = RepositorySync('user-directory-poller')
+
+    def _index(self, user_id, user):
+        if user.email:
+            with self._lock:
+                self._emails[user.email.lower()] = user_id
+
+    def put(self, user_id, user):
+        '''
+        Caches a user.
+        '''
+        self.users.put(user_id, user)
+        self._index(user_id, user)
+
+    def warm(self, user_ids, users):
+        '''
+        Caches many users at once, for example all the users returned by
+        get_users().
+        '''
+        for user_id, user in zip(user_ids, users):
+            self.put(user_id, user)
+
+    def get(self, user_id):
+        '''
+        Returns a user, reading them from the database only if they are not
+        cached. Returns None if there is no such user. Users are immutable,
+        so the cached record itself is returned.
+        '''
+        found, user = self.users.lookup(user_id)
+        if not found:
+            user = self.load_user(user_id)
+            if user is None:
+                return None
+            self.put(user_id, user)
+        return user
+
+    def find_by_email(self, email):
+        '''
+        Returns the id of the user with the given email address, or None if
+        there is no such user.
+        '''
+        email = email.lower()
+        with self._lock:
+            user_id = self._emails.get(email)
+        if user_id is not None:
+            return user_id
+
+        user_id = self.find_user_id(email)
+        if user_id is not None:
+            with self._lock:
+                self._emails[email] = user_id
+        return user_id
+
+    def invalidate(self, user_id):
+        '''
+        Forgets a user, so that the next lookup reads the database again.
+        '''
+        self.users.invalidate(user_id)
+        with self._lock:
+            for email in [email for email, uid in self._emails.items()
+                          if uid == user_id]:
+                del self._emails[email]
+
+    def stats(self):
+        '''
+        Returns the hit and miss counters of the cache.
+        '''
+        stats = self.users.stats()
+        stats['emails'] = len(self._emails)
+        return stats
+
+    # ----- keeping up to date -----
+    def load(self, documents):
+        '''
+        Replaces the cached users with the given documents (a dictionary of
+        user id to user information), forgetting the users that are gone.
+
+        >>> directory = UserDirectory(lambda user_id: None, lambda email: None)
+        >>> directory.load({'mku': {'email': 'mku@olin.edu'}})
+        >>> directory.load({'kaoki': {'email': 'kaoki@olin.edu'}})
+        >>> directory.find_by_email('mku@olin.edu'), directory.get('mku')
+        (None, None)
+        '''
+        users = {user_id: User.from_dict(user_id, document)
+                 for user_id, document in documents.items()}
+        for user_id in set(self.users.keys()) - set(users):
+            self.users.invalidate(user_id)
+        for user_id, user in users.items():
+            self.users.put(user_id, user)
+
+        # Rebuilds the email index at once, rather than scanning it for
+        # every user
+        emails = {user.email.lower(): user_id
+                  for user_id, user in users.items() if user.email}
+        with self._lock:
+            self._emails = emails
+
+    def _on_snapshot(self, changes):
+        '''
+        Applies the (kind, user id, document) changes delivered by a snapshot
+        listener.
+        '''
+        for kind, user_id, document in changes:
+            self.invalidate(user_id)
+            if kind != 'REMOVED':
+                self.put(user_id, User.from_dict(user_id, document))
+
+    def start(self, repository, poll=None, interval=POLL_INTERVAL):
+        '''
+        Caches every user in the user repository and keeps the directory in
+        sync with it.
+
+        Uses a snapshot listener if possible. The users are re-read every
+        interval seconds instead if poll is True, if poll is None and the
+        FIRESTORE_EMULATOR_HOST or USERS_POLL environment variable is set,
+        or if the repository cannot notify listeners.
+        '''
+        self.load(repository.get_all())
+        if poll is None:
+            poll = polling_requested('USERS_POLL')
+        self._sync.start(repository.on_snapshot, self._on_snapshot,
+                         lambda: self.load(repository.get_all()), poll,
+                         interval)
+
+    def stop(self):
+        '''
+        Stops listening for (or polling for) changes to the users.
+        '''
+        self._sync.stop()
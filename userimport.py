@@ -0,0 +1,238 @@
+'''
+This module contains the functions used to import users from a spreadsheet.
+
+The import works on whole columns of the spreadsheet instead of row by row:
+    - read_user_records - extracts the user information from the spreadsheet,
+      one column at a time
+    - reject_existing_users - leaves out the users that already exist, so
+      that an import never takes over an account
+    - create_auth_users - creates the users in Firebase Authentication with
+      auth.import_users, up to 1000 users per call
+    - write_user_documents - adds the users to the database with batched
+      writes, up to 500 documents per batch (see repositories)
+    - import_users - runs the steps above and returns a report with the
+      outcome for every row of the spreadsheet
+'''
+from contextlib import nullcontext
+from firebase_admin import auth
+from repositories import WRITE_BATCH_SIZE
+from timeutil import parse_times, clock_times, INVALID
+
+AUTH_BATCH_SIZE = 1000
+
+# The first row of the spreadsheet holds the column names, and pandas counts
+# rows from zero, so the first user is on row 2 of the spreadsheet
+FIRST_ROW = 2
+
+# Spreadsheet column for each field of a user's document
+COLUMNS = {
+    'uid': 'User ID',
+    'email': 'Email Address',
+    'name': 'Name',
+    'dinner_group': 'Dinner Group',
+    'group_letter': 'Group Letter',
+    'interview_location': 'Interview Location',
+    'interview_time': 'Individual Interview Time',
+    'group_interview_location': 'Group Interview Location',
+    'cw_number': "Candidates' Weekend Number",
+    'model_class': 'Model Class',
+    'model_class_location': 'Model Class Location',
+    'interviewers': 'Interviewers'
+}
+
+# Fields that are stored as strings, even if the spreadsheet holds numbers
+STRING_FIELDS = ('uid', 'email', 'cw_number', 'interview_time')
+
+def chunks(items, size):
+    '''
+    Splits a list into consecutive chunks of at most size items.
+
+    >>> list(chunks([1, 2, 3, 4, 5], 2))
+    [[1, 2], [3, 4], [5]]
+    '''
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def read_user_records(file_df):
+    '''
+    Extracts the user information from a spreadsheet (a pandas DataFrame).
+
+    Returns: a list of dictionaries (one per row), each with the row number
+    in the spreadsheet under 'row' and the user's fields
+    '''
+    file_df = file_df.fillna('')
+
+    # Converts each column to a list of plain Python values at once
+    columns = {}
+    for field, column in COLUMNS.items():
+        values = file_df[column].tolist() if column in file_df else \
+                 [''] * len(file_df)
+        if field in STRING_FIELDS:
+            values = [clean_string(value) for value in values]
+        columns[field] = values
+
+    # Stores interview times as 'HH:MM' (spreadsheets may hold 'H:MM' or
+    # 'HH:MM:SS'), keeping the text of values that are not times
+    minutes = parse_times(columns['interview_time'])
+    columns['interview_time'] = [
+        time if parsed != INVALID else text for parsed, time, text in
+        zip(minutes.tolist(), clock_times(minutes), columns['interview_time'])]
+
+    records = []
+    for i in range(len(file_df)):
+        record = {field: values[i] for field, values in columns.items()}
+        record['row'] = i + FIRST_ROW
+        record['email'] = record['email'].lower()
+        records.append(record)
+
+    return records
+
+def clean_string(value):
+    '''
+    Converts a spreadsheet value to a string, without the '.0' that
+    spreadsheets add to whole numbers.
+
+    >>> clean_string(2.0), clean_string(' abc '), clean_string('')
+    ('2', 'abc', '')
+    '''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def get_user_document(record):
+    '''
+    Returns the database document for an imported user.
+    '''
+    document = {field: record[field] for field in COLUMNS if field != 'uid'}
+    document['password'] = ""
+    return document
+
+def validate_records(records, report):
+    '''
+    Checks that every row has a user id and an email address, and that no
+    user id appears twice. Records the rows that fail in the report.
+
+    Returns: the records that passed
+    '''
+    valid = []
+    seen = set()
+    for record in records:
+        if record['uid'] == '' or record['email'] == '':
+            report.append(failure(record, 'Missing user ID or email address'))
+        elif record['uid'] in seen:
+            report.append(failure(record, 'Duplicate user ID'))
+        else:
+            seen.add(record['uid'])
+            valid.append(record)
+    return valid
+
+def reject_existing_users(user_repository, records, report):
+    '''
+    Looks up the user ids of the records in the database, in batches of up
+    to WRITE_BATCH_SIZE ids. Records the rows whose user already exists in
+    the report.
+
+    Returns: the records of new users
+    '''
+    new = []
+    for batch in chunks(records, WRITE_BATCH_SIZE):
+        existing = user_repository.get_many([record['uid'] for record in batch])
+        for record in batch:
+            if record['uid'] in existing:
+                report.append(failure(record, 'User already exists'))
+            else:
+                new.append(record)
+    return new
+
+def failure(record, reason):
+    '''
+    Returns the report entry for a row that could not be imported.
+    '''
+    return {'row': record['row'], 'uid': record['uid'],
+            'email': record['email'], 'success': False, 'error': reason}
+
+def success(record):
+    '''
+    Returns the report entry for a row that was imported.
+    '''
+    return {'row': record['row'], 'uid': record['uid'],
+            'email': record['email'], 'success': True, 'error': None}
+
+def create_auth_users(records, report, auth_client=auth):
+    '''
+    Creates the users in Firebase Authentication (or in the given stand-in
+    for it), in batches of up to AUTH_BATCH_SIZE users. Records the rows
+    that fail in the report.
+
+    Returns: the records whose users were created
+    '''
+    created = []
+    for batch in chunks(records, AUTH_BATCH_SIZE):
+        auth_users = [auth.ImportUserRecord(uid=record['uid'],
+                                            email=record['email'],
+                                            display_name=record['name'] or None)
+                      for record in batch]
+        try:
+            result = auth_client.import_users(auth_users)
+        except (ValueError, auth.AuthError) as error:
+            report.extend(failure(record, str(error)) for record in batch)
+            continue
+
+        # Errors refer to users by their index in the batch
+        errors = {error.index: error.reason for error in result.errors}
+        for i, record in enumerate(batch):
+            if i in errors:
+                report.append(failure(record, errors[i]))
+            else:
+                created.append(record)
+
+    return created
+
+def write_user_documents(user_repository, records, report):
+    '''
+    Adds the users' documents to the database, in batches of up to
+    WRITE_BATCH_SIZE documents. Records the outcome of every row in the
+    report.
+    '''
+    for batch_records in chunks(records, WRITE_BATCH_SIZE):
+        try:
+            user_repository.write_batch(
+                sets=[(record['uid'], get_user_document(record))
+                      for record in batch_records])
+        except Exception as error:  # The whole batch failed
+            report.extend(failure(record, str(error))
+                          for record in batch_records)
+        else:
+            report.extend(success(record) for record in batch_records)
+
+def import_users(user_repository, file_df, job=None, auth_client=auth):
+    '''
+    Imports the users in a spreadsheet: creates them in Firebase
+    Authentication and adds their information to the database.
+    If the import runs as a background job, its steps are timed and its
+    progress is recorded on the job.
+
+    Returns: the report, a list with one dictionary per row of the
+    spreadsheet (sorted by row), saying whether the row was imported and,
+    if not, why
+    '''
+    step = job.step if job is not None else lambda name: nullcontext()
+    report = []
+
+    with step('read spreadsheet'):
+        records = validate_records(read_user_records(file_df), report)
+    with step('look up existing users'):
+        records = reject_existing_users(user_repository, records, report)
+    if job is not None:
+        job.progress(0.1, 'Creating {} users'.format(len(records)))
+
+    with step('create authentication users'):
+        created = create_auth_users(records, report, auth_client)
+    if job is not None:
+        job.progress(0.6, 'Adding {} users to the database'.format(
+            len(created)))
+
+    with step('write user documents'):
+        write_user_documents(user_repository, created, report)
+
+    return sorted(report, key=lambda entry: entry['row'])
@@ -1,15 +1,36 @@
 '''
 This module contains the User class.
 '''
+from records import Record
+from timeutil import parse_time, clock_time
 
-class User():
+class User(Record):
     '''
-    Defines a user of the app.
+    Defines a user of the app. Users are immutable.
+
+    >>> user = User.from_dict('kaoki', {'email': 'kaoki@olin.edu',
+    ...                                 'interview_time': '09:30',
+    ...                                 'cw_number': '1', 'password': ''})
+    >>> user.interview_min, user.interview_time, user.password
+    (570, '09:30', '')
+    >>> User.from_dict('mku', {'interview_time': 'TBA'}).to_dict()[
+    ...     'interview_time']
+    'TBA'
+    >>> 'password' in User('mku', 'mku@olin.edu', 'A', '10:00', '', '', '',
+    ...                    '1', 'Megan', '', '', '').to_dict()
+    False
     '''
+    __slots__ = ('username', 'email', 'group_letter', 'interview_min',
+                 'interview_location', 'dinner_group',
+                 'group_interview_location', 'cw_number', 'name',
+                 'model_class', 'model_class_location', 'interviewers',
+                 'password', 'unparsed')
+
     def __init__(self, username, email, group_letter,
                  interview_time, interview_location,
                  dinner_group, group_interview_location, cw_number,
-                 name, model_class, model_class_location, interviewers):
+                 name, model_class, model_class_location, interviewers,
+                 password=None):
         '''
         Creates a user.
 
@@ -17,7 +38,9 @@ class User():
         username - the user's name/user id
         email - user's email address
         group_letter - the letter for the user's interview group
-        interview_time - the user's individual interview time
+        interview_time - the user's individual interview time, as 'HH:MM'
+                         or as minutes after midnight (kept as minutes in
+                         interview_min)
         interview_location - the location of the user's individual interview
         dinner_group - the number of the user's dinner group
         group_interview_location - the location of the user's group interview
@@ -29,28 +52,67 @@ class User():
                                as a string)
         interviewers - the names of the interviewers for this user, represented
                        as a string
+        password - the hash of the user's password ('' if they have not
+                   registered yet), or None if it is not known (so that it
+                   is left out of to_dict)
+        '''
+        unparsed = {}
+        self._set('username', username)
+        self._set('email', email)
+        self._set('group_letter', group_letter)
+        self._parse('interview_min', parse_time, interview_time, unparsed)
+        self._set('interview_location', interview_location)
+        self._set('dinner_group', dinner_group)
+        self._set('group_interview_location', group_interview_location)
+        self._set('cw_number', cw_number)
+        self._set('name', name)
+        self._set('model_class', model_class)
+        self._set('model_class_location', model_class_location)
+        self._set('interviewers', interviewers)
+        self._set('password', password)
+        self._set_unparsed(unparsed)
+
+    @property
+    def interview_time(self):
+        '''
+        The interview time, as 'HH:MM'.
+        '''
+        return clock_time(self.interview_min)
+
+    @classmethod
+    def from_dict(cls, username, user_dict):
+        '''
+        Creates a user from their document in the database.
+        '''
+        return cls(username, user_dict.get('email'),
+                   user_dict.get('group_letter'),
+                   user_dict.get('interview_time'),
+                   user_dict.get('interview_location'),
+                   user_dict.get('dinner_group'),
+                   user_dict.get('group_interview_location'),
+                   user_dict.get('cw_number'), user_dict.get('name'),
+                   user_dict.get('model_class'),
+                   user_dict.get('model_class_location'),
+                   user_dict.get('interviewers'),
+                   user_dict.get('password', ''))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        '''
+        Creates a user from a Firestore document snapshot.
         '''
-        self.username = username
-        self.email = email
-        self.group_letter = group_letter
-        self.interview_time = interview_time
-        self.interview_location = interview_location
-        self.dinner_group = dinner_group
-        self.group_interview_location = group_interview_location
-        self.cw_number = cw_number
-        self.name = name
-        self.model_class = model_class
-        self.model_class_location = model_class_location
-        self.interviewers = interviewers
+        return cls.from_dict(snapshot.id, snapshot.to_dict())
 
     def to_dict(self):
         '''
-        Stores user information in a diciontary.
+        Stores user information in a diciontary. An interview time that
+        could not be parsed is stored as it was.
         '''
         user_dict = {
             'email': self.email,
             'group_letter': self.group_letter,
-            'interview_time': self.interview_time,
+            'interview_time': self._stored('interview_min',
+                                           self.interview_time),
             'interview_location': self.interview_location,
             'dinner_group': self.dinner_group,
             'group_interview_location': self.group_interview_location,
@@ -60,5 +122,7 @@ class User():
             'model_class_location': self.model_class_location,
             'interviewers': self.interviewers
         }
+        if self.password is not None:
+            user_dict['password'] = self.password
 
         return user_dict
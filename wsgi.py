@@ -0,0 +1,17 @@
+'''
+This module is the entry point for WSGI servers, like gunicorn:
+
+    gunicorn --config gunicorn.conf.py wsgi:application
+
+Each server process imports this module after it has been forked, so every
+process connects to Firebase with its own clients and warms its own caches
+before it accepts requests.
+'''
+import logging
+import os
+from Web import create_app
+
+# Logs one line for each request, with its backend calls
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+application = create_app()